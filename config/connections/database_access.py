@@ -14,4 +14,7 @@ DB_CONFIG = {
     'raise_on_warnings': True
 }
 
-TABLE_SCHEMA = 'project_seldon_dev'
\ No newline at end of file
+TABLE_SCHEMA = 'project_seldon_dev'
+
+# Layout of new price tables, 'wide' or 'compact' (see utils/price_layout.py)
+PRICE_LAYOUT = os.getenv('DB_PRICE_LAYOUT', 'wide')
@@ -1,79 +1,182 @@
-"""Global logging configuration for Project Seldon."""
+"""Global logging configuration for Project Seldon.
 
+Loggers of one area (e.g. 'database') share a single QueueHandler. Records
+are put on the area's queue unformatted, and a QueueListener thread formats
+them and writes them to the area's log file and the console, so a log call
+costs the caller little more than building the record. Messages should use
+lazy %-style arguments, which are only formatted if a record is emitted, and
+arguments must not be mutated after they are logged.
+
+Set SELDON_LOG_FORMAT=json to write one JSON object per line to the log files.
+"""
+
+import atexit
+import json
 import logging
 import os
-from datetime import datetime
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import util as multiprocessing_util
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
 # Get project root directory
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 LOG_DIR = PROJECT_ROOT / "logs"
+LOG_FORMAT = os.getenv('SELDON_LOG_FORMAT', 'text')
+
+TEXT_FORMAT = (
+    'Datetime:%(asctime)s - Level:%(levelname)s - '
+    'Module:%(module)s - Function:%(funcName)s - '
+    'Message:%(message)s'
+)
+CONSOLE_FORMAT = '%(levelname)s [%(name)s]: %(message)s'
+
+# Attributes every LogRecord has, anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object, including fields passed with extra=."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'function': record.funcName,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The default prepare() formats every record in the calling thread; the
+    listener runs in the same process, so the record can be queued as is.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _AreaPipeline:
+    """Queue, shared handler and listener of one project area."""
+
+    def __init__(self, area: str, log_dir: Path):
+        # Simplified log file naming: area_YYYY_DD.log
+        log_file = log_dir / area / f"{area}_{datetime.now().strftime('%Y_%d')}.log"
+        log_file.parent.mkdir(exist_ok=True)
+
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setFormatter(
+            JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+        )
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        self.handlers = (file_handler, console_handler)
+
+        # Unbounded, so a burst of records never blocks the caller
+        self.handler = _DeferredQueueHandler(queue.SimpleQueue())
+        self.listener: Optional[QueueListener] = None
+        self.start()
+
+    def start(self) -> None:
+        self.listener = QueueListener(self.handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Write every queued record and stop the listener thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart_in_child(self) -> None:
+        """Give a forked child its own queue, the parent's listener thread is not copied."""
+        self.handler.queue = queue.SimpleQueue()
+        self.listener = None
+        self.start()
+
 
 class LoggerFactory:
     """Factory class to create and manage loggers for different project areas."""
-    
+
     def __init__(self):
         self.log_dir = LOG_DIR
         self.log_dir.mkdir(exist_ok=True)
-        
+
         # Create subdirectories for different areas
         self.log_dir.joinpath('database').mkdir(exist_ok=True)
         self.log_dir.joinpath('global').mkdir(exist_ok=True)
-        
+
         self._loggers = {}
+        self._areas: Dict[str, _AreaPipeline] = {}
+        self._lock = threading.Lock()
+
+        atexit.register(self.shutdown)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+            # multiprocessing children leave through os._exit, which skips atexit
+            multiprocessing_util.register_after_fork(self, LoggerFactory._flush_at_child_exit)
+
+    def _area(self, area: str) -> _AreaPipeline:
+        with self._lock:
+            if area not in self._areas:
+                self._areas[area] = _AreaPipeline(area, self.log_dir)
+            return self._areas[area]
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        for pipeline in self._areas.values():
+            pipeline.restart_in_child()
+
+    def _flush_at_child_exit(self) -> None:
+        multiprocessing_util.Finalize(self, LoggerFactory.shutdown, args=(self,), exitpriority=0)
+
+    def shutdown(self) -> None:
+        """Flush and stop every area listener, runs at interpreter exit."""
+        for pipeline in list(self._areas.values()):
+            pipeline.stop()
 
     def get_logger(
-        self, 
-        area: str, 
+        self,
+        area: str,
         level: int = logging.INFO,
         module_name: Optional[str] = None
     ) -> logging.Logger:
         """
         Get or create a logger for a specific project area.
-        
+
         Args:
             area: Project area (e.g., 'database', 'analysis', 'api')
             level: Logging level
             module_name: Optional module name for logger identification
         """
         logger_name = f"{area}_{module_name}" if module_name else area
-        
+
         if logger_name not in self._loggers:
             logger = logging.getLogger(logger_name)
             logger.setLevel(level)
-            
+
             if not logger.handlers:
-                # Simplified log file naming: area_YYYY_DD.log
-                log_file = self.log_dir / area / f"{area}_{datetime.now().strftime('%Y_%d')}.log"
-                
-                log_file.parent.mkdir(exist_ok=True)
-                
-                # File handler
-                file_handler = logging.FileHandler(log_file)
-                file_handler.setLevel(level)
-                file_formatter = logging.Formatter(
-                    'Datetime:%(asctime)s - Level:%(levelname)s - '
-                    'Module:%(module)s - Function:%(funcName)s - '
-                    'Message:%(message)s'
-                )
-                file_handler.setFormatter(file_formatter)
-                
-                # Console handler
-                console_handler = logging.StreamHandler()
-                console_handler.setLevel(level)
-                console_formatter = logging.Formatter(
-                    '%(levelname)s [%(name)s]: %(message)s'
-                )
-                console_handler.setFormatter(console_formatter)
-                
-                # Add handlers
-                logger.addHandler(file_handler)
-                logger.addHandler(console_handler)
-                
-                self._loggers[logger_name] = logger
-        
+                logger.addHandler(self._area(area).handler)
+
+            self._loggers[logger_name] = logger
+
         return self._loggers[logger_name]
 
 # Create global logger factory instance
-logger_factory = LoggerFactory()
\ No newline at end of file
+logger_factory = LoggerFactory()
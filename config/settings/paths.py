@@ -11,7 +11,7 @@ PATHS = {
     #"DATABASE_CONFIG": PROJECT_ROOT / "lib/data_centre/database/config/database_config.py",
     #"DATABASE_MANAGER": PROJECT_ROOT / "lib/data_centre/database/database_manager.py",
     #"LOGS_DIR": PROJECT_ROOT / "logs",
-    #"DATA_DIR": PROJECT_ROOT / "data",
+    "DATA_DIR": PROJECT_ROOT / "data",
     #"OUTPUT_DIR": PROJECT_ROOT / "output",
 }
 
@@ -0,0 +1,49 @@
+"""Ticker universe configuration for Project Seldon.
+
+Every active ticker is given a tier by the first rule in TIER_RULES it
+matches, tickers no rule matches get DEFAULT_TIER. Tier 1 is fetched and
+written first in every run and lower tiers follow in order. Tiers above
+MAX_TIER are neither fetched nor stored, and a tier is deferred to the next
+run once less than its BUDGET_RESERVE share of the daily EODHD API limit is
+left.
+
+Rule keys, a missing key matches every ticker:
+    types              Ticker Type as listed by EODHD
+    exclude_types      Types the rule does not match
+    exchanges          Local exchange codes
+    exclude_exchanges  Exchange codes the rule does not match
+    min_volume         Average daily volume over LIQUIDITY_WINDOW_DAYS
+
+Tickers without stored prices in the window, e.g. new listings or a fresh
+database, are matched on type and exchange alone.
+"""
+
+import os
+
+# Exchanges listing mostly untraded OTC names and money market funds
+OTC_EXCHANGES = ['PINK', 'NMFQS']
+
+TIER_RULES = [
+    {'tier': 1, 'types': ['Common Stock', 'ETF'],
+     'exclude_exchanges': OTC_EXCHANGES, 'min_volume': 100000},
+    {'tier': 2, 'types': ['Common Stock', 'ETF', 'Preferred Stock'],
+     'exclude_exchanges': OTC_EXCHANGES, 'min_volume': 10000},
+    {'tier': 3, 'types': ['Common Stock', 'ETF', 'Preferred Stock', 'FUND', 'Mutual Fund'],
+     'min_volume': 1000},
+    {'tier': 4, 'exclude_types': ['Warrant', 'Unit', 'Right', 'Notes', 'BOND']},
+]
+DEFAULT_TIER = 5
+
+# Highest tier that is fetched and stored at all
+MAX_TIER = int(os.getenv('SELDON_UNIVERSE_MAX_TIER', '4'))
+
+LIQUIDITY_WINDOW_DAYS = 90
+
+# Share of the daily API call limit that must be left for a tier to be fetched
+BUDGET_RESERVE = {
+    1: 0.0,
+    2: 0.1,
+    3: 0.25,
+    4: 0.5,
+    5: 0.75,
+}
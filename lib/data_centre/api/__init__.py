@@ -0,0 +1,7 @@
+"""
+HTTP API package for Project Seldon's data center.
+
+This package serves the stored market data over HTTP:
+- Exchanges and tickers from the reference tables
+- Price ranges per exchange or ticker, streamed as NDJSON or CSV
+"""
@@ -0,0 +1,125 @@
+"""Load test for the read-only HTTP API
+
+Runs a number of concurrent simulated research clients against a running
+API for a fixed duration. Each client loops over a mix of reference, paged
+and streamed price requests and revalidates with If-None-Match like a
+caching client would. Reports throughput, latency percentiles, status codes
+and the share of 304 responses.
+
+Example:
+    python -m lib.data_centre.api.load_test --url http://localhost:8080 \
+        --clients 300 --duration 60 --exchange LSE
+"""
+
+# Standard library imports
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+# Third-party imports
+import aiohttp
+import numpy as np
+
+
+def _request_mix(exchange: str, tickers: List[str]) -> List[str]:
+    """Paths a research client cycles through."""
+    today = date.today()
+    month_ago = (today - timedelta(days=31)).isoformat()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    paths = [
+        '/exchanges',
+        f'/tickers?exchange={exchange}&limit=1000',
+        f'/prices/{exchange}?from={month_ago}&limit=5000',
+        f'/prices/{exchange}?from={today.isoformat()}',
+    ]
+    for ticker in tickers[:20]:
+        paths.append(f'/prices/{exchange}?ticker_id={quote(ticker)}&from={year_ago}')
+    return paths
+
+
+async def _client(session: aiohttp.ClientSession, base_url: str, paths: List[str],
+                  deadline: float, latencies: List[float], statuses: Counter,
+                  stream_bytes: List[int]) -> None:
+    etags: Dict[str, str] = {}
+    while time.monotonic() < deadline:
+        path = random.choice(paths)
+        headers = {'If-None-Match': etags[path]} if path in etags else {}
+        started = time.perf_counter()
+        try:
+            async with session.get(base_url + path, headers=headers) as response:
+                size = 0
+                async for chunk in response.content.iter_chunked(65536):
+                    size += len(chunk)
+                statuses[response.status] += 1
+                if 'ETag' in response.headers:
+                    etags[path] = response.headers['ETag']
+                stream_bytes.append(size)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            statuses[type(e).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def _sample_tickers(session: aiohttp.ClientSession, base_url: str,
+                          exchange: str) -> List[str]:
+    async with session.get(f'{base_url}/tickers?exchange={exchange}&limit=200') as response:
+        response.raise_for_status()
+        return [json.loads(line)['Ticker_ID'] async for line in response.content if line.strip()]
+
+
+async def run_load_test(base_url: str, clients: int, duration: float, exchange: str,
+                        timeout: Optional[float] = 60) -> Dict[str, float]:
+    """Run the load test and return the summary statistics."""
+    connector = aiohttp.TCPConnector(limit=clients)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        tickers = await _sample_tickers(session, base_url, exchange)
+        paths = _request_mix(exchange, tickers)
+
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        stream_bytes: List[int] = []
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(*[
+            _client(session, base_url, paths, deadline, latencies, statuses, stream_bytes)
+            for _ in range(clients)
+        ])
+        elapsed = time.monotonic() - started
+
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    total = sum(statuses.values())
+    summary = {
+        'requests': total,
+        'requests_per_second': total / elapsed,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+        'not_modified_share': statuses.get(304, 0) / total if total else 0.0,
+        'megabytes': sum(stream_bytes) / 1024 ** 2,
+    }
+    print(f"{clients} clients for {elapsed:.1f}s against {base_url}")
+    for name, value in summary.items():
+        print(f"  {name:<22}{value:,.2f}")
+    print(f"  statuses              {dict(statuses)}")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Load test the Project Seldon API.')
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--exchange', required=True)
+    args = parser.parse_args()
+    asyncio.run(run_load_test(args.url.rstrip('/'), args.clients, args.duration, args.exchange))
+
+if __name__ == "__main__":
+    main()
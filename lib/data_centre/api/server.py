@@ -0,0 +1,413 @@
+"""Read-only HTTP API for Project Seldon
+
+Serves exchanges, tickers and price ranges over HTTP so research clients no
+longer need database credentials. The service runs on asyncio: every request
+borrows a connection from a shared aiomysql pool, large results are read
+with an unbuffered server side cursor and streamed to the client as chunked
+NDJSON or CSV, and list endpoints page with opaque keyset cursors.
+
+Each response carries an ETag built from the ingest watermarks of the data
+it reads (see query_cache.invalidate), so clients revalidating with
+If-None-Match get a 304 without touching the price tables until an ingest
+job writes to that exchange again.
+
+Endpoints:
+    GET /exchanges
+    GET /tickers?exchange=&type=&limit=&cursor=
+    GET /prices/{exchange}?from=&to=&ticker_id=&limit=&cursor=
+    GET /health
+
+Every list endpoint accepts format=ndjson (default) or format=csv.
+"""
+
+# Standard library imports
+import argparse
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+# Third-party imports
+import aiomysql
+from aiohttp import web
+
+# Local application imports
+from lib.data_centre.database.utils import query_cache, price_layout
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('api', module_name=__name__)
+
+# Constants
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 8080
+POOL_MIN_SIZE = 4
+POOL_MAX_SIZE = 32
+FETCH_SIZE = 2000
+MAX_PAGE_SIZE = 50000
+WATERMARK_TTL = 1.0
+
+EXCHANGE_COLUMNS = query_cache.EXCHANGE_COLUMNS
+TICKER_COLUMNS = [
+    'Ticker_ID', 'Ticker', 'Name', 'Country', 'Exchange', 'EoDHD_Exchange',
+    'Currency', 'Type', 'Isin'
+]
+PRICE_COLUMNS = query_cache.PRICE_COLUMNS
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+YEAR_TABLES_QUERY = price_layout.YEAR_TABLES_QUERY
+
+
+class BadRequest(web.HTTPBadRequest):
+    """400 response with a JSON error body."""
+
+    def __init__(self, message: str):
+        super().__init__(text=json.dumps({'error': message}), content_type='application/json')
+
+
+# Encoding
+
+def _plain(value: Any) -> Any:
+    """JSON and CSV friendly form of a database value."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _encode(rows: Sequence[tuple], columns: List[str], fmt: str) -> bytes:
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows([[_plain(value) for value in row] for row in rows])
+        return buffer.getvalue().encode()
+    return ''.join(
+        json.dumps(dict(zip(columns, map(_plain, row)))) + '\n' for row in rows
+    ).encode()
+
+
+def _encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_plain(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise BadRequest('Invalid cursor')
+    # Every cursor field is a Ticker_ID or an ISO date
+    if (not isinstance(values, list) or len(values) != size
+            or not all(isinstance(value, str) for value in values)):
+        raise BadRequest('Invalid cursor')
+    return values
+
+
+# Request parameters
+
+def _format(request: web.Request) -> str:
+    fmt = request.query.get('format', 'ndjson')
+    if fmt not in CONTENT_TYPES:
+        raise BadRequest(f"Unsupported format {fmt}, use one of {sorted(CONTENT_TYPES)}")
+    return fmt
+
+
+def _limit(request: web.Request) -> Optional[int]:
+    if 'limit' not in request.query:
+        return None
+    try:
+        limit = int(request.query['limit'])
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise BadRequest(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def _date(request: web.Request, name: str) -> Optional[date]:
+    value = request.query.get(name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a YYYY-MM-DD date")
+
+
+# Watermarks and ETags
+
+class Watermarks:
+    """Ingest watermarks, re-read from the database at most every WATERMARK_TTL seconds."""
+
+    def __init__(self, pool: aiomysql.Pool):
+        self.pool = pool
+        self._values: Dict[Tuple[str, str], int] = {}
+        self._loaded = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, scope: str, exchange: Optional[str]) -> str:
+        if time.monotonic() - self._loaded > WATERMARK_TTL:
+            async with self._lock:
+                if time.monotonic() - self._loaded > WATERMARK_TTL:
+                    await self._refresh()
+        exchanges = [''] + ([exchange] if exchange else sorted(
+            name for scope_name, name in self._values if scope_name == scope and name
+        ))
+        return '.'.join(str(self._values.get((scope, name), 0)) for name in exchanges)
+
+    async def _refresh(self) -> None:
+        try:
+            async with self.pool.acquire() as conn, conn.cursor() as cursor:
+                await cursor.execute("SELECT Scope, Exchange, Watermark FROM ingest_watermarks;")
+                self._values = {(scope, exchange): int(mark)
+                                for scope, exchange, mark in await cursor.fetchall()}
+        except aiomysql.Error as e:
+            # Table missing before the first ingest, treat everything as version 0
+            logger.debug("Unable to read ingest watermarks: %s", e)
+            self._values = {}
+        self._loaded = time.monotonic()
+
+
+async def _etag(request: web.Request, scope: str, exchange: Optional[str]) -> str:
+    mark = await request.app['watermarks'].get(scope, exchange)
+    digest = hashlib.sha1(f"{request.path_qs}|{mark}".encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _not_modified(request: web.Request, etag: str) -> bool:
+    candidates = request.headers.get('If-None-Match', '')
+    return etag in [tag.strip() for tag in candidates.split(',')] or candidates.strip() == '*'
+
+
+# Streaming
+
+async def _stream(request: web.Request, etag: str, fmt: str, columns: List[str],
+                  batches: AsyncIterator[Sequence[tuple]],
+                  next_cursor: Optional[str] = None) -> web.StreamResponse:
+    """Write batches of rows to a chunked response as they are produced."""
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = f'<{request.url.update_query(cursor=next_cursor)}>; rel="next"'
+    response = web.StreamResponse(headers=headers)
+    response.content_type = CONTENT_TYPES[fmt]
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    if fmt == 'csv':
+        await response.write(_encode([columns], columns, 'csv'))
+    try:
+        async for rows in batches:
+            await response.write(_encode(rows, columns, fmt))
+    finally:
+        # Returns the pooled connection even if the client went away
+        await batches.aclose()
+    await response.write_eof()
+    return response
+
+
+async def _query_batches(pool: aiomysql.Pool, queries: Sequence[Tuple[str, tuple]]
+                         ) -> AsyncIterator[Sequence[tuple]]:
+    """Run queries in order on one pooled connection, yielding rows in batches."""
+    async with pool.acquire() as conn:
+        for query, params in queries:
+            async with conn.cursor(aiomysql.SSCursor) as cursor:
+                await cursor.execute(query, params)
+                while True:
+                    rows = await cursor.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    yield rows
+
+
+async def _fetch(pool: aiomysql.Pool, query: str, params: tuple) -> List[tuple]:
+    async with pool.acquire() as conn, conn.cursor() as cursor:
+        await cursor.execute(query, params)
+        return list(await cursor.fetchall())
+
+
+async def _single(rows: Sequence[tuple]) -> AsyncIterator[Sequence[tuple]]:
+    yield rows
+
+
+# Handlers
+
+async def health(request: web.Request) -> web.Response:
+    pool = request.app['pool']
+    return web.json_response({'status': 'ok', 'pool_size': pool.size, 'pool_free': pool.freesize})
+
+
+async def exchanges(request: web.Request) -> web.StreamResponse:
+    fmt = _format(request)
+    etag = await _etag(request, query_cache.SCOPE_EXCHANGES, None)
+    if _not_modified(request, etag):
+        return web.Response(status=304, headers={'ETag': etag})
+
+    query = (f"SELECT {', '.join(EXCHANGE_COLUMNS)} FROM global_exchanges "
+             "WHERE Is_Active = 1 ORDER BY Exchange;")
+    rows = await _fetch(request.app['pool'], query, ())
+    return await _stream(request, etag, fmt, EXCHANGE_COLUMNS, _single(rows))
+
+
+async def tickers(request: web.Request) -> web.StreamResponse:
+    fmt, limit = _format(request), _limit(request)
+    exchange = request.query.get('exchange')
+    etag = await _etag(request, query_cache.SCOPE_TICKERS, exchange)
+    if _not_modified(request, etag):
+        return web.Response(status=304, headers={'ETag': etag})
+
+    conditions, params = ['Is_Active = 1'], []
+    if exchange:
+        conditions.append('Exchange = %s')
+        params.append(exchange)
+    if 'type' in request.query:
+        conditions.append('Type = %s')
+        params.append(request.query['type'])
+    after = _decode_cursor(request.query.get('cursor'), 1)
+    if after:
+        conditions.append('Ticker_ID > %s')
+        params.append(after[0])
+    query = (f"SELECT {', '.join(TICKER_COLUMNS)} FROM global_tickers "
+             f"WHERE {' AND '.join(conditions)} ORDER BY Ticker_ID")
+
+    pool = request.app['pool']
+    if limit is None:
+        return await _stream(request, etag, fmt, TICKER_COLUMNS,
+                             _query_batches(pool, [(query + ';', tuple(params))]))
+
+    # One extra row tells whether another page follows
+    rows = await _fetch(pool, query + ' LIMIT %s;', (*params, limit + 1))
+    next_cursor = _encode_cursor([rows[limit - 1][0]]) if len(rows) > limit else None
+    return await _stream(request, etag, fmt, TICKER_COLUMNS, _single(rows[:limit]), next_cursor)
+
+
+async def _year_tables(request: web.Request, exchange: str) -> List[Tuple[str, bool]]:
+    """(table, compact) tuples of an exchange, see price_layout.year_tables."""
+    pattern = f'^prices_{exchange}_[0-9]{{4}}$'
+    rows = await _fetch(request.app['pool'], YEAR_TABLES_QUERY, (pattern,))
+    return [(table, bool(compact)) for table, compact in rows]
+
+
+async def prices(request: web.Request) -> web.StreamResponse:
+    """Prices of an exchange ordered by (Date, Ticker_ID), one year table at a time."""
+    exchange = request.match_info['exchange']
+    if not exchange.replace('_', '').isalnum():
+        raise BadRequest('Invalid exchange')
+    fmt, limit = _format(request), _limit(request)
+    date_from, date_to = _date(request, 'from'), _date(request, 'to')
+    ticker_ids = request.query.getall('ticker_id', [])
+
+    etag = await _etag(request, query_cache.SCOPE_PRICES, exchange)
+    if _not_modified(request, etag):
+        return web.Response(status=304, headers={'ETag': etag})
+
+    after = _decode_cursor(request.query.get('cursor'), 2)
+    if after:
+        try:
+            after[0] = date.fromisoformat(after[0])
+        except ValueError:
+            raise BadRequest('Invalid cursor')
+
+    queries = []
+    for table, compact in await _year_tables(request, exchange):
+        year = int(table.rsplit('_', 1)[1])
+        if date_from and year < date_from.year or date_to and year > date_to.year:
+            continue
+        if after and year < after[0].year:
+            continue
+        conditions, params = [], []
+        if date_from:
+            conditions.append('Date >= %s')
+            params.append(date_from)
+        if date_to:
+            conditions.append('Date <= %s')
+            params.append(date_to)
+        if ticker_ids:
+            conditions.append(f"Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))})")
+            params.extend(ticker_ids)
+        if after and year == after[0].year:
+            conditions.append('(Date, Ticker_ID) > (%s, %s)')
+            params.extend(after)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        queries.append((
+            f"SELECT {', '.join(PRICE_COLUMNS)} FROM {price_layout.price_source(table, compact)}"
+            f"{where} ORDER BY Date, Ticker_ID",
+            tuple(params)
+        ))
+
+    pool = request.app['pool']
+    if limit is None:
+        return await _stream(request, etag, fmt, PRICE_COLUMNS,
+                             _query_batches(pool, [(query + ';', params) for query, params in queries]))
+
+    rows: List[tuple] = []
+    for query, params in queries:
+        rows.extend(await _fetch(pool, query + ' LIMIT %s;', (*params, limit + 1 - len(rows))))
+        if len(rows) > limit:
+            break
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor([last[1], last[0]])
+    return await _stream(request, etag, fmt, PRICE_COLUMNS, _single(rows[:limit]), next_cursor)
+
+
+# Application
+
+async def _open_pool(app: web.Application) -> None:
+    app['pool'] = await aiomysql.create_pool(
+        host=DB_CONFIG['host'],
+        port=int(DB_CONFIG['port'] or 3306),
+        user=DB_CONFIG['user'],
+        password=DB_CONFIG['password'],
+        db=DB_CONFIG['database'],
+        minsize=app['pool_min'],
+        maxsize=app['pool_max'],
+        autocommit=True,
+        init_command='SET SESSION TRANSACTION READ ONLY',
+    )
+    app['watermarks'] = Watermarks(app['pool'])
+    logger.info(f"Opened database pool with {app['pool_min']} to {app['pool_max']} connections")
+
+
+async def _close_pool(app: web.Application) -> None:
+    app['pool'].close()
+    await app['pool'].wait_closed()
+
+
+def create_app(pool_min: int = POOL_MIN_SIZE, pool_max: int = POOL_MAX_SIZE) -> web.Application:
+    """Build the API application, the pool opens on startup."""
+    app = web.Application()
+    app['pool_min'], app['pool_max'] = pool_min, pool_max
+    app.on_startup.append(_open_pool)
+    app.on_cleanup.append(_close_pool)
+    app.router.add_get('/health', health)
+    app.router.add_get('/exchanges', exchanges)
+    app.router.add_get('/tickers', tickers)
+    app.router.add_get('/prices/{exchange}', prices)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve the Project Seldon read-only API.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--pool-min', type=int, default=POOL_MIN_SIZE)
+    parser.add_argument('--pool-max', type=int, default=POOL_MAX_SIZE)
+    args = parser.parse_args()
+    web.run_app(create_app(args.pool_min, args.pool_max), host=args.host, port=args.port,
+                access_log=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Data modelling package for Project Seldon's data center.
+
+This package derives analytics from the stored market data:
+- Daily log returns
+- Rolling mean, volatility and drawdown
+
+Functions are imported on first access, see database/scripts/__init__.py.
+"""
+
+# Standard library imports
+import importlib
+
+# Function name -> module defining it
+_EXPORTS = {
+    'analytics_update': 'returns_engine',
+    'update_exchange_analytics': 'returns_engine',
+    'rolling_stats': 'returns_engine',
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+__all__ = [
+    'analytics_update',
+    'update_exchange_analytics',
+    'rolling_stats',
+]
@@ -0,0 +1,251 @@
+"""Returns and Rolling Statistics Engine
+
+This module derives daily log returns and rolling mean, volatility and
+drawdown from the Adjusted_Close price matrix of each exchange and stores
+them in two tables per exchange:
+
+    analytics_{exchange}_returns    Ticker_ID, Date, Log_Return
+    analytics_{exchange}_rolling    Ticker_ID, Window_Days, Date, Mean, Volatility, Drawdown
+
+Every statistic is computed on the whole dates x tickers matrix at once. A
+nightly run only reads the last max(window) dates before the newest stored
+date as context and writes the new dates. Window sums are accumulated one
+lag at a time in a fixed order, so each value depends only on the values in
+its own window and an incremental run reproduces a full recompute bit for bit.
+
+Definitions, over the last `window` trading dates of the exchange:
+    Mean        Average daily log return
+    Volatility  Sample standard deviation of daily log returns, annualised
+    Drawdown    Adjusted_Close / highest Adjusted_Close in the window - 1
+A statistic is NaN unless every return in its window is present.
+"""
+
+# Standard library imports
+from typing import Any, Dict, List, Optional, Sequence
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_matrix, profiling, reference_data
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('analysis', module_name=__name__)
+
+# Constants
+DEFAULT_WINDOWS = (21, 63, 252)
+TRADING_DAYS = 252
+PRICE_FIELD = 'Adjusted_Close'
+
+# Tickers processed per block, bounds memory on a full recompute
+TICKER_BLOCK = 2000
+
+CREATE_RETURNS_QUERY = """
+    CREATE TABLE IF NOT EXISTS analytics_{exchange}_returns (
+        Ticker_ID VARCHAR(255),
+        Date DATE,
+        Log_Return DOUBLE,
+        PRIMARY KEY (Ticker_ID, Date),
+        INDEX idx_analytics_{exchange}_returns_date (Date)
+    );
+"""
+
+CREATE_ROLLING_QUERY = """
+    CREATE TABLE IF NOT EXISTS analytics_{exchange}_rolling (
+        Ticker_ID VARCHAR(255),
+        Window_Days SMALLINT,
+        Date DATE,
+        Mean DOUBLE,
+        Volatility DOUBLE,
+        Drawdown DOUBLE,
+        PRIMARY KEY (Ticker_ID, Window_Days, Date),
+        INDEX idx_analytics_{exchange}_rolling_date (Window_Days, Date)
+    );
+"""
+
+UPSERT_RETURNS_QUERY = """
+    INSERT INTO analytics_{exchange}_returns (Ticker_ID, Date, Log_Return)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE Log_Return = VALUES(Log_Return);
+"""
+
+UPSERT_ROLLING_QUERY = """
+    INSERT INTO analytics_{exchange}_rolling (
+        Ticker_ID, Window_Days, Date, Mean, Volatility, Drawdown
+    ) VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        Mean = VALUES(Mean),
+        Volatility = VALUES(Volatility),
+        Drawdown = VALUES(Drawdown);
+"""
+
+
+def log_returns(closes: np.ndarray) -> np.ndarray:
+    """Daily log returns of a dates x tickers close matrix, NaN in the first row."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(np.where(closes > 0, closes, np.nan))
+    returns = np.full(closes.shape, np.nan)
+    returns[1:] = logs[1:] - logs[:-1]
+    return returns
+
+
+def _window_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of each trailing window, accumulated lag by lag in a fixed order."""
+    total = values[window - 1:].copy()
+    for lag in range(1, window):
+        total += values[window - 1 - lag:len(values) - lag]
+    return total
+
+
+def _window_max(values: np.ndarray, window: int) -> np.ndarray:
+    """Highest non-NaN value of each trailing window."""
+    highest = values[window - 1:].copy()
+    for lag in range(1, window):
+        highest = np.fmax(highest, values[window - 1 - lag:len(values) - lag])
+    return highest
+
+
+def rolling_stats(closes: np.ndarray, window: int) -> Dict[str, np.ndarray]:
+    """Rolling mean, volatility and drawdown of a dates x tickers close matrix.
+
+    Rows without a full window are NaN, so the output has the input's shape.
+    """
+    returns = log_returns(closes)
+    stats = {name: np.full(closes.shape, np.nan) for name in ('Mean', 'Volatility', 'Drawdown')}
+    if len(closes) < window or window < 2:
+        return stats
+
+    mean = _window_sum(returns, window) / window
+    squares = (returns[window - 1:] - mean) ** 2
+    for lag in range(1, window):
+        squares += (returns[window - 1 - lag:len(returns) - lag] - mean) ** 2
+    stats['Mean'][window - 1:] = mean
+    stats['Volatility'][window - 1:] = np.sqrt(squares / (window - 1) * TRADING_DAYS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['Drawdown'][window - 1:] = closes[window - 1:] / _window_max(closes, window) - 1
+    # Drawdown follows the same full-window rule as the return statistics
+    stats['Drawdown'][np.isnan(stats['Mean'])] = np.nan
+    return stats
+
+
+def _ensure_tables(access: Dict[str, Any], exchange: str) -> None:
+    """Create the analytics tables of an exchange if they don't exist."""
+    database_utils.execute_query(access, CREATE_RETURNS_QUERY.format(exchange=exchange))
+    database_utils.execute_query(access, CREATE_ROLLING_QUERY.format(exchange=exchange))
+
+
+def _last_dates(access: Dict[str, Any], exchange: str) -> Dict[Any, Optional[np.datetime64]]:
+    """Newest stored date of the returns (key None) and of every window."""
+    last = {None: None}
+    rows = database_utils.retrieve_table(
+        access, f"SELECT MAX(Date) FROM analytics_{exchange}_returns;"
+    )
+    if rows and rows[0][0] is not None:
+        last[None] = np.datetime64(rows[0][0], 'D')
+    rows = database_utils.retrieve_table(
+        access, f"SELECT Window_Days, MAX(Date) FROM analytics_{exchange}_rolling GROUP BY Window_Days;"
+    )
+    for window, date in rows:
+        last[int(window)] = np.datetime64(date, 'D')
+    return last
+
+
+def _long_rows(tickers: Sequence[str], dates: np.ndarray, columns: Dict[str, np.ndarray],
+               prefix: tuple = ()) -> List[tuple]:
+    """Turn dates x tickers matrices into (Ticker_ID, *prefix, Date, *values) rows.
+
+    Cells where every value is NaN are skipped, remaining NaN become NULL.
+    """
+    stacked = np.stack(list(columns.values()), axis=-1)
+    date_rows, ticker_columns = np.nonzero(~np.isnan(stacked).all(axis=-1))
+    values = stacked[date_rows, ticker_columns].astype(object)
+    values[pd.isna(values)] = None
+    day_strings = np.datetime_as_string(dates, unit='D').tolist()
+    return [
+        (tickers[column], *prefix, day_strings[row], *value)
+        for row, column, value in zip(date_rows, ticker_columns, values.tolist())
+    ]
+
+
+def _write_rows(access: Dict[str, Any], query: str, rows: List[tuple],
+                batch_size: int = 10000) -> None:
+    for start in range(0, len(rows), batch_size):
+        with database_utils.db_connection(access) as cursor:
+            cursor.executemany(query, rows[start:start + batch_size])
+
+
+def update_exchange_analytics(access: Dict[str, Any], exchange: str,
+                              windows: Sequence[int] = DEFAULT_WINDOWS,
+                              recompute: bool = False) -> Dict[str, int]:
+    """Compute and store the returns and rolling statistics of one exchange.
+
+    Args:
+        access: Database connection configuration dictionary
+        exchange: Exchange code
+        windows: Rolling window lengths in trading days
+        recompute: Ignore stored results and recompute the full history
+
+    Returns:
+        Number of rows written per table
+    """
+    _ensure_tables(access, exchange)
+    matrix = price_matrix.load_price_matrix(exchange, PRICE_FIELD)
+    written = {'returns': 0, 'rolling': 0}
+    if not len(matrix.dates):
+        return written
+
+    last = {} if recompute else _last_dates(access, exchange)
+
+    # Each target starts after its newest stored date and needs window dates of context
+    targets = [(None, 1)] + [(int(window), int(window)) for window in windows]
+    starts = {key: (0 if last.get(key) is None else
+                    int(np.searchsorted(matrix.dates, last[key], side='right')))
+              for key, _ in targets}
+    context = {key: max(0, starts[key] - size) for key, size in targets}
+    first = min(context.values())
+    if all(starts[key] >= len(matrix.dates) for key, _ in targets):
+        logger.debug("Analytics for %s already up to date", exchange)
+        return written
+
+    dates = matrix.dates[first:]
+    for block in range(0, len(matrix.tickers), TICKER_BLOCK):
+        tickers = matrix.tickers[block:block + TICKER_BLOCK]
+        closes = np.array(matrix.values[first:, block:block + TICKER_BLOCK], dtype='float64')
+
+        offset = starts[None] - first
+        returns = log_returns(closes)
+        rows = _long_rows(tickers, dates[offset:], {'Log_Return': returns[offset:]})
+        _write_rows(access, UPSERT_RETURNS_QUERY.format(exchange=exchange), rows)
+        written['returns'] += len(rows)
+
+        for window in windows:
+            offset = starts[int(window)] - first
+            stats = rolling_stats(closes, int(window))
+            rows = _long_rows(tickers, dates[offset:],
+                              {name: values[offset:] for name, values in stats.items()},
+                              prefix=(int(window),))
+            _write_rows(access, UPSERT_ROLLING_QUERY.format(exchange=exchange), rows)
+            written['rolling'] += len(rows)
+
+    logger.info(
+        f"Analytics for {exchange}: wrote {written['returns']} returns and "
+        f"{written['rolling']} rolling rows"
+    )
+    return written
+
+
+def analytics_update(windows: Sequence[int] = DEFAULT_WINDOWS, recompute: bool = False) -> None:
+    """Update the returns analytics of every exchange in the price matrix cache."""
+    for exchange in reference_data.get_reference().exchange_list():
+        try:
+            with profiling.section(exchange):
+                update_exchange_analytics(DB_CONFIG, exchange, windows, recompute)
+        except FileNotFoundError:
+            logger.debug("No price matrix for %s, skipping analytics", exchange)
+        except Exception as e:
+            logger.error(f"Failed to update analytics for {exchange}: {e}", exc_info=True)
+
+if __name__ == "__main__":
+    analytics_update()
@@ -1,7 +1,8 @@
 """ Runs the database manager for the data center.
     Includes the following:
         - Daily updates of price and stock data
-        - Monthly updates of global exchanges and new tickers
+        - Weekly updates of global exchanges, new tickers and views, run as a
+          dependency graph so each step starts when the previous one succeeds
 """
 
 # Standard library imports
@@ -10,6 +11,9 @@ import time
 
 # Local application imports
 from lib.data_centre.database.scripts import daily_price_update
+from lib.data_centre.database.job_graph import Job, JobGraph
+from lib.data_centre.data_modelling import analytics_update
+from lib.data_centre.database.utils import query_cache, change_log
 from config.connections.database_access import DB_CONFIG
 from config.settings.logging import logger_factory
 
@@ -18,40 +22,69 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from lib.data_centre.database.scripts import (exchanges_update, 
                                               tickers_update, 
-                                              update_all_views)
+                                              update_all_views,
+                                              corporate_actions_update,
+                                              price_matrix_update,
+                                              price_gap_repair,
+                                              rollups_update)
 
 logger = logger_factory.get_logger('database', module_name=__name__)
 
+# Scheduler defaults: collapse missed runs into one and never overlap a run
+JOB_DEFAULTS = {
+    'coalesce': True,
+    'max_instances': 1,
+    'misfire_grace_time': 3600,
+}
+
+
+def build_daily_graph() -> JobGraph:
+    """Graph for the twice-daily price update."""
+    return JobGraph('daily', [
+        Job('daily_price_update', daily_price_update, timeout=6 * 3600),
+        Job('corporate_actions_update', corporate_actions_update,
+            depends_on=['daily_price_update'], timeout=2 * 3600),
+        Job('price_matrix_update', price_matrix_update,
+            depends_on=['corporate_actions_update'], timeout=3600),
+        Job('rollups_update', rollups_update,
+            depends_on=['corporate_actions_update'], timeout=2 * 3600),
+        Job('analytics_update', analytics_update,
+            depends_on=['price_matrix_update'], timeout=2 * 3600),
+    ])
+
+
+def build_weekly_graph() -> JobGraph:
+    """Graph for the weekly reference data refresh."""
+    return JobGraph('weekly', [
+        Job('exchanges_update', lambda: exchanges_update(DB_CONFIG), timeout=30 * 60),
+        Job('tickers_update', tickers_update,
+            depends_on=['exchanges_update'], timeout=4 * 3600),
+        Job('update_all_views', lambda: update_all_views(DB_CONFIG),
+            depends_on=['tickers_update'], timeout=3600),
+        Job('price_gap_repair', price_gap_repair,
+            depends_on=['tickers_update'], timeout=4 * 3600),
+        Job('prune_cache_invalidations', lambda: query_cache.get_cache().prune(), timeout=600),
+        Job('prune_price_changes', lambda: change_log.prune(DB_CONFIG), timeout=600),
+    ])
+
 
 def main():
     """ Main function to schedule tasks using APScheduler """
     logger.info("Starting Seldon database management scripts...")
 
     # Create a BackgroundScheduler
-    scheduler = BackgroundScheduler()
+    scheduler = BackgroundScheduler(job_defaults=JOB_DEFAULTS)
 
     # Schedule `daily_price_updates` at 1:00 AM and 1:00 PM every day
-    scheduler.add_job(daily_price_update, CronTrigger(hour=1, minute=0))
-    scheduler.add_job(daily_price_update, CronTrigger(hour=13, minute=0))
-    
-
-    # Schedule weekly tasks - Note: Don't call the functions, just pass them
-    scheduler.add_job(
-        lambda: exchanges_update(DB_CONFIG), 
-        CronTrigger(day_of_week='sun', hour=2, minute=0)
-        
-    )
-
-    scheduler.add_job(
-        tickers_update, 
-        CronTrigger(day_of_week='sun', hour=2, minute=15)
-        
-    )
+    daily_graph = build_daily_graph()
+    scheduler.add_job(daily_graph.run, CronTrigger(hour='1,13', minute=0), id='daily')
 
+    # Weekly refresh starts at 2:00 AM on Sunday, later jobs follow their dependencies
+    weekly_graph = build_weekly_graph()
     scheduler.add_job(
-        lambda: update_all_views(DB_CONFIG), 
-        CronTrigger(day_of_week='sun', hour=2, minute=30)
-        
+        weekly_graph.run,
+        CronTrigger(day_of_week='sun', hour=2, minute=0),
+        id='weekly'
     )
 
     try:
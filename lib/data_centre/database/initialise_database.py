@@ -1,15 +1,22 @@
 """Database initialization script.
 
 This script sets up all database tables and loads initial historical data.
-It performs the following operations:
-1. Clears existing tables
+By default the data is loaded into a shadow schema while readers keep using
+the live tables (see utils/shadow_schema.py):
+1. Creates an empty shadow schema
 2. Updates exchange information
 3. Updates ticker symbols
 4. Populates historical price data
-5. Refreshes database views
+5. Builds the close price tables, indexed after the load
+6. Swaps the shadow tables in with one atomic RENAME TABLE
+7. Drops the retired tables in batches
+
+With --in-place the existing tables are cleared first and the data is
+reloaded into the live schema, which stays empty or partial until the end.
 """
 
 # Standard library imports
+import argparse
 import sys
 from pathlib import Path
 
@@ -18,12 +25,15 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
 sys.path.append(str(PROJECT_ROOT))
 
 # Third-party imports
+import pandas as pd
 from mysql.connector import connect, Error
 
 # Local application imports
 from config.settings.paths import PATHS
 from config.connections.database_access import DB_CONFIG
-from lib.data_centre.database.utils import database_utils
+from lib.data_centre.database.utils import (
+    database_utils, close_prices, query_cache, shadow_schema, change_log, price_layout
+)
 from config.settings.logging import logger_factory
 from lib.data_centre.database.scripts import (
     exchanges_update,
@@ -34,29 +44,83 @@ from lib.data_centre.database.scripts import (
 
 logger = logger_factory.get_logger('database', module_name=__name__)
 
-def main():
-    """Execute the database initialization sequence."""
-    try:
-        # Clear existing data
-        database_utils.clear_all_tables(DB_CONFIG)
-        database_utils.clear_all_views(DB_CONFIG)
+def _rebuild_in_place() -> None:
+    """Clear the live schema and reload it."""
+    # Clear existing data
+    database_utils.clear_all_tables(DB_CONFIG)
+    database_utils.clear_all_views(DB_CONFIG)
+
+    # Update core data
+    exchanges_update(DB_CONFIG)
+    tickers_update()
+    populate_price_history()
+
+    # Refresh views
+    update_all_views(DB_CONFIG)
+
+def _rebuild_shadow() -> None:
+    """Load a shadow schema and swap it in, the live data stays readable throughout."""
+    shadow = shadow_schema.create_shadow(DB_CONFIG)
 
-        # Update core data
-        exchanges_update(DB_CONFIG)
-        tickers_update()
-        populate_price_history()
+    # Update core data
+    exchanges_update(shadow)
+    tickers_update(shadow)
+    # Close prices are built from the year tables once they are complete.
+    # The full universe is loaded regardless of the tier reserves, a budget
+    # too small for it fails before the first request
+    deferred = populate_price_history(shadow, publish=False, complete=True)
+    if deferred:
+        # Calls made elsewhere used up the budget, a partial history must
+        # not replace the live one
+        raise RuntimeError(f"API budget deferred {deferred} tickers, shadow schema "
+                           f"{shadow['database']} was not swapped in")
 
-        # Refresh views
-        update_all_views(DB_CONFIG)
+    # Any failure leaves the live schema untouched
+    exchanges = [row[0] for row in database_utils.retrieve_table(
+        shadow, "SELECT Exchange FROM global_exchanges;"
+    )]
+    for exchange in exchanges:
+        if database_utils.price_year_tables(shadow, exchange):
+            close_prices.rebuild_close_price_table(shadow, exchange)
+
+    counts = shadow_schema.verify_shadow(shadow)
+    logger.info(f"Shadow schema loaded: {counts}")
+    shadow_schema.swap_in(DB_CONFIG, shadow)
+    for scope in (query_cache.SCOPE_EXCHANGES, query_cache.SCOPE_TICKERS, query_cache.SCOPE_PRICES):
+        query_cache.invalidate(scope)
+    # One record per replaced year table, for every ticker and date in it
+    change_log.record_changes(DB_CONFIG, 'rebuild', pd.DataFrame(
+        [(exchange, table, None, None, None, None)
+         for exchange in exchanges for table, _ in price_layout.year_tables(DB_CONFIG, exchange)],
+        columns=['Exchange', 'Table_Name', 'Ticker_ID', 'Date_From', 'Date_To', 'Row_Count']
+    ))
+
+    shadow_schema.drop_schema(DB_CONFIG, shadow['database'])
+    shadow_schema.drop_retired(DB_CONFIG)
+
+def main(in_place: bool = False):
+    """Execute the database initialization sequence.
+
+    Args:
+        in_place: Clear and reload the live schema instead of swapping in a shadow
+    """
+    try:
+        if in_place:
+            _rebuild_in_place()
+        else:
+            _rebuild_shadow()
 
         logger.info("Database initialization completed successfully")
         return 0
 
-    except Error as e:
+    except (Error, RuntimeError) as e:
         logger.error(f"Database initialization failed: {str(e)}")
         return 1
 
 if __name__ == "__main__":
     # Set project root path
     project_root = PATHS['DATABASE']
-    sys.exit(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Rebuild the Project Seldon database.')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Clear and reload the live tables instead of using a shadow schema')
+    sys.exit(main(in_place=parser.parse_args().in_place))
\ No newline at end of file
@@ -0,0 +1,316 @@
+"""Dependency-driven job graph for the database manager.
+
+Jobs start as soon as every job they depend on has finished successfully,
+instead of relying on fixed clock offsets between cron triggers. Each job
+runs at most once at a time, across threads and processes, has its own
+timeout, and every run is recorded in the job_runs table so durations and
+the critical path of a graph run can be inspected afterwards.
+"""
+
+# Standard library imports
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, profiling, change_log
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+STATUS_SUCCESS = 'success'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+STATUS_SKIPPED = 'skipped'
+STATUS_LOCKED = 'locked'
+
+CREATE_JOB_RUNS_QUERY = """
+    CREATE TABLE IF NOT EXISTS job_runs (
+        Run_ID VARCHAR(36),
+        Graph VARCHAR(255),
+        Job VARCHAR(255),
+        Depends_On VARCHAR(255),
+        Status VARCHAR(16),
+        Started DATETIME(3),
+        Finished DATETIME(3),
+        Duration_Seconds DOUBLE,
+        Error TEXT,
+        PRIMARY KEY (Run_ID, Job),
+        INDEX idx_job_runs_job (Job, Started)
+    );
+"""
+
+INSERT_JOB_RUN_QUERY = """
+    INSERT INTO job_runs (
+        Run_ID, Graph, Job, Depends_On, Status, Started, Finished,
+        Duration_Seconds, Error
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+"""
+
+SELECT_GRAPH_RUN_QUERY = """
+    SELECT Job, Depends_On, Status, Started, Finished, Duration_Seconds
+    FROM job_runs
+    WHERE Run_ID = %s;
+"""
+
+LATEST_GRAPH_RUN_QUERY = """
+    SELECT Run_ID FROM job_runs
+    WHERE Graph = %s
+    ORDER BY Started DESC
+    LIMIT 1;
+"""
+
+
+@dataclass
+class Job:
+    """A unit of work in a job graph.
+
+    Attributes:
+        name: Unique job name, also used as the cross-process lock name
+        func: Callable run without arguments
+        depends_on: Names of jobs that must succeed before this one starts
+        timeout: Maximum run time in seconds, None for no limit
+        profile: Profile every run (see utils/profiling.py), None follows SELDON_PROFILE
+    """
+    name: str
+    func: Callable[[], Any]
+    depends_on: List[str] = field(default_factory=list)
+    timeout: Optional[float] = None
+    profile: Optional[bool] = None
+
+
+@dataclass
+class JobResult:
+    """Outcome of a single job within a graph run."""
+    job: str
+    status: str
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started is None or self.finished is None:
+            return None
+        return (self.finished - self.started).total_seconds()
+
+
+class JobGraph:
+    """Runs a set of jobs in dependency order."""
+
+    # Shared by every graph so a job never overlaps with itself in this process
+    _job_locks: Dict[str, threading.Lock] = {}
+    _job_locks_guard = threading.Lock()
+
+    def __init__(self, name: str, jobs: List[Job], record_history: bool = True):
+        self.name = name
+        self.jobs = {job.name: job for job in jobs}
+        self.record_history = record_history
+        self._order = self._topological_order()
+        self._history_ready = False
+
+    def _topological_order(self) -> List[str]:
+        """Validate dependencies and return the jobs in a runnable order."""
+        for job in self.jobs.values():
+            unknown = [dep for dep in job.depends_on if dep not in self.jobs]
+            if unknown:
+                raise ValueError(f"Job {job.name} depends on unknown jobs {unknown}")
+
+        order, visiting, visited = [], set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle detected at job {name}")
+            visiting.add(name)
+            for dep in self.jobs[name].depends_on:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.jobs:
+            visit(name)
+        return order
+
+    @classmethod
+    def _local_lock(cls, name: str) -> threading.Lock:
+        with cls._job_locks_guard:
+            return cls._job_locks.setdefault(name, threading.Lock())
+
+    def _execute(self, job: Job, results: queue.Queue, run_id: str) -> None:
+        """Run one job under its process and database locks.
+
+        Price changes the job records are tagged with the graph's run_id.
+        """
+        local_lock = self._local_lock(job.name)
+        if not local_lock.acquire(blocking=False):
+            results.put(JobResult(job.name, STATUS_LOCKED, error="Previous run still active"))
+            return
+
+        started = datetime.now()
+        try:
+            # GET_LOCK is held by this connection, so other processes cannot
+            # start the same job until it finishes or the connection drops
+            with database_utils.db_connection(DB_CONFIG) as cursor:
+                cursor.execute("SELECT GET_LOCK(%s, 0);", (f"seldon_job_{job.name}",))
+                if not cursor.fetchone()[0]:
+                    results.put(JobResult(job.name, STATUS_LOCKED,
+                                          error="Job is running in another process"))
+                    return
+                try:
+                    started = datetime.now()
+                    with profiling.profile_job(job.name, enabled=job.profile), \
+                            change_log.run_scope(run_id):
+                        job.func()
+                    results.put(JobResult(job.name, STATUS_SUCCESS, started, datetime.now()))
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s);", (f"seldon_job_{job.name}",))
+                    cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+            results.put(JobResult(job.name, STATUS_FAILED, started, datetime.now(), str(e)))
+        finally:
+            local_lock.release()
+
+    def run(self) -> Dict[str, JobResult]:
+        """Run the graph, starting each job once its dependencies succeed.
+
+        Returns:
+            Mapping of job name to its result
+        """
+        run_id = str(uuid.uuid4())
+        logger.info(f"Starting job graph {self.name} (run {run_id})")
+
+        results: Dict[str, JobResult] = {}
+        finished: queue.Queue = queue.Queue()
+        running: Dict[str, tuple] = {}
+        pending = list(self._order)
+
+        while pending or running:
+            # Skip jobs whose dependencies did not succeed, start the ready ones
+            for name in list(pending):
+                deps = self.jobs[name].depends_on
+                if any(dep in results and results[dep].status != STATUS_SUCCESS for dep in deps):
+                    pending.remove(name)
+                    results[name] = JobResult(name, STATUS_SKIPPED, error="Dependency did not succeed")
+                    logger.warning(f"Skipping job {name}: a dependency did not succeed")
+                elif all(dep in results for dep in deps):
+                    pending.remove(name)
+                    job = self.jobs[name]
+                    thread = threading.Thread(
+                        target=self._execute, args=(job, finished, run_id),
+                        name=f"job-{name}", daemon=True
+                    )
+                    deadline = time.monotonic() + job.timeout if job.timeout else None
+                    running[name] = (datetime.now(), deadline)
+                    thread.start()
+                    logger.info(f"Started job {name}")
+
+            if not running:
+                continue
+
+            try:
+                result = finished.get(timeout=1)
+                if result.job in running:
+                    started, _ = running.pop(result.job)
+                    result.started = result.started or started
+                    results[result.job] = result
+                    logger.info(f"Job {result.job} finished with status {result.status} "
+                                f"after {result.duration or 0:.1f}s")
+            except queue.Empty:
+                pass
+
+            # Abandon jobs that ran past their timeout. The thread keeps its
+            # locks until it actually returns, so it cannot overlap a later run
+            now = time.monotonic()
+            for name, (started, deadline) in list(running.items()):
+                if deadline is not None and now > deadline:
+                    running.pop(name)
+                    results[name] = JobResult(
+                        name, STATUS_TIMEOUT, started, datetime.now(),
+                        f"Exceeded timeout of {self.jobs[name].timeout}s"
+                    )
+                    logger.error(f"Job {name} timed out after {self.jobs[name].timeout}s")
+
+        if self.record_history:
+            self._record(run_id, results)
+
+        failed = [name for name, result in results.items() if result.status != STATUS_SUCCESS]
+        if failed:
+            logger.warning(f"Job graph {self.name} finished with unsuccessful jobs: {failed}")
+        else:
+            logger.info(f"Job graph {self.name} completed successfully")
+        return results
+
+    def _record(self, run_id: str, results: Dict[str, JobResult]) -> None:
+        """Persist the results of a graph run to the job_runs table."""
+        try:
+            if not self._history_ready:
+                database_utils.execute_query(DB_CONFIG, CREATE_JOB_RUNS_QUERY)
+                self._history_ready = True
+            rows = [
+                (run_id, self.name, name, ','.join(self.jobs[name].depends_on),
+                 result.status, result.started, result.finished, result.duration,
+                 result.error)
+                for name, result in results.items()
+            ]
+            with database_utils.db_connection(DB_CONFIG) as cursor:
+                cursor.executemany(INSERT_JOB_RUN_QUERY, rows)
+        except Exception as e:
+            logger.error(f"Failed to record run history for graph {self.name}: {e}")
+
+
+def critical_path(graph: str, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Reconstruct the critical path of a recorded graph run.
+
+    Walks back from the job that finished last, each time following the
+    dependency that finished latest, since that is the one that gated the start.
+
+    Args:
+        graph: Graph name
+        run_id: Run to inspect, defaults to the latest run of the graph
+
+    Returns:
+        Jobs on the critical path in execution order with their durations
+    """
+    if run_id is None:
+        latest = database_utils.retrieve_table(DB_CONFIG, LATEST_GRAPH_RUN_QUERY, (graph,))
+        if not latest:
+            return []
+        run_id = latest[0][0]
+
+    rows = database_utils.retrieve_table(DB_CONFIG, SELECT_GRAPH_RUN_QUERY, (run_id,))
+    jobs = {
+        row[0]: {
+            'job': row[0],
+            'depends_on': [dep for dep in (row[1] or '').split(',') if dep],
+            'status': row[2],
+            'started': row[3],
+            'finished': row[4],
+            'duration': row[5],
+        }
+        for row in rows if row[4] is not None
+    }
+    if not jobs:
+        return []
+
+    path = []
+    current = max(jobs.values(), key=lambda job: job['finished'])
+    while current is not None:
+        path.append(current)
+        deps = [jobs[dep] for dep in current['depends_on'] if dep in jobs]
+        current = max(deps, key=lambda job: job['finished']) if deps else None
+
+    path.reverse()
+    total = sum(job['duration'] or 0 for job in path)
+    logger.info(f"Critical path for {graph} run {run_id}: "
+                f"{' -> '.join(job['job'] for job in path)} ({total:.1f}s)")
+    return path
@@ -1,24 +1,67 @@
-from .exchanges_update import (
-    exchanges_update,
-    
-)
+"""Database job scripts for Project Seldon.
 
-from .tickers_update import (
-    tickers_update,
-)
+Job functions are imported on first access, so running one job only loads
+the modules that job needs (see seldon.py). Most jobs share their name with
+their module, the package keeps returning the function for those names even
+after the module itself has been imported.
+"""
 
-from .populate_price_history import (
-    populate_price_history,
-)
+# Standard library imports
+import importlib
+import sys
+import types
 
-from .update_views import (
-    update_close_price_view,
-    update_all_views,
-)
+# Job function name -> module defining it
+_EXPORTS = {
+    'exchanges_update': 'exchanges_update',
+    'tickers_update': 'tickers_update',
+    'populate_price_history': 'populate_price_history',
+    'update_close_price_tables': 'update_views',
+    'rebuild_close_price_tables': 'update_views',
+    'update_all_views': 'update_views',
+    'daily_price_update': 'daily_price_update',
+    'corporate_actions_update': 'corporate_actions_update',
+    'readjust_tickers': 'corporate_actions_update',
+    'price_matrix_update': 'price_matrix_update',
+    'parquet_export': 'parquet_export',
+    'compare_layouts': 'compact_prices',
+    'migrate_exchange': 'compact_prices',
+    'revert_exchange': 'compact_prices',
+    'plan_backfill': 'sharded_backfill',
+    'backfill_worker': 'sharded_backfill',
+    'backfill_progress': 'sharded_backfill',
+    'scan_gaps': 'price_gaps',
+    'price_gap_repair': 'price_gaps',
+    'rollups_update': 'rollups_update',
+    'rebuild_all_rollups': 'rollups_update',
+    'check_rollups': 'rollups_update',
+}
 
-from .daily_price_update import (
-    daily_price_update,
-)
+
+class _ScriptsPackage(types.ModuleType):
+    """Package module that keeps job functions bound over same-named submodules."""
+
+    def __setattr__(self, name, value):
+        # The import system binds every imported submodule to its package
+        if name in _EXPORTS and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_EXPORTS[name]}", __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+sys.modules[__name__].__class__ = _ScriptsPackage
 
 # Define what should be available when using "from scripts import *"
 __all__ = [
@@ -26,8 +69,23 @@ __all__ = [
     'tickers_update',
     'populate_price_history',
     'update_views',
-    'update_close_price_view',
+    'update_close_price_tables',
+    'rebuild_close_price_tables',
     'update_all_views',
     'daily_price_update',
-    
-]
\ No newline at end of file
+    'corporate_actions_update',
+    'readjust_tickers',
+    'price_matrix_update',
+    'parquet_export',
+    'compare_layouts',
+    'migrate_exchange',
+    'revert_exchange',
+    'plan_backfill',
+    'backfill_worker',
+    'backfill_progress',
+    'scan_gaps',
+    'price_gap_repair',
+    'rollups_update',
+    'rebuild_all_rollups',
+    'check_rollups',
+]
@@ -0,0 +1,282 @@
+"""Compact Price Layout Migration Module
+
+This module moves the price tables of an exchange between the wide and the
+compact layout (see utils/price_layout.py) and measures what the compact
+layout saves. Each year table is copied into the other layout next to the
+live table, checked, and swapped in with a single RENAME TABLE, so readers
+never see a partial table. Ingestion for the exchange should be paused while
+it is migrated.
+
+The compact layout keeps one row per (Ticker_Key, Date), so duplicate rows of
+a wide table collapse into one, the newest read wins.
+
+Usage:
+    python -m lib.data_centre.database.scripts.compact_prices compare --exchange LSE
+    python -m lib.data_centre.database.scripts.compact_prices migrate --exchange LSE
+    python -m lib.data_centre.database.scripts.compact_prices revert --exchange LSE
+"""
+
+# Standard library imports
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_layout, query_cache
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+SCAN_REPEATS = 3
+
+TABLE_SIZE_QUERY = """
+    SELECT TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH
+    FROM INFORMATION_SCHEMA.TABLES
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s;
+"""
+
+UNMAPPED_ROWS_QUERY = """
+    SELECT COUNT(*)
+    FROM {table} p
+    LEFT JOIN global_tickers k ON k.Ticker_ID = p.Ticker_ID
+    WHERE k.Ticker_ID IS NULL;
+"""
+
+COPY_TO_COMPACT_QUERY = """
+    INSERT INTO {target} (
+        Ticker_Key, Date, Open, High, Low, Close, Adjusted_Close, Volume
+    )
+    SELECT k.Ticker_Key, p.Date, p.Open, p.High, p.Low, p.Close,
+           p.Adjusted_Close, p.Volume
+    FROM {table} p
+    JOIN global_tickers k ON k.Ticker_ID = p.Ticker_ID
+    WHERE p.Date IS NOT NULL
+""" + price_layout.UPSERT_COMPACT_SUFFIX
+
+COPY_TO_WIDE_QUERY = """
+    INSERT INTO {target} ({columns})
+    SELECT {columns} FROM {source};
+"""
+
+# A full scan and a single ticker lookup, the two common access patterns
+SCAN_QUERY = "SELECT COUNT(*), SUM(Close), SUM(Volume) FROM {source};"
+LOOKUP_QUERY = "SELECT Date, Close FROM {source} WHERE Ticker_ID = %s ORDER BY Date;"
+
+
+def _table_size(access: Dict[str, Any], table: str) -> Dict[str, int]:
+    """Row estimate and on-disk bytes of a table after refreshing its statistics."""
+    database_utils.retrieve_table(access, f"ANALYZE TABLE {table};")
+    rows, data_bytes, index_bytes = database_utils.retrieve_table(
+        access, TABLE_SIZE_QUERY, (table,)
+    )[0]
+    return {'rows': int(rows or 0), 'bytes': int(data_bytes or 0) + int(index_bytes or 0)}
+
+
+def _best_seconds(access: Dict[str, Any], query: str, params: Optional[tuple] = None) -> float:
+    """Best of SCAN_REPEATS runs, so both layouts are compared with a warm buffer pool."""
+    best = float('inf')
+    for _ in range(SCAN_REPEATS):
+        started = time.perf_counter()
+        database_utils.retrieve_table(access, query, params)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _sample_ticker(access: Dict[str, Any], table: str) -> Optional[str]:
+    rows = database_utils.retrieve_table(access, f"SELECT Ticker_ID FROM {table} LIMIT 1;")
+    return rows[0][0] if rows else None
+
+
+def _copy_to_compact(access: Dict[str, Any], table: str, target: str) -> int:
+    """Load a compact copy of a wide table.
+
+    Returns:
+        Number of rows whose Ticker_ID has no Ticker_Key and were left out
+    """
+    unmapped = database_utils.retrieve_table(access, UNMAPPED_ROWS_QUERY.format(table=table))[0][0]
+    with database_utils.db_connection(access) as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {target};")
+        cursor.execute(price_layout.COMPACT_TABLE_SCHEMA.format(table=target))
+        cursor.execute(COPY_TO_COMPACT_QUERY.format(table=table, target=target))
+    return int(unmapped)
+
+
+def _copy_to_wide(access: Dict[str, Any], table: str, target: str) -> None:
+    """Load a wide copy of a compact table."""
+    columns = ', '.join(price_layout.PRICE_COLUMNS)
+    with database_utils.db_connection(access) as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {target};")
+        cursor.execute(price_layout.WIDE_TABLE_SCHEMA.format(table=target))
+        cursor.execute(COPY_TO_WIDE_QUERY.format(
+            target=target, columns=columns, source=price_layout.price_source(table, True)
+        ))
+
+
+def compare_table(access: Dict[str, Any], table: str, compact_table: str) -> Dict[str, Any]:
+    """Storage and scan speed of a wide table against its compact copy."""
+    wide_size = _table_size(access, table)
+    compact_size = _table_size(access, compact_table)
+    wide_source = price_layout.price_source(table, False)
+    compact_source = price_layout.price_source(compact_table, True)
+
+    report = {
+        'table': table,
+        'rows': wide_size['rows'],
+        'wide_mb': wide_size['bytes'] / 1024 ** 2,
+        'compact_mb': compact_size['bytes'] / 1024 ** 2,
+        'wide_scan_s': _best_seconds(access, SCAN_QUERY.format(source=wide_source)),
+        'compact_scan_s': _best_seconds(access, SCAN_QUERY.format(source=compact_source)),
+    }
+    ticker_id = _sample_ticker(access, table)
+    if ticker_id is not None:
+        report['wide_lookup_s'] = _best_seconds(
+            access, LOOKUP_QUERY.format(source=wide_source), (ticker_id,)
+        )
+        report['compact_lookup_s'] = _best_seconds(
+            access, LOOKUP_QUERY.format(source=compact_source), (ticker_id,)
+        )
+    report['storage_ratio'] = (report['wide_mb'] / report['compact_mb']
+                               if report['compact_mb'] else 0.0)
+    logger.info(
+        f"{table}: {report['wide_mb']:.1f} MB -> {report['compact_mb']:.1f} MB "
+        f"({report['storage_ratio']:.1f}x), full scan {report['wide_scan_s']:.3f}s -> "
+        f"{report['compact_scan_s']:.3f}s"
+    )
+    return report
+
+
+def compare_layouts(exchange: str, access: Dict[str, Any] = DB_CONFIG) -> List[Dict[str, Any]]:
+    """Build compact copies of the wide tables of an exchange, measure and drop them.
+
+    Returns:
+        One report per wide year table
+    """
+    price_layout.ensure_ticker_keys(access)
+    reports = []
+    for table, compact in price_layout.year_tables(access, exchange):
+        if compact:
+            continue
+        copy = f"{table}_compact"
+        unmapped = _copy_to_compact(access, table, copy)
+        try:
+            report = compare_table(access, table, copy)
+            report['unmapped_rows'] = unmapped
+            reports.append(report)
+        finally:
+            database_utils.execute_query(access, f"DROP TABLE IF EXISTS {copy};")
+    return reports
+
+
+def migrate_exchange(exchange: str, access: Dict[str, Any] = DB_CONFIG,
+                     keep_old: bool = False, force: bool = False) -> Dict[str, int]:
+    """Move every wide year table of an exchange to the compact layout.
+
+    Args:
+        exchange: Exchange code
+        access: Database connection configuration dictionary
+        keep_old: Keep the wide tables as prices_{exchange}_{year}_wide
+        force: Migrate tables even if some rows have no Ticker_Key
+
+    Returns:
+        Counts of migrated and skipped tables
+    """
+    price_layout.ensure_ticker_keys(access)
+    stats = {'migrated': 0, 'skipped': 0}
+    for table, compact in price_layout.year_tables(access, exchange):
+        if compact:
+            continue
+        copy, old = f"{table}_compact", f"{table}_wide"
+        unmapped = _copy_to_compact(access, table, copy)
+        if unmapped and not force:
+            logger.error(f"{table} has {unmapped} rows without a Ticker_Key, left wide")
+            database_utils.execute_query(access, f"DROP TABLE IF EXISTS {copy};")
+            stats['skipped'] += 1
+            continue
+
+        with database_utils.db_connection(access) as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {old};")
+            cursor.execute(f"RENAME TABLE {table} TO {old}, {copy} TO {table};")
+            if not keep_old:
+                cursor.execute(f"DROP TABLE {old};")
+        stats['migrated'] += 1
+        logger.debug("Migrated %s to the compact layout", table)
+
+    if stats['migrated']:
+        query_cache.invalidate(query_cache.SCOPE_PRICES, exchange)
+    logger.info(f"Compact layout for {exchange}: {stats['migrated']} tables migrated, "
+                f"{stats['skipped']} skipped")
+    return stats
+
+
+def revert_exchange(exchange: str, access: Dict[str, Any] = DB_CONFIG,
+                    keep_old: bool = False) -> int:
+    """Move every compact year table of an exchange back to the wide layout.
+
+    Returns:
+        Number of reverted tables
+    """
+    reverted = 0
+    for table, compact in price_layout.year_tables(access, exchange):
+        if not compact:
+            continue
+        copy, old = f"{table}_wide", f"{table}_compact"
+        _copy_to_wide(access, table, copy)
+        with database_utils.db_connection(access) as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {old};")
+            cursor.execute(f"RENAME TABLE {table} TO {old}, {copy} TO {table};")
+            if not keep_old:
+                cursor.execute(f"DROP TABLE {old};")
+        reverted += 1
+
+    if reverted:
+        query_cache.invalidate(query_cache.SCOPE_PRICES, exchange)
+    logger.info(f"Wide layout for {exchange}: {reverted} tables reverted")
+    return reverted
+
+
+def _print_reports(reports: List[Dict[str, Any]]) -> None:
+    header = (f"{'table':<24}{'rows':>12}{'wide MB':>10}{'compact MB':>12}{'ratio':>7}"
+              f"{'wide s':>9}{'compact s':>11}{'wide ms':>9}{'compact ms':>12}")
+    print(header)
+    # Scan columns are full scan seconds, lookup columns single ticker milliseconds
+    for report in reports:
+        print(
+            f"{report['table']:<24}{report['rows']:>12,}{report['wide_mb']:>10.1f}"
+            f"{report['compact_mb']:>12.1f}{report['storage_ratio']:>7.1f}"
+            f"{report['wide_scan_s']:>9.3f}{report['compact_scan_s']:>11.3f}"
+            f"{report.get('wide_lookup_s', 0) * 1000:>9.1f}"
+            f"{report.get('compact_lookup_s', 0) * 1000:>12.1f}"
+        )
+    if reports:
+        wide = sum(report['wide_mb'] for report in reports)
+        compact = sum(report['compact_mb'] for report in reports)
+        print(f"{'total':<24}{sum(r['rows'] for r in reports):>12,}{wide:>10.1f}"
+              f"{compact:>12.1f}{(wide / compact if compact else 0.0):>7.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point for the compact layout migration."""
+    parser = argparse.ArgumentParser(description="Compact price table layout")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('compare', "Measure storage and scan speed of both layouts"),
+                            ('migrate', "Move wide tables to the compact layout"),
+                            ('revert', "Move compact tables back to the wide layout")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--exchange', required=True)
+        if name != 'compare':
+            command.add_argument('--keep-old', action='store_true')
+    commands.choices['migrate'].add_argument('--force', action='store_true')
+
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        _print_reports(compare_layouts(args.exchange))
+    elif args.command == 'migrate':
+        migrate_exchange(args.exchange, keep_old=args.keep_old, force=args.force)
+    else:
+        revert_exchange(args.exchange, keep_old=args.keep_old)
+
+
+if __name__ == "__main__":
+    main()
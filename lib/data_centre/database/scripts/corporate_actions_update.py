@@ -0,0 +1,388 @@
+"""Corporate Actions Update Module
+
+This module keeps Adjusted_Close current when tickers split or pay dividends,
+without re-downloading their price history. Split and dividend events are
+pulled from the EODHD bulk endpoints and stored in corporate_actions. For
+every affected ticker the cumulative adjustment factor of each date interval
+is rebuilt in adjustment_factors, and Adjusted_Close is rewritten from Close
+with a single UPDATE per year table and on the close price table.
+"""
+
+# Standard library imports
+from typing import Dict, List, Optional
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import (
+    database_utils, eodhd_utils, close_prices, price_matrix, query_cache, price_layout,
+    profiling, change_log, reference_data
+)
+from config.connections.database_access import DB_CONFIG
+from config.connections.eodhd_access import EODHD_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+FIRST_DATE = '1900-01-01'
+# Days a dividend may wait for an earlier close before it is left unadjusted
+UNRESOLVED_AFTER_DAYS = 7
+
+CREATE_ACTIONS_QUERY = """
+    CREATE TABLE IF NOT EXISTS corporate_actions (
+        Ticker_ID VARCHAR(255),
+        Exchange VARCHAR(255),
+        Date DATE,
+        Action VARCHAR(16),
+        Value DECIMAL(20,6),
+        Prev_Close DECIMAL(20,6),
+        Factor DOUBLE,
+        Date_Updated DATETIME,
+        PRIMARY KEY (Ticker_ID, Date, Action),
+        INDEX idx_corporate_actions_exchange (Exchange, Date)
+    );
+"""
+
+# Tickers whose full event history has been loaded once
+CREATE_HISTORY_QUERY = """
+    CREATE TABLE IF NOT EXISTS corporate_action_history (
+        Ticker_ID VARCHAR(255),
+        Date_Loaded DATETIME,
+        PRIMARY KEY (Ticker_ID)
+    );
+"""
+
+# Adjusted_Close = Close * Cumulative_Factor for Start_Date <= Date < End_Date,
+# the interval after the last event has no End_Date and a factor of 1
+CREATE_FACTORS_QUERY = """
+    CREATE TABLE IF NOT EXISTS adjustment_factors (
+        Ticker_ID VARCHAR(255),
+        Exchange VARCHAR(255),
+        Start_Date DATE,
+        End_Date DATE,
+        Cumulative_Factor DOUBLE,
+        Pending TINYINT(1) NOT NULL DEFAULT 1,
+        PRIMARY KEY (Ticker_ID, Start_Date),
+        INDEX idx_adjustment_factors_pending (Exchange, Pending)
+    );
+"""
+
+UPSERT_ACTION_QUERY = """
+    INSERT INTO corporate_actions (
+        Ticker_ID, Exchange, Date, Action, Value, Factor, Date_Updated
+    ) VALUES (%s, %s, %s, %s, %s, %s, NOW())
+    ON DUPLICATE KEY UPDATE
+        Factor = IF(Value <=> VALUES(Value), Factor, VALUES(Factor)),
+        Prev_Close = IF(Value <=> VALUES(Value), Prev_Close, NULL),
+        Value = VALUES(Value),
+        Date_Updated = NOW();
+"""
+
+# A dividend is priced against the last close before its ex-date, a
+# backward range read on the (Ticker_ID, Date) key of the close price table
+PREV_CLOSE_QUERY = """
+    UPDATE corporate_actions a
+    SET a.Prev_Close = (
+        SELECT c.Close FROM {table} c
+        WHERE c.Ticker_ID = a.Ticker_ID AND c.Date < a.Date
+        ORDER BY c.Date DESC
+        LIMIT 1
+    )
+    WHERE a.Exchange = %s AND a.Action = 'dividend' AND a.Prev_Close IS NULL;
+"""
+
+DIVIDEND_FACTOR_QUERY = """
+    UPDATE corporate_actions
+    SET Factor = IF(Prev_Close > Value AND Value > 0, 1 - Value / Prev_Close, 1)
+    WHERE Exchange = %s AND Action = 'dividend' AND Factor IS NULL
+      AND Prev_Close IS NOT NULL;
+"""
+
+PENDING_DIVIDENDS_QUERY = """
+    SELECT Exchange, Ticker_ID, Date
+    FROM corporate_actions
+    WHERE Action = 'dividend' AND Factor IS NULL;
+"""
+
+# Without a close before its ex-date there is no price for a dividend to
+# adjust, it keeps a neutral factor and is no longer retried
+UNRESOLVED_DIVIDEND_QUERY = """
+    UPDATE corporate_actions
+    SET Factor = 1
+    WHERE Exchange = %s AND Action = 'dividend' AND Factor IS NULL
+      AND Prev_Close IS NULL AND Date_Updated < NOW() - INTERVAL %s DAY;
+"""
+
+INSERT_FACTOR_QUERY = """
+    INSERT INTO adjustment_factors (
+        Ticker_ID, Exchange, Start_Date, End_Date, Cumulative_Factor, Pending
+    ) VALUES (%s, %s, %s, %s, %s, 1);
+"""
+
+APPLY_FACTORS_QUERY = """
+    UPDATE {target}
+    JOIN adjustment_factors f
+      ON f.Ticker_ID = {ticker_id}
+     AND p.Date >= f.Start_Date
+     AND (f.End_Date IS NULL OR p.Date < f.End_Date)
+    SET p.Adjusted_Close = ROUND(p.Close * f.Cumulative_Factor, 6)
+    WHERE f.Exchange = %s AND f.Pending = 1;
+"""
+
+
+def _ensure_tables() -> None:
+    """Create the corporate action tables if they don't exist."""
+    for query in (CREATE_ACTIONS_QUERY, CREATE_HISTORY_QUERY, CREATE_FACTORS_QUERY):
+        database_utils.execute_query(DB_CONFIG, query)
+
+
+def _get_exchange_codes() -> pd.DataFrame:
+    """Retrieve list of active exchange codes from the shared reference data."""
+    return reference_data.get_reference().exchange_codes()
+
+
+def _resolve_tickers(events: pd.DataFrame, eod_exchange: str) -> pd.DataFrame:
+    """Attach Ticker_ID and local Exchange to bulk events of an EODHD exchange."""
+    tickers = events['Ticker'].astype(str).unique().tolist()
+    if not tickers:
+        return events.assign(Ticker_ID=pd.Series(dtype=object), Exchange=pd.Series(dtype=object))
+    reference = reference_data.get_reference()
+    codes = reference.exchange_codes(active_only=False)
+    listed = pd.concat([
+        reference.exchange_tickers(exchange, active_only=False)
+        for exchange in codes.loc[codes['EoDHD_Exchange'] == eod_exchange, 'Exchange']
+    ] or [reference.tickers.iloc[:0]])
+    known = listed.loc[listed['Ticker'].isin(tickers), ['Ticker_ID', 'Ticker', 'Exchange']]
+    return events.assign(Ticker=events['Ticker'].astype(str)).merge(known, on='Ticker', how='inner')
+
+
+def _store_actions(events: pd.DataFrame) -> None:
+    """Upsert events into corporate_actions, computing split factors directly."""
+    if events.empty:
+        return
+    events = events.copy()
+    # Prices before a split are divided by its new/old share ratio, a ratio
+    # of 0 (or x/0) has no meaning and leaves the split without a factor
+    is_split = events['Action'] == 'split'
+    invalid = is_split & ~(np.isfinite(events['Value']) & (events['Value'] > 0))
+    if invalid.any():
+        logger.warning(f"Ignoring {int(invalid.sum())} splits without a finite positive ratio: "
+                       f"{events.loc[invalid, 'Ticker_ID'].tolist()}")
+    events['Factor'] = 1.0 / events['Value'].where(is_split & ~invalid)
+    rows = database_utils.dataframe_to_rows(
+        events[['Ticker_ID', 'Exchange', 'Date', 'Action', 'Value', 'Factor']]
+    )
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.executemany(UPSERT_ACTION_QUERY, rows)
+
+
+def _load_missing_history(tickers: pd.DataFrame, eod_exchanges: Dict[str, str]) -> None:
+    """Load the full event history of tickers seen for the first time.
+
+    Earlier events are needed for the cumulative factors, this costs two
+    small API calls per ticker instead of a full price history download.
+    """
+    ticker_ids = tickers['Ticker_ID'].unique().tolist()
+    query = (
+        "SELECT Ticker_ID FROM corporate_action_history "
+        f"WHERE Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))});"
+    )
+    loaded = {row[0] for row in database_utils.retrieve_table(DB_CONFIG, query, tuple(ticker_ids))}
+
+    for row in tickers.drop_duplicates('Ticker_ID').itertuples():
+        if row.Ticker_ID in loaded:
+            continue
+        history = eodhd_utils.retrieve_ticker_corporate_actions(
+            eod_exchanges[row.Exchange], row.Ticker, EODHD_CONFIG['api_key']
+        )
+        if history is None:
+            logger.warning(f"Unable to load corporate action history for {row.Ticker_ID}")
+            continue
+        _store_actions(history.assign(Ticker_ID=row.Ticker_ID, Exchange=row.Exchange))
+        database_utils.execute_query(
+            DB_CONFIG,
+            "INSERT IGNORE INTO corporate_action_history (Ticker_ID, Date_Loaded) VALUES (%s, NOW());",
+            (row.Ticker_ID,)
+        )
+
+
+def _set_dividend_factors(exchange: str) -> None:
+    """Price the pending dividends of an exchange against the previous close."""
+    table = close_prices.ensure_close_price_table(DB_CONFIG, exchange)
+    database_utils.execute_query(DB_CONFIG, PREV_CLOSE_QUERY.format(table=table), (exchange,))
+    database_utils.execute_query(DB_CONFIG, DIVIDEND_FACTOR_QUERY, (exchange,))
+    database_utils.execute_query(
+        DB_CONFIG, UNRESOLVED_DIVIDEND_QUERY, (exchange, UNRESOLVED_AFTER_DAYS)
+    )
+
+
+def build_adjustment_factors(actions: pd.DataFrame) -> pd.DataFrame:
+    """Turn events into cumulative adjustment factor intervals.
+
+    The interval starting at an ex-date carries the product of the factors of
+    all later events, and the interval before the first event carries the
+    product of all of them.
+
+    Args:
+        actions: Events with Ticker_ID, Exchange, Date and Factor columns
+
+    Returns:
+        DataFrame with Ticker_ID, Exchange, Start_Date, End_Date and
+        Cumulative_Factor columns
+    """
+    events = (actions.dropna(subset=['Factor'])
+              .groupby(['Ticker_ID', 'Exchange', 'Date'], as_index=False)['Factor'].prod()
+              .sort_values(['Ticker_ID', 'Date'], ignore_index=True))
+    if events.empty:
+        return pd.DataFrame(columns=['Ticker_ID', 'Exchange', 'Start_Date', 'End_Date', 'Cumulative_Factor'])
+
+    # Product of the factors at and after each event, per ticker
+    reverse = events.iloc[::-1]
+    events['From_Event'] = reverse.groupby('Ticker_ID')['Factor'].cumprod().iloc[::-1]
+    grouped = events.groupby('Ticker_ID')
+
+    intervals = pd.DataFrame({
+        'Ticker_ID': events['Ticker_ID'],
+        'Exchange': events['Exchange'],
+        'Start_Date': events['Date'],
+        'End_Date': grouped['Date'].shift(-1),
+        'Cumulative_Factor': grouped['From_Event'].shift(-1).fillna(1.0),
+    })
+    first = events.drop_duplicates('Ticker_ID', keep='first')
+    before_first = pd.DataFrame({
+        'Ticker_ID': first['Ticker_ID'],
+        'Exchange': first['Exchange'],
+        'Start_Date': pd.Timestamp(FIRST_DATE),
+        'End_Date': first['Date'],
+        'Cumulative_Factor': first['From_Event'],
+    })
+    return pd.concat([before_first, intervals], ignore_index=True)
+
+
+def readjust_tickers(ticker_ids: List[str]) -> int:
+    """Rebuild adjustment factors and rewrite Adjusted_Close for tickers.
+
+    Args:
+        ticker_ids: Tickers whose events changed
+
+    Returns:
+        Number of price rows rewritten
+    """
+    if not ticker_ids:
+        return 0
+    _ensure_tables()
+
+    query = (
+        "SELECT Ticker_ID, Exchange, Date, Action, Value, Factor FROM corporate_actions "
+        f"WHERE Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))});"
+    )
+    actions = pd.DataFrame(
+        database_utils.retrieve_table(DB_CONFIG, query, tuple(ticker_ids)),
+        columns=['Ticker_ID', 'Exchange', 'Date', 'Action', 'Value', 'Factor']
+    )
+    actions['Date'] = pd.to_datetime(actions['Date'])
+    actions['Factor'] = pd.to_numeric(actions['Factor'], errors='coerce')
+
+    factors = build_adjustment_factors(actions)
+    rows = database_utils.dataframe_to_rows(
+        factors[['Ticker_ID', 'Exchange', 'Start_Date', 'End_Date', 'Cumulative_Factor']]
+    )
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.execute(
+            f"DELETE FROM adjustment_factors WHERE Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))});",
+            tuple(ticker_ids)
+        )
+        cursor.executemany(INSERT_FACTOR_QUERY, rows)
+
+    rewritten = 0
+    for exchange in factors['Exchange'].unique():
+        exchange_tickers = factors.loc[factors['Exchange'] == exchange, 'Ticker_ID'].unique().tolist()
+        changed_tables = []
+        for table, compact in price_layout.year_tables(DB_CONFIG, exchange):
+            target, ticker_id = price_layout.update_target(table, compact)
+            count = database_utils.execute_query(
+                DB_CONFIG, APPLY_FACTORS_QUERY.format(target=target, ticker_id=ticker_id), (exchange,)
+            )
+            if count:
+                changed_tables.append(table)
+            rewritten += count
+        # The close price table carries Adjusted_Close too
+        target, ticker_id = price_layout.update_target(
+            close_prices.ensure_close_price_table(DB_CONFIG, exchange), False
+        )
+        database_utils.execute_query(
+            DB_CONFIG, APPLY_FACTORS_QUERY.format(target=target, ticker_id=ticker_id), (exchange,)
+        )
+        database_utils.execute_query(
+            DB_CONFIG,
+            "UPDATE adjustment_factors SET Pending = 0 WHERE Exchange = %s AND Pending = 1;",
+            (exchange,)
+        )
+        # The UPDATE does not report which dates it touched, so the records cover all of them
+        change_log.record_changes(DB_CONFIG, 'adjust', pd.DataFrame(
+            [(exchange, table, ticker, None, None, None)
+             for table in changed_tables for ticker in exchange_tickers],
+            columns=['Exchange', 'Table_Name', 'Ticker_ID', 'Date_From', 'Date_To', 'Row_Count']
+        ))
+        price_matrix.refresh_price_matrix_tickers(DB_CONFIG, exchange, exchange_tickers)
+        query_cache.invalidate(query_cache.SCOPE_PRICES, exchange)
+
+    logger.info(f"Re-adjusted {len(ticker_ids)} tickers, rewrote {rewritten} price rows")
+    return rewritten
+
+
+def corporate_actions_update(date: Optional[str] = None) -> None:
+    """Pull the latest splits and dividends and re-adjust affected tickers.
+
+    Args:
+        date: Day (YYYY-MM-DD) to pull events for, defaults to the last trading day
+    """
+    _ensure_tables()
+    exchanges = _get_exchange_codes()
+    eod_exchanges = dict(zip(exchanges['Exchange'], exchanges['EoDHD_Exchange']))
+    affected = []
+
+    for eod_exchange, group in exchanges.groupby('EoDHD_Exchange', sort=False):
+        exchange_list = group['Exchange'].tolist()
+        try:
+            with profiling.section(eod_exchange):
+                events = eodhd_utils.retrieve_bulk_corporate_actions(
+                    eod_exchange, EODHD_CONFIG['api_key'], date
+                )
+                if events is None or events.empty:
+                    logger.debug("No corporate actions for %s using EoD Code %s", exchange_list, eod_exchange)
+                    continue
+
+                events = _resolve_tickers(events, eod_exchange)
+                if events.empty:
+                    continue
+
+                _load_missing_history(events[['Ticker_ID', 'Ticker', 'Exchange']], eod_exchanges)
+                _store_actions(events)
+                affected.extend(events['Ticker_ID'].unique().tolist())
+                logger.debug("Stored %s corporate actions for %s", len(events), exchange_list)
+
+        except Exception as e:
+            logger.error(f"Error updating corporate actions for {exchange_list} using EoD Code {eod_exchange}: {e}", exc_info=True)
+            continue
+
+    # New dividends and those still waiting for a close from earlier runs or
+    # history loads are priced together, every ticker with a dividend that
+    # got its factor is re-adjusted
+    pending = set(database_utils.retrieve_table(DB_CONFIG, PENDING_DIVIDENDS_QUERY))
+    for exchange in set(eod_exchanges).intersection(row[0] for row in pending):
+        _set_dividend_factors(exchange)
+    resolved = pending - set(database_utils.retrieve_table(DB_CONFIG, PENDING_DIVIDENDS_QUERY))
+    affected.extend(ticker_id for _, ticker_id, _ in resolved)
+
+    if affected:
+        readjust_tickers(sorted(set(affected)))
+    else:
+        logger.info("No corporate actions to apply")
+
+
+if __name__ == "__main__":
+    corporate_actions_update()
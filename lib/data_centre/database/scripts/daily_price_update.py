@@ -1,30 +1,49 @@
 """Daily Price Update Module
 
 This module handles the daily updates of price data for all tickers across exchanges.
+
+The bulk payload of each EODHD exchange code is loaded into a per-run staging
+table and moved into the price tables of every local exchange it serves with
+one INSERT ... SELECT, which joins global_tickers to set the Ticker_ID of each
+row, or its Ticker_Key for tables with the compact layout. Rows for tickers
+missing from global_tickers go to prices_unknown_tickers.
+
+Exchanges are requested in the order of their best ticker tier (see
+utils/universe.py) and an exchange is deferred when the remaining daily API
+budget does not cover a bulk request for its best tier. Rows of tickers in
+tiers above MAX_TIER are not stored.
 """
 
 # Standard library imports
-from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from datetime import date
+from typing import List, Optional, Dict
 
 # Third-party imports
 import pandas as pd
+from mysql.connector import Error
 
 # Local application imports
-from lib.data_centre.database.utils import database_utils, eodhd_utils
+from lib.data_centre.database.utils import (
+    database_utils, eodhd_utils, price_validation, close_prices, query_cache, price_layout,
+    profiling, universe, change_log, reference_data
+)
 from config.connections.database_access import DB_CONFIG
 from config.connections.eodhd_access import EODHD_CONFIG
 from config.settings.logging import logger_factory
+from config.settings.universe import MAX_TIER
 
 logger = logger_factory.get_logger('database', module_name=__name__)
 
 
 # Constants
-PRICE_TABLE_SCHEMA = """
-    CREATE TABLE IF NOT EXISTS prices_{exchange}_{year} (
-        Ticker_ID VARCHAR(255),
+LATEST_PRICE_DATE_QUERY = """
+    SELECT MAX(Date) AS LatestDate
+    FROM prices_{exchange}_{year};
+"""
+
+UNKNOWN_TICKERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS prices_unknown_tickers (
         Ticker VARCHAR(255),
-        Exchange VARCHAR(255),
         EoDHD_Exchange VARCHAR(255),
         Date DATE,
         Open DECIMAL(20,6),
@@ -32,120 +51,252 @@ PRICE_TABLE_SCHEMA = """
         Low DECIMAL(20,6),
         Close DECIMAL(20,6),
         Adjusted_Close DECIMAL(20,6),
-        Volume BIGINT
+        Volume BIGINT,
+        Date_Updated DATETIME,
+        PRIMARY KEY (EoDHD_Exchange, Ticker, Date)
     );
 """
 
-LATEST_PRICE_DATE_QUERY = """
-    SELECT MAX(Date) AS LatestDate
-    FROM prices_{exchange}_{year};
+STAGING_TABLE_SCHEMA = """
+    CREATE TEMPORARY TABLE prices_staging (
+        Ticker VARCHAR(255),
+        Date DATE,
+        Open DECIMAL(20,6),
+        High DECIMAL(20,6),
+        Low DECIMAL(20,6),
+        Close DECIMAL(20,6),
+        Adjusted_Close DECIMAL(20,6),
+        Volume BIGINT,
+        INDEX idx_prices_staging_ticker (Ticker)
+    );
 """
 
-TICKER_COLUMNS = [
-    'Ticker_ID', 'Ticker', 'Name', 'Country', 'Exchange', 'EoDHD_Exchange',
-    'Currency', 'Type', 'Isin', 'Source', 'Date_Updated'
+STAGING_COLUMNS = [
+    'Ticker', 'Date', 'Open', 'High', 'Low', 'Close', 'Adjusted_Close', 'Volume'
 ]
 
-PRICE_COLUMNS_SORTED = [
-    'Ticker_ID', 'Ticker', 'Exchange', 'EoDHD_Exchange', 'Date', 'Open', 'High', 'Low', 
-    'Close', 'Adjusted_Close', 'Volume'
-]
+# Ticker_ID is '{ticker}_{exchange}', so the join is a primary key lookup.
+# Tickers tiered above MAX_TIER are left out
+MERGE_PRICES_QUERY = """
+    INSERT INTO prices_{exchange}_{year} (
+        Ticker_ID, Ticker, Exchange, EoDHD_Exchange, Date,
+        Open, High, Low, Close, Adjusted_Close, Volume
+    )
+    SELECT t.Ticker_ID, t.Ticker, t.Exchange, t.EoDHD_Exchange, s.Date,
+           s.Open, s.High, s.Low, s.Close, s.Adjusted_Close, s.Volume
+    FROM prices_staging s
+    JOIN global_tickers t ON t.Ticker_ID = CONCAT(s.Ticker, '_', %s)
+    LEFT JOIN ticker_tiers u ON u.Ticker_ID = t.Ticker_ID
+    WHERE YEAR(s.Date) = %s AND s.Date > %s
+      AND (u.Tier IS NULL OR u.Tier <= %s);
+"""
+
+MERGE_COMPACT_PRICES_QUERY = """
+    INSERT INTO prices_{exchange}_{year} (
+        Ticker_Key, Date, Open, High, Low, Close, Adjusted_Close, Volume
+    )
+    SELECT t.Ticker_Key, s.Date, s.Open, s.High, s.Low, s.Close,
+           s.Adjusted_Close, s.Volume
+    FROM prices_staging s
+    JOIN global_tickers t ON t.Ticker_ID = CONCAT(s.Ticker, '_', %s)
+    LEFT JOIN ticker_tiers u ON u.Ticker_ID = t.Ticker_ID
+    WHERE YEAR(s.Date) = %s AND s.Date > %s
+      AND (u.Tier IS NULL OR u.Tier <= %s)
+""" + price_layout.UPSERT_COMPACT_SUFFIX
 
+CLOSE_PRICES_QUERY = """
+    SELECT t.Ticker_ID, s.Date, s.Close, s.Adjusted_Close
+    FROM prices_staging s
+    JOIN global_tickers t ON t.Ticker_ID = CONCAT(s.Ticker, '_', %s)
+    LEFT JOIN ticker_tiers u ON u.Ticker_ID = t.Ticker_ID
+    WHERE s.Date > %s
+      AND (u.Tier IS NULL OR u.Tier <= %s)
+"""
 
-def _get_exchange_codes() -> List[str]:
-    """Retrieve list of exchange codes from database."""
-    query = 'SELECT Exchange, EoDHD_Exchange FROM global_exchanges;'
-    data = database_utils.retrieve_table(DB_CONFIG, query)
-    data = pd.DataFrame(data, columns=['Exchange', 'EoDHD_Exchange'])
-    return data
+# Change log records of the rows a merge wrote, same filter as the merge
+CHANGED_TICKERS_QUERY = """
+    SELECT t.Ticker_ID, MIN(s.Date), MAX(s.Date), COUNT(*)
+    FROM prices_staging s
+    JOIN global_tickers t ON t.Ticker_ID = CONCAT(s.Ticker, '_', %s)
+    LEFT JOIN ticker_tiers u ON u.Ticker_ID = t.Ticker_ID
+    WHERE YEAR(s.Date) = %s AND s.Date > %s
+      AND (u.Tier IS NULL OR u.Tier <= %s)
+    GROUP BY t.Ticker_ID;
+"""
 
-def _ensure_price_table(exchange: str, year: int) -> None:
-    """Create price table for exchange and year if it doesn't exist."""
-    query = PRICE_TABLE_SCHEMA.format(exchange=exchange, year=year)
-    database_utils.execute_query(DB_CONFIG, query)
+UNKNOWN_TICKERS_QUERY = """
+    INSERT IGNORE INTO prices_unknown_tickers (
+        Ticker, EoDHD_Exchange, Date, Open, High, Low, Close,
+        Adjusted_Close, Volume, Date_Updated
+    )
+    SELECT s.Ticker, %s, s.Date, s.Open, s.High, s.Low, s.Close,
+           s.Adjusted_Close, s.Volume, NOW()
+    FROM prices_staging s
+    LEFT JOIN global_tickers t ON t.Ticker_ID IN ({ticker_ids})
+    WHERE t.Ticker_ID IS NULL;
+"""
+
+
+def _get_exchange_codes() -> pd.DataFrame:
+    """Retrieve list of exchange codes from the shared reference data."""
+    return reference_data.get_reference().exchange_codes(active_only=False)
+
+def _ensure_price_table(exchange: str, year: int) -> bool:
+    """Create price table for exchange and year if it doesn't exist.
+
+    Returns:
+        True if the table has the compact layout
+    """
+    return price_layout.ensure_price_table(DB_CONFIG, exchange, year)
 
-def _get_latest_price_date(exchange: str, year: int) -> Optional[datetime.date]:
+def _get_latest_price_date(exchange: str, year: int) -> Optional[date]:
     """Get the most recent price date for an exchange from the database.
-    
+
+    Falls back to the previous year's table so that the first update of a
+    new year still finds the existing history.
+
     Args:
         exchange (str): Exchange code
         year (int): Year to check
-        
+
     Returns:
         Optional[date]: The latest price date if exists, None otherwise
     """
-    
-    query = LATEST_PRICE_DATE_QUERY.format(exchange=exchange, year=year)
-    latest_price_date = database_utils.retrieve_table(DB_CONFIG, query)
-    # Handle empty list or None result
-    if not latest_price_date or latest_price_date[0][0] is None:
-        return None
-    return pd.to_datetime(latest_price_date[0][0]).date()
-    
-
-def _get_db_tickers(db_config: Dict[str, Any], exchange: str) -> pd.DataFrame:
-    """Retrieve tickers for specific exchange from database."""
-    query = f"SELECT Ticker FROM global_tickers WHERE Exchange='{exchange}';"
-    table = database_utils.retrieve_table(db_config, query)
-    return pd.DataFrame(table, columns=['Ticker'])
+    for table_year in (year, year - 1):
+        query = LATEST_PRICE_DATE_QUERY.format(exchange=exchange, year=table_year)
+        try:
+            latest_price_date = database_utils.retrieve_table(DB_CONFIG, query)
+        except Error:
+            continue
+        # Handle empty list or None result
+        if latest_price_date and latest_price_date[0][0] is not None:
+            return pd.to_datetime(latest_price_date[0][0]).date()
+    return None
+
+
+def _merge_staged_prices(new_prices: pd.DataFrame, eod_exchange: str,
+                         exchanges: List[str]) -> Dict[str, int]:
+    """Stage one bulk payload and merge it into the price tables of its exchanges.
+
+    Args:
+        new_prices: Bulk daily prices returned by EODHD
+        eod_exchange: EODHD exchange code of the payload
+        exchanges: Local exchange codes served by eod_exchange
+
+    Returns:
+        Mapping of exchange code to number of rows written
+    """
+    years = sorted(pd.to_datetime(new_prices['Date']).dt.year.unique())
+    new_price_date = pd.to_datetime(new_prices['Date']).max().date()
+
+    # Freshness checks and table creation happen before the staging connection
+    targets = []
+    for exchange in exchanges:
+        latest_price_date = _get_latest_price_date(exchange, years[-1])
+        if latest_price_date is None:
+            logger.info(f"No existing prices for {exchange}. Consider historical update")
+            continue
+        if new_price_date <= latest_price_date:
+            logger.info(f"Prices for {exchange} already up to date")
+            continue
+        layouts = {year: _ensure_price_table(exchange, year) for year in years}
+        close_prices.ensure_close_price_table(DB_CONFIG, exchange)
+        targets.append((exchange, latest_price_date, layouts))
+
+    written = {}
+    changes = []
+    ticker_ids = ', '.join(["CONCAT(s.Ticker, '_', %s)"] * len(exchanges))
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.execute(STAGING_TABLE_SCHEMA)
+        cursor.executemany(
+            f"INSERT INTO prices_staging ({', '.join(STAGING_COLUMNS)}) "
+            f"VALUES ({', '.join(['%s'] * len(STAGING_COLUMNS))});",
+            database_utils.dataframe_to_rows(new_prices[STAGING_COLUMNS])
+        )
+
+        for exchange, latest_price_date, layouts in targets:
+            written[exchange] = 0
+            for year in years:
+                merge_query = MERGE_COMPACT_PRICES_QUERY if layouts[year] else MERGE_PRICES_QUERY
+                cursor.execute(
+                    merge_query.format(exchange=exchange, year=year),
+                    (exchange, int(year), latest_price_date, MAX_TIER)
+                )
+                written[exchange] += cursor.rowcount
+                cursor.execute(CHANGED_TICKERS_QUERY, (exchange, int(year), latest_price_date, MAX_TIER))
+                changes += [(exchange, f"prices_{exchange}_{year}", *row) for row in cursor.fetchall()]
+            close_prices.upsert_close_prices_from(
+                cursor, exchange, CLOSE_PRICES_QUERY, (exchange, latest_price_date, MAX_TIER)
+            )
+
+        cursor.execute(
+            UNKNOWN_TICKERS_QUERY.format(ticker_ids=ticker_ids),
+            (eod_exchange, *exchanges)
+        )
+        unknown = cursor.rowcount
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS prices_staging;")
+
+    # Recorded once the merge is committed, consumers never see rows ahead of the prices
+    change_log.record_changes(DB_CONFIG, 'daily', pd.DataFrame(changes, columns=[
+        'Exchange', 'Table_Name', 'Ticker_ID', 'Date_From', 'Date_To', 'Row_Count'
+    ]))
+    if unknown:
+        logger.warning(f"{unknown} rows for unknown tickers on {eod_exchange} stored in prices_unknown_tickers")
+    return written
 
 
 def daily_price_update() -> None:
     """Update daily prices for all exchanges."""
-    current_year = datetime.now().year
+    database_utils.execute_query(DB_CONFIG, UNKNOWN_TICKERS_SCHEMA)
 
     # Get code and eod_code from global exchanges table iterate over
     exchanges = _get_exchange_codes()
-    
-    for exchange_code in exchanges.itertuples():
-        
-        exchange = exchange_code.Exchange
-        eod_exchange = exchange_code.EoDHD_Exchange
-        
+    tiers = universe.exchange_tiers(DB_CONFIG)
+    exchanges = exchanges.sort_values(
+        'EoDHD_Exchange', key=lambda codes: codes.map(tiers).fillna(MAX_TIER), kind='stable'
+    )
+    budget = universe.ApiBudget(EODHD_CONFIG['api_key'])
+
+    # One bulk request per EODHD code. US stocks ('NASDAQ', 'NYSE') share 'US'
+    for eod_exchange, group in exchanges.groupby('EoDHD_Exchange', sort=False):
+        exchange_list = group['Exchange'].tolist()
+        tier = tiers.get(eod_exchange, MAX_TIER)
+        if not budget.allows(tier, eodhd_utils.BULK_REQUEST_COST):
+            logger.warning(f"API budget low, deferring tier {tier} exchanges {exchange_list}")
+            continue
+        budget.spend(eodhd_utils.BULK_REQUEST_COST)
+
         try:
-            # Get new price data from EoDHD for whole exchange. US stocks ('NASDAQ', 'NYSE') handled as 'US'
-            new_prices = eodhd_utils.retrieve_daily_price(
-                eod_exchange, exchange,
-                EODHD_CONFIG['api_key']
-            )
-            tickers = _get_db_tickers(DB_CONFIG, exchange)
-            df = new_prices.merge(tickers, on='Ticker', how='left')
-            
-            df['Ticker_ID'] = f'{df['Ticker'].iloc[0]}_{exchange}' 
-            new_prices_final = df[PRICE_COLUMNS_SORTED]
-            
-            if new_prices_final is None:
-                logger.warning(f"No new price data for {exchange}, using EoD Code {eod_exchange}")
-                continue
-            
-            new_price_date = pd.to_datetime(new_prices['Date'].iloc[0]).date()
-            # Ensure price table exists
-            _ensure_price_table(exchange, current_year)
-           
-            # Get latest existing price data from local database
-            latest_price_date = _get_latest_price_date(exchange, current_year)
-                        
-            if latest_price_date is None:
-                logger.info(f"No existing prices for {exchange}. Consider historical update")
-                continue
-            
-            # Update if new data available
-            if new_price_date > latest_price_date:
-                              
-                database_utils.add_stock_price(
-                    new_prices_final, 
-                    exchange, 
-                    current_year, 
-                    DB_CONFIG
+            with profiling.section(eod_exchange):
+                # Get new price data from EoDHD for whole exchange
+                new_prices = eodhd_utils.retrieve_daily_price(
+                    eod_exchange, eod_exchange,
+                    EODHD_CONFIG['api_key']
                 )
-                logger.debug(f"Updated prices for {exchange} for {new_price_date}")
-            else:
-                logger.info(f"Prices for {exchange} already up to date")
-                
-                
+
+                if new_prices is None or new_prices.empty:
+                    logger.warning(f"No new price data for {exchange_list}, using EoD Code {eod_exchange}")
+                    continue
+
+                new_prices = price_validation.validate_and_quarantine(
+                    new_prices, eod_exchange, 'daily', DB_CONFIG
+                )
+                if new_prices.empty:
+                    logger.warning(f"No valid price data for {exchange_list}, using EoD Code {eod_exchange}")
+                    continue
+
+                written = _merge_staged_prices(new_prices, eod_exchange, exchange_list)
+                for exchange, rows in written.items():
+                    logger.debug("Updated %s prices for %s using EoD Code %s", rows, exchange, eod_exchange)
+                    if rows:
+                        query_cache.invalidate(
+                            query_cache.SCOPE_PRICES, exchange,
+                            new_prices['Date'].min(), new_prices['Date'].max()
+                        )
+
         except Exception as e:
-            logger.error(f"Error updating {exchange} using EoD Code {eod_exchange}: {str(e)}", exc_info=True)
+            logger.error(f"Error updating {exchange_list} using EoD Code {eod_exchange}: {str(e)}", exc_info=True)
             continue
 
 if __name__ == "__main__":
-    daily_price_update()
\ No newline at end of file
+    daily_price_update()
@@ -2,22 +2,23 @@
 Exchange Update Module
 
 This module handles the synchronization of exchange data between EODHD API
-and the local database. It checks for new exchanges and adds them to the database.
+and the local database. The API exchange list is loaded into a staging table
+and reconciled on the server: new exchanges are added, changed exchanges are
+updated and exchanges that disappeared from the API are marked inactive.
 """
 
 # Standard library imports
 from pathlib import Path
 import sys
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 # Third-party imports
-import numpy as np
 import pandas as pd
 
 # Local application imports
 from config.settings.paths import PATHS
 from config.connections.eodhd_access import EODHD_CONFIG
-from lib.data_centre.database.utils import eodhd_utils, database_utils
+from lib.data_centre.database.utils import eodhd_utils, database_utils, schema, query_cache, reference_data
 from config.settings.logging import logger_factory
 
 logger = logger_factory.get_logger('database', module_name=__name__)
@@ -42,6 +43,12 @@ TABLE_COLUMNS_SORTED = [
 
 US_STOCKS = ['NASDAQ', 'NYSE', 'PINK', 'NMFQS', 'NYSE_ARCA', 'NYSE_MKT']
 
+# Columns whose change counts as a change of the exchange
+HASH_COLUMNS = [
+    'Name', 'EoDHD_Exchange', 'OperatingMIC', 'Country', 'Currency',
+    'CountryISO2', 'CountryISO3'
+]
+
 # SQL Queries
 CREATE_TABLE_QUERY = """
     CREATE TABLE IF NOT EXISTS global_exchanges (
@@ -55,26 +62,21 @@ CREATE_TABLE_QUERY = """
         CountryISO3 VARCHAR(255),
         Source VARCHAR(255),
         Date_Updated DATETIME,
+        Row_Hash CHAR(32),
+        Is_Active TINYINT(1) NOT NULL DEFAULT 1,
         PRIMARY KEY (Exchange)
     );
 """
 
-
-def _get_db_exchanges(db_config: Dict[str, str]) -> pd.DataFrame:
-    """Retrieve current exchanges from database.
-    
-    Args:
-        db_config: Database configuration dictionary
-    
-    Returns:
-        DataFrame containing current exchange data
-    """
-    query = 'SELECT * FROM global_exchanges;'
-    data = database_utils.retrieve_table(db_config, query)
-    return pd.DataFrame(data, columns=TABLE_COLUMNS)
+# Tables created before change detection existed
+ALTER_TABLE_QUERY = """
+    ALTER TABLE global_exchanges
+        ADD COLUMN IF NOT EXISTS Row_Hash CHAR(32),
+        ADD COLUMN IF NOT EXISTS Is_Active TINYINT(1) NOT NULL DEFAULT 1;
+"""
 
 
-def _get_eodhd_exchanges(api_key: str) -> pd.DataFrame:
+def _get_eodhd_exchanges(api_key: str) -> Optional[pd.DataFrame]:
     """Retrieve and clean exchange data from EODHD.
     
     Args:
@@ -84,56 +86,19 @@ def _get_eodhd_exchanges(api_key: str) -> pd.DataFrame:
         DataFrame containing filtered EODHD exchange data
     """
     df = eodhd_utils.retrieve_exchanges(api_key)
-    df['EoDHD_Exchange']=df['Code'].apply(lambda x: 'US' if x in US_STOCKS else x)
+    if df is None:
+        return None
+    df['EoDHD_Exchange'] = schema.map_eodhd_exchange(df['Code'], US_STOCKS)
     df.columns = TABLE_COLUMNS
     df = df[TABLE_COLUMNS_SORTED]
     return df[~df['Exchange'].isin(EXCLUDED_EXCHANGES)]
 
 
-def _find_missing_exchanges(eod_data: pd.DataFrame, db_data: pd.DataFrame) -> pd.DataFrame:
-    """Identify exchanges present in EODHD but missing from database.
-    
-    Args:
-        eod_data: DataFrame from EODHD API
-        db_data: DataFrame from database
-    
-    Returns:
-        DataFrame containing missing exchanges
-    """
-    eod_codes = eod_data['Exchange']
-
-    # For testing purposes, we can use a predefined set of codes
-    # eod_codes = pd.Series(['IR', 'LUSE', 'NASDAQ', 'NYSE']) # TESTING ONLY REMOVE AT DEPLOYMENT
-    
-    db_codes = db_data['Exchange']
-    stacked_codes = pd.concat([eod_codes, db_codes], axis=0)
-    missing_codes = stacked_codes.drop_duplicates(keep=False)
-    return eod_data[eod_data['Exchange'].isin(missing_codes)]
-
-
-def _prepare_for_upload(df: pd.DataFrame) -> tuple[str, str]:
-    """Format exchange data for SQL insert.
-    
-    Args:
-        df: DataFrame to format
-    
-    Returns:
-        Tuple of (column_string, values_string) for SQL INSERT
-    """
-    columns = ', '.join(df.columns.values)
-    values = (df.replace({np.nan: 'None'})
-             .values.tolist()
-             .__str__()
-             .replace('[', '(')
-             .replace(']', ')')
-             [1:-1])
-    return columns, values
-
 def exchanges_update(db_config: Dict[str, str]) -> None:
-    """Update database with new exchanges from EODHD.
+    """Synchronise the database exchanges with EODHD.
     
-    This function compares the current database exchange list with EODHD's
-    exchange list and adds any missing exchanges to the database.
+    The EODHD exchange list is reconciled with the database: missing exchanges
+    are added, changed ones updated and vanished ones marked inactive.
     
     Args:
         db_config: Database configuration dictionary
@@ -144,27 +109,28 @@ def exchanges_update(db_config: Dict[str, str]) -> None:
     try:
         # Initialize database table if needed
         database_utils.execute_query(db_config, CREATE_TABLE_QUERY)
+        database_utils.execute_query(db_config, ALTER_TABLE_QUERY)
         logger.debug("Ensured global_exchanges table exists")
         
-        # Get current database data
-        db_exchanges = _get_db_exchanges(db_config)
-        logger.debug("Retrieved current exchange data from database")
-        
         # Get EODHD data
         eod_exchanges = _get_eodhd_exchanges(EODHD_CONFIG['api_key'])
+        if eod_exchanges is None or eod_exchanges.empty:
+            logger.warning("No exchange data retrieved from EODHD")
+            return
         logger.debug("Retrieved and filtered EODHD exchange data")
         
-        # Find missing exchanges
-        missing_exchanges = _find_missing_exchanges(eod_exchanges, db_exchanges)
-        
-        # Update database if needed
-        if not missing_exchanges.empty:
-            columns, values = _prepare_for_upload(missing_exchanges)
-            query = f'INSERT INTO global_exchanges ({columns}) VALUES {values};'
-            database_utils.execute_query(db_config, query)
-            logger.info(f"Added {len(missing_exchanges)} new exchanges to database")
-        else:
-            logger.info("No new exchanges to add")
+        # Reconcile with the database in one pass on the server
+        stats = database_utils.reconcile_table(
+            db_config, 'global_exchanges', 'Exchange', TABLE_COLUMNS_SORTED,
+            HASH_COLUMNS, eod_exchanges
+        )
+        logger.info(
+            f"Exchange sync: {stats['inserted']} added, {stats['updated']} updated, "
+            f"{stats['deactivated']} marked inactive"
+        )
+        if any(stats.values()):
+            query_cache.invalidate(query_cache.SCOPE_EXCHANGES)
+            reference_data.refresh(db_config)
             
     except Exception as e:
         logger.error("Failed to update exchanges", exc_info=True)
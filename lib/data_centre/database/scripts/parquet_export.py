@@ -0,0 +1,247 @@
+"""Parquet Export Module
+
+Exports the prices_{exchange}_{year} tables to compressed Parquet files
+partitioned by exchange and year:
+
+    data/parquet/prices/exchange={exchange}/year={year}/part-0.parquet
+
+Each partition records a high-water mark in data/parquet/prices/_manifest.json.
+An exchange whose ingest watermark (see query_cache.invalidate) has not moved
+since the last export is skipped without touching its tables. Otherwise the
+CHECKSUM TABLE of every year table is compared with the manifest and only new
+or changed partitions are written again.
+
+Rows are read with an unbuffered cursor and written as one row group per
+chunk of CHUNK_ROWS, so memory stays bounded on the largest partitions. A
+partition is written to a temporary file and renamed into place.
+
+Usage:
+    python -m lib.data_centre.database.scripts.parquet_export [--exchange LSE] [--full]
+"""
+
+# Standard library imports
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Third-party imports
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_layout, reference_data
+from config.connections.database_access import DB_CONFIG
+from config.settings.paths import PATHS
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+EXPORT_DIR = PATHS['DATA_DIR'] / 'parquet' / 'prices'
+CHUNK_ROWS = 250000
+COMPRESSION = 'zstd'
+
+# DECIMAL columns are cast on the server so the driver returns floats
+PRICE_SCHEMA = pa.schema([
+    ('Ticker_ID', pa.string()),
+    ('Ticker', pa.string()),
+    ('Exchange', pa.string()),
+    ('EoDHD_Exchange', pa.string()),
+    ('Date', pa.date32()),
+    ('Open', pa.float64()),
+    ('High', pa.float64()),
+    ('Low', pa.float64()),
+    ('Close', pa.float64()),
+    ('Adjusted_Close', pa.float64()),
+    ('Volume', pa.int64()),
+])
+
+SELECT_PRICES_QUERY = """
+    SELECT Ticker_ID, Ticker, Exchange, EoDHD_Exchange, Date,
+           CAST(Open AS DOUBLE), CAST(High AS DOUBLE), CAST(Low AS DOUBLE),
+           CAST(Close AS DOUBLE), CAST(Adjusted_Close AS DOUBLE), Volume
+    FROM {source};
+"""
+
+WATERMARKS_QUERY = """
+    SELECT Exchange, Watermark FROM ingest_watermarks WHERE Scope = 'prices';
+"""
+
+
+def _manifest_path(export_dir: Path) -> Path:
+    return export_dir / '_manifest.json'
+
+
+def _load_manifest(export_dir: Path) -> Dict[str, Any]:
+    path = _manifest_path(export_dir)
+    if not path.exists():
+        return {'partitions': {}}
+    return json.loads(path.read_text())
+
+
+def _save_manifest(export_dir: Path, manifest: Dict[str, Any]) -> None:
+    path = _manifest_path(export_dir)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp, path)
+
+
+def _partition_dir(export_dir: Path, exchange: str, year: int) -> Path:
+    return export_dir / f"exchange={exchange}" / f"year={year}"
+
+
+def _get_exchanges() -> List[str]:
+    """Retrieve list of exchange codes from the shared reference data."""
+    return reference_data.get_reference().exchange_list(active_only=False)
+
+
+def _ingest_watermarks() -> Dict[str, int]:
+    try:
+        return {exchange: int(mark) for exchange, mark
+                in database_utils.retrieve_table(DB_CONFIG, WATERMARKS_QUERY)}
+    except Exception:
+        # No ingest has recorded a watermark yet
+        return {}
+
+
+def _checksums(tables: List[str]) -> Dict[str, Optional[int]]:
+    """CHECKSUM TABLE of each year table, computed on the server."""
+    if not tables:
+        return {}
+    rows = database_utils.retrieve_table(DB_CONFIG, f"CHECKSUM TABLE {', '.join(tables)};")
+    return {name.rsplit('.', 1)[-1]: checksum for name, checksum in rows}
+
+
+def _to_batch(rows: List[tuple]) -> pa.RecordBatch:
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, PRICE_SCHEMA)],
+        schema=PRICE_SCHEMA
+    )
+
+
+def export_partition(table: str, destination: Path, compact: bool = False) -> int:
+    """Stream one year table into a Parquet file.
+
+    Compact tables are exported with the wide identifier columns.
+
+    Returns:
+        Number of rows written
+    """
+    destination.mkdir(parents=True, exist_ok=True)
+    target = destination / 'part-0.parquet'
+    tmp = destination / 'part-0.parquet.tmp'
+    rows_written = 0
+
+    try:
+        with database_utils.db_connection(DB_CONFIG) as cursor, \
+                pq.ParquetWriter(tmp, PRICE_SCHEMA, compression=COMPRESSION) as writer:
+            cursor.execute(SELECT_PRICES_QUERY.format(source=price_layout.price_source(table, compact)))
+            while True:
+                rows = cursor.fetchmany(CHUNK_ROWS)
+                if not rows:
+                    break
+                writer.write_batch(_to_batch(rows), row_group_size=CHUNK_ROWS)
+                rows_written += len(rows)
+    except Exception:
+        tmp.unlink(missing_ok=True)
+        raise
+
+    os.replace(tmp, target)
+    return rows_written
+
+
+def parquet_export(exchanges: Optional[List[str]] = None, full: bool = False,
+                   export_dir: Path = EXPORT_DIR) -> Dict[str, int]:
+    """Export new or changed price partitions to Parquet.
+
+    Args:
+        exchanges: Exchange codes to export, defaults to all
+        full: Export every partition of the selected exchanges regardless of the manifest
+        export_dir: Root directory of the dataset
+
+    Returns:
+        Counts of written, skipped and removed partitions and rows written
+    """
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    # A full export ignores the stored entries of the selected exchanges only,
+    # the manifest keeps those of every other exchange
+    manifest = _load_manifest(export_dir)
+    partitions = manifest.setdefault('partitions', {})
+    exchange_marks = manifest.setdefault('exchange_watermarks', {})
+    watermarks = _ingest_watermarks()
+    stats = {'written': 0, 'skipped': 0, 'removed': 0, 'rows': 0}
+
+    for exchange in exchanges or _get_exchanges():
+        # Writes to every exchange are recorded under ''
+        mark = f"{watermarks.get(exchange, 0)}.{watermarks.get('', 0)}"
+        known = [key for key in partitions if key.split('/')[0] == exchange]
+        if not full and known and exchange_marks.get(exchange) == mark:
+            stats['skipped'] += len(known)
+            continue
+
+        layouts = dict(price_layout.year_tables(DB_CONFIG, exchange))
+        tables = list(layouts)
+        checksums = _checksums(tables)
+        failed = 0
+        for table in tables:
+            year = int(table.rsplit('_', 1)[1])
+            key = f"{exchange}/{year}"
+            checksum = checksums.get(table)
+            previous = partitions.get(key)
+            destination = _partition_dir(export_dir, exchange, year)
+            if (not full and previous and checksum is not None
+                    and previous['checksum'] == checksum
+                    and (destination / 'part-0.parquet').exists()):
+                stats['skipped'] += 1
+                continue
+
+            try:
+                rows = export_partition(table, destination, layouts[table])
+            except Exception as e:
+                logger.error(f"Failed to export {table}: {e}", exc_info=True)
+                failed += 1
+                continue
+            partitions[key] = {
+                'table': table,
+                'checksum': checksum,
+                'rows': rows,
+                'exported': datetime.now().isoformat(timespec='seconds'),
+            }
+            stats['written'] += 1
+            stats['rows'] += rows
+            logger.debug("Exported %s rows of %s", rows, table)
+
+        # Partitions whose table no longer exists
+        for key in known:
+            if f"prices_{exchange}_{key.split('/')[1]}" not in tables:
+                shutil.rmtree(_partition_dir(export_dir, exchange, int(key.split('/')[1])),
+                              ignore_errors=True)
+                del partitions[key]
+                stats['removed'] += 1
+
+        # A failed partition is retried on the next run even if nothing changed
+        if failed:
+            exchange_marks.pop(exchange, None)
+        else:
+            exchange_marks[exchange] = mark
+        _save_manifest(export_dir, manifest)
+
+    logger.info(
+        f"Parquet export: {stats['written']} partitions written ({stats['rows']} rows), "
+        f"{stats['skipped']} unchanged, {stats['removed']} removed"
+    )
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export price tables to Parquet.')
+    parser.add_argument('--exchange', action='append', help='Exchange to export, repeatable')
+    parser.add_argument('--full', action='store_true', help='Rewrite every partition')
+    parser.add_argument('--out', type=Path, default=EXPORT_DIR, help='Dataset root directory')
+    args = parser.parse_args()
+    parquet_export(args.exchange, args.full, args.out)
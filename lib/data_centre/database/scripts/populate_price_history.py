@@ -1,17 +1,26 @@
 """Price History Population Module
 
 This module populates historical price data for all tickers across exchanges.
+Histories are written through a shared PriceWriter, so the year tables get
+one large write per flush instead of one INSERT per ticker and year.
+
+Tickers are fetched in tier order (see utils/universe.py) and each tier is
+written before the next one starts. Tiers whose share of the daily API limit
+is used up are left for the next run.
 """
 
 # Standard library imports
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, List, Optional
 
 # Third-party imports
 import pandas as pd
 
 # Local application imports
-from lib.data_centre.database.utils import database_utils, eodhd_utils
+from lib.data_centre.database.utils import (
+    database_utils, eodhd_utils, price_validation, schema, price_layout, universe
+)
+from lib.data_centre.database.utils.price_writer import PriceWriter
 from config.connections.database_access import DB_CONFIG
 from config.connections.eodhd_access import EODHD_CONFIG
 from config.settings.logging import logger_factory
@@ -19,77 +28,109 @@ from config.settings.logging import logger_factory
 logger = logger_factory.get_logger('database', module_name=__name__)
 
 # Constants
-TABLE_COLUMNS_SORTED = [
-    'Ticker_ID', 'Ticker', 'Exchange', 'EoDHD_Exchange',
-    'Date', 'Open', 'High', 'Low', 'Close', 'Adjusted_Close', 'Volume'
-]
+TABLE_COLUMNS_SORTED = price_layout.PRICE_COLUMNS
 
-def _get_exchange_codes() -> List[str]:
+def _get_exchange_codes(access: Dict[str, Any] = DB_CONFIG) -> List[str]:
     """Retrieve list of exchange codes from database."""
     query = 'SELECT Code FROM global_exchanges;'
-    data = database_utils.retrieve_table(DB_CONFIG, query)
+    data = database_utils.retrieve_table(access, query)
     return pd.DataFrame(data, columns=['Code'])['Code'].tolist()
 
-def _get_ticker_codes():
-    """Retrieve ticker codes for a specific exchange."""
-    query = f"SELECT Ticker, Exchange, EoDHD_Exchange FROM global_tickers;"
-    data = database_utils.retrieve_table(DB_CONFIG, query)
-    data = pd.DataFrame(data, columns=['Ticker', 'Exchange', 'EoDHD_Exchange'])
-    return data
-
-def _create_price_table(exchange: str, year: int) -> None:
-    """Create price table for specific exchange and year if not exists."""
-    query = f"""
-        CREATE TABLE IF NOT EXISTS prices_{exchange}_{year} (
-            Ticker_ID VARCHAR(255),
-            Ticker VARCHAR(255),
-            Exchange VARCHAR(255),
-            EoDHD_Exchange VARCHAR(255),
-            Date DATE,
-            Open DECIMAL(20,6),
-            High DECIMAL(20,6),
-            Low DECIMAL(20,6),
-            Close DECIMAL(20,6),
-            Adjusted_Close DECIMAL(20,6),
-            Volume BIGINT
-        );
+def _get_ticker_codes(access: Dict[str, Any] = DB_CONFIG) -> pd.DataFrame:
+    """Retrieve the tickers of the universe with their tier, in fetch order."""
+    return universe.ticker_universe(access)
+
+def _populate_ticker(ticker: str, exchange: str, eod_exchange: str, date_to: str,
+                     writer: Optional[PriceWriter] = None) -> bool:
+    """Fetch the full price history of one ticker and write it to the year tables.
+
+    Args:
+        ticker: Ticker code
+        exchange: Exchange code used in the local database
+        eod_exchange: Exchange code used by EODHD
+        date_to: Last date (YYYY-MM-DD) to request
+        writer: Writer to buffer the rows in, written right away to DB_CONFIG if None
+
+    Returns:
+        True if price data was retrieved and written, False otherwise
     """
-    database_utils.execute_query(DB_CONFIG, query)
+    # Get historical price data
+    price_data = eodhd_utils.retrieve_historical_price(
+        eod_exchange, ticker, date_to, EODHD_CONFIG['api_key']
+    )
+
+    if price_data is None:
+        logger.info(f"Unable to retrieve historical prices for ({ticker}) using ({eod_exchange}) from EODHD.com")
+        return False
+    price_data['Ticker'] = ticker
+    price_data['Exchange'] = exchange
+    price_data['EoDHD_Exchange'] = eod_exchange
+    price_data['Ticker_ID'] = f'{ticker}_{exchange}'
+    price_data = schema.to_compact(price_data[TABLE_COLUMNS_SORTED], schema.PRICE_DTYPES)
+    price_data['Date'] = pd.to_datetime(price_data['Date'])
+
+    price_data = price_validation.validate_and_quarantine(
+        price_data, exchange, 'history', writer.access if writer else DB_CONFIG,
+        key_columns=('Ticker_ID', 'Date')
+    )
+    if price_data.empty:
+        logger.info(f"No valid historical prices for ({ticker}) on ({exchange})")
+        return False
 
-def populate_price_history() -> None:
-    """Populate historical price data for all tickers across exchanges."""
+    if writer is None:
+        with PriceWriter(DB_CONFIG) as single:
+            single.add(price_data)
+    else:
+        writer.add(price_data)
+    logger.debug("Loaded historical prices for %s on %s", ticker, exchange)
+    return True
+
+def populate_price_history(access: Dict[str, Any] = DB_CONFIG, publish: bool = True,
+                           complete: bool = False) -> int:
+    """Populate historical price data for all tickers across exchanges.
+
+    Args:
+        access: Database connection configuration dictionary
+        publish: Record the changes and update the close price tables and the
+            query cache while loading, off when loading into a shadow schema
+        complete: Load every tier, ignoring the tier reserves of the API
+            budget, and fail before the first request if the budget left
+            today cannot cover the whole universe
+
+    Returns:
+        Number of tickers not loaded for lack of API budget
+
+    Raises:
+        RuntimeError: If complete is set and the budget is too small
+    """
     today = datetime.now().strftime('%Y-%m-%d')
-           
-    ticker = _get_ticker_codes()
-    for tickers in ticker.itertuples():
-        ticker = tickers.Ticker
-        eod_exchange = tickers.EoDHD_Exchange
-        exchange = tickers.Exchange
-            
-        # Get historical price data
-        price_data = eodhd_utils.retrieve_historical_price(
-            eod_exchange, ticker, today, EODHD_CONFIG['api_key']
-        )
-        
-        if price_data is None:
-            logger.info(f"Unable to retrieve historical prices for ({ticker}) using ({eod_exchange}) from EODHD.com")
-            continue
-        price_data['Ticker'] = ticker
-        price_data['Exchange'] = exchange
-        price_data['EoDHD_Exchange'] = eod_exchange
-        price_data['Ticker_ID'] = f'{ticker}_{exchange}'
-        price_data = price_data[TABLE_COLUMNS_SORTED]
-                
-        # Process each year's data
-        price_data['Date'] = pd.to_datetime(price_data['Date'])
-        
-        for year in sorted(price_data['Date'].dt.year.unique(), reverse=True):
-            _create_price_table(exchange, year)
-            yearly_data = price_data[price_data['Date'].dt.year == year]
-            
-            database_utils.add_stock_price(yearly_data, exchange, year, DB_CONFIG)
-        
-        logger.debug(f"Updated historical prices for {ticker} on {exchange}")
+
+    ticker = _get_ticker_codes(access)
+    budget = universe.ApiBudget(EODHD_CONFIG['api_key'], reserves=not complete)
+    if complete and budget.remaining is not None and budget.remaining < len(ticker):
+        raise RuntimeError(f"API budget of {budget.remaining} calls left today cannot "
+                           f"load the history of {len(ticker)} tickers")
+    deferred = 0
+    with PriceWriter(access, publish=publish) as writer:
+        for tier, group in ticker.groupby('Tier', sort=True):
+            fetched = 0
+            for tickers in group.itertuples():
+                if not budget.allows(tier):
+                    break
+                _populate_ticker(tickers.Ticker, tickers.Exchange, tickers.EoDHD_Exchange, today, writer)
+                budget.spend()
+                fetched += 1
+            # A tier is in the tables before the next one is fetched
+            writer.flush()
+            logger.info(f"Loaded {fetched} of {len(group)} tier {tier} tickers")
+            if fetched < len(group):
+                # Reserves grow with the tier, so the later tiers are skipped too.
+                # No resume point is kept, the next run starts again at tier 1
+                deferred = len(group) - fetched + int((ticker['Tier'] > tier).sum())
+                logger.warning(f"API budget low, {deferred} tickers not loaded in this run")
+                break
+    logger.info("Wrote %s historical price rows", writer.rows_written)
+    return deferred
 
 if __name__ == "__main__":
     populate_price_history()
\ No newline at end of file
@@ -0,0 +1,666 @@
+"""Price Gap Detection and Repair Module
+
+This module finds trading days missing from the price history of each ticker
+and fetches exactly those days again from EODHD.
+
+The trading calendar of an exchange is its weekdays minus the holidays in
+exchange_holidays, which are loaded from the EODHD exchange details and
+learned from bulk requests that return no prices. Weekdays older than
+HOLIDAY_INFERENCE_DAYS on which no ticker of the exchange has a price are
+taken as holidays too, so the history before the holiday list does not show
+up as exchange-wide gaps.
+
+Each year table is read once as (Ticker_ID, day) pairs and turned into a
+ticker x trading day presence matrix, so gaps are found with array
+operations instead of per-ticker queries. A ticker is expected to trade on
+every trading day between its first and last stored price, and active
+tickers up to the latest price of their exchange. Runs of missing days are
+stored in price_gaps as the gap report.
+
+Repairs use the cheaper of two request types, in EODHD API calls: one
+per-ticker range request (TICKER_REQUEST_COST) per ticker, or one bulk
+request for a day of the whole exchange (BULK_REQUEST_COST). Days are ranked
+by how many tickers miss them and the planner picks the number of bulk days
+that minimises the total cost, every ticker with a gap left is requested as
+one range. Gaps still open after MAX_REPAIR_ATTEMPTS are left alone.
+
+Usage:
+    python -m lib.data_centre.database.scripts.price_gaps scan [--exchange LSE]
+    python -m lib.data_centre.database.scripts.price_gaps repair [--exchange LSE] [--dry-run]
+"""
+
+# Standard library imports
+import argparse
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import (
+    database_utils, eodhd_utils, price_validation, price_layout, profiling, reference_data
+)
+from lib.data_centre.database.utils.price_writer import PriceWriter
+from config.connections.database_access import DB_CONFIG
+from config.connections.eodhd_access import EODHD_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+FETCH_ROWS = 250000
+HOLIDAY_INFERENCE_DAYS = 60
+# Active tickers without a price for longer than this are reported as stale
+# instead of being repaired up to the latest price of the exchange
+STALE_TICKER_DAYS = 30
+MAX_REPAIR_ATTEMPTS = 3
+BULK_REQUEST_COST = eodhd_utils.BULK_REQUEST_COST
+TICKER_REQUEST_COST = 1
+
+CREATE_HOLIDAYS_QUERY = """
+    CREATE TABLE IF NOT EXISTS exchange_holidays (
+        Exchange VARCHAR(255),
+        Date DATE,
+        Holiday VARCHAR(255),
+        Source VARCHAR(16),
+        Date_Updated DATETIME,
+        PRIMARY KEY (Exchange, Date)
+    );
+"""
+
+UPSERT_HOLIDAY_QUERY = """
+    INSERT INTO exchange_holidays (Exchange, Date, Holiday, Source, Date_Updated)
+    VALUES (%s, %s, %s, %s, NOW())
+    ON DUPLICATE KEY UPDATE
+        Holiday = VALUES(Holiday),
+        Source = VALUES(Source),
+        Date_Updated = NOW();
+"""
+
+SELECT_HOLIDAYS_QUERY = "SELECT Date FROM exchange_holidays WHERE Exchange = %s;"
+
+CREATE_GAPS_QUERY = """
+    CREATE TABLE IF NOT EXISTS price_gaps (
+        Exchange VARCHAR(255),
+        Ticker_ID VARCHAR(255),
+        Gap_Start DATE,
+        Gap_End DATE,
+        Missing_Days INT,
+        Attempts INT DEFAULT 0,
+        First_Seen DATETIME,
+        Last_Seen DATETIME,
+        PRIMARY KEY (Ticker_ID, Gap_Start),
+        INDEX idx_price_gaps_exchange (Exchange, Last_Seen)
+    );
+"""
+
+# Attempts survive rescans as long as the gap keeps its first day
+UPSERT_GAP_QUERY = """
+    INSERT INTO price_gaps (
+        Exchange, Ticker_ID, Gap_Start, Gap_End, Missing_Days, First_Seen, Last_Seen
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        Gap_End = VALUES(Gap_End),
+        Missing_Days = VALUES(Missing_Days),
+        Last_Seen = VALUES(Last_Seen);
+"""
+
+DELETE_CLOSED_GAPS_QUERY = "DELETE FROM price_gaps WHERE Exchange = %s AND Last_Seen < %s;"
+
+SELECT_ATTEMPTS_QUERY = "SELECT Ticker_ID, Gap_Start, Attempts FROM price_gaps WHERE Exchange = %s;"
+
+INCREMENT_ATTEMPTS_QUERY = """
+    UPDATE price_gaps SET Attempts = Attempts + 1
+    WHERE Ticker_ID = %s AND Gap_Start = %s;
+"""
+
+# Days as integers since 1970-01-01, much cheaper to fetch than DATE values
+PRESENCE_QUERY = "SELECT Ticker_ID, DATEDIFF(Date, '1970-01-01') FROM {table} WHERE Date IS NOT NULL;"
+COMPACT_PRESENCE_QUERY = "SELECT Ticker_Key, DATEDIFF(Date, '1970-01-01') FROM {table};"
+
+
+@dataclass
+class GapScan:
+    """Gaps of one exchange against its trading calendar.
+
+    Attributes:
+        exchange: Exchange code
+        calendar: Trading days scanned, as datetime64[D]
+        gaps: Ticker_ID, Gap_Start, Gap_End, Missing_Days, Start_Index and
+              End_Index (positions in calendar) of every run of missing days
+        tickers: Number of tickers with prices
+        stale: Active tickers whose prices stopped more than STALE_TICKER_DAYS ago
+        inferred_holidays: Weekdays without any price taken as holidays
+    """
+    exchange: str
+    calendar: np.ndarray
+    gaps: pd.DataFrame
+    tickers: int = 0
+    stale: List[str] = field(default_factory=list)
+    inferred_holidays: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'exchange': self.exchange,
+            'tickers': self.tickers,
+            'tickers_with_gaps': int(self.gaps['Ticker_ID'].nunique()),
+            'gaps': len(self.gaps),
+            'missing_days': int(self.gaps['Missing_Days'].sum()),
+            'stale_tickers': len(self.stale),
+            'inferred_holidays': self.inferred_holidays,
+        }
+
+
+@dataclass
+class RepairPlan:
+    """EODHD requests that fill the gaps of one EODHD exchange code.
+
+    Attributes:
+        eod_exchange: EODHD exchange code
+        missing: Exchange, Ticker_ID and Date of every missing price
+        bulk_dates: Days requested for the whole exchange
+        ticker_ranges: Exchange, Ticker_ID, Date_From and Date_To of each
+                       per-ticker range request
+        cost: API calls of the plan
+        ticker_only_cost: API calls if every ticker was requested on its own
+    """
+    eod_exchange: str
+    missing: pd.DataFrame
+    bulk_dates: List[date]
+    ticker_ranges: pd.DataFrame
+    cost: int
+    ticker_only_cost: int
+
+
+def _get_exchange_codes() -> pd.DataFrame:
+    """Retrieve list of exchange codes from the shared reference data."""
+    return reference_data.get_reference().exchange_codes(active_only=False)
+
+
+def _ensure_tables() -> None:
+    database_utils.execute_query(DB_CONFIG, CREATE_HOLIDAYS_QUERY)
+    database_utils.execute_query(DB_CONFIG, CREATE_GAPS_QUERY)
+
+
+def _holidays(exchange: str) -> np.ndarray:
+    rows = database_utils.retrieve_table(DB_CONFIG, SELECT_HOLIDAYS_QUERY, (exchange,))
+    return np.array([row[0] for row in rows], dtype='datetime64[D]')
+
+
+def _read_presence(table: str, compact: bool, key_ids: Dict[int, str]):
+    """Read the (Ticker_ID, day) pairs of one year table.
+
+    Returns:
+        Ticker_IDs and days since 1970-01-01 as two arrays
+    """
+    ids, days = [], []
+    query = COMPACT_PRESENCE_QUERY if compact else PRESENCE_QUERY
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.execute(query.format(table=table))
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            chunk_ids, chunk_days = zip(*rows)
+            ids.extend(chunk_ids)
+            days.extend(chunk_days)
+
+    ids = pd.Series(ids, dtype=object)
+    if compact:
+        ids = ids.map(key_ids)
+    return ids.to_numpy(dtype=object), np.asarray(days, dtype='int64')
+
+
+def _year_calendar(year: int, last_day: np.datetime64, holidays: np.ndarray,
+                   days: np.ndarray, cutoff: np.datetime64):
+    """Trading days of one year table.
+
+    Returns:
+        Calendar as days since 1970-01-01 and the number of inferred holidays
+    """
+    start = np.datetime64(f'{year}-01-01', 'D')
+    end = min(np.datetime64(f'{year}-12-31', 'D'), last_day)
+    if end < start:
+        return np.empty(0, dtype='int64'), 0
+    weekdays = np.arange(start, end + 1, dtype='datetime64[D]')
+    weekdays = weekdays[np.is_busday(weekdays, holidays=holidays)].astype('int64')
+
+    traded = np.zeros(len(weekdays), dtype=bool)
+    positions = np.searchsorted(weekdays, days)
+    on_weekday = positions < len(weekdays)
+    on_weekday[on_weekday] = weekdays[positions[on_weekday]] == days[on_weekday]
+    traded[positions[on_weekday]] = True
+
+    inferred = ~traded & (weekdays < cutoff.astype('int64'))
+    return weekdays[~inferred], int(inferred.sum())
+
+
+def _runs(missing: np.ndarray):
+    """Start and end column of every run of True in each row of a matrix.
+
+    Returns:
+        Row, start column and end column arrays, in row order
+    """
+    padded = np.zeros((missing.shape[0], missing.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = missing
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends - 1
+
+
+def scan_exchange(exchange: str, since: Optional[int] = None) -> GapScan:
+    """Find the missing trading days of every ticker of an exchange.
+
+    Args:
+        exchange: Exchange code
+        since: First year to scan, defaults to the whole history
+
+    Returns:
+        Gap scan of the exchange
+    """
+    tables = [(table, compact) for table, compact in price_layout.year_tables(DB_CONFIG, exchange)
+              if since is None or int(table.rsplit('_', 1)[-1]) >= since]
+    empty = pd.DataFrame(columns=['Ticker_ID', 'Gap_Start', 'Gap_End', 'Missing_Days',
+                                  'Start_Index', 'End_Index'])
+    if not tables:
+        return GapScan(exchange, np.empty(0, dtype='datetime64[D]'), empty)
+
+    tickers = reference_data.get_reference().exchange_tickers(exchange, active_only=False)
+    key_ids = dict(zip(tickers['Ticker_Key'].astype('int64').tolist(), tickers['Ticker_ID']))
+    active = set(tickers.loc[tickers['Is_Active'], 'Ticker_ID'])
+
+    holidays = _holidays(exchange)
+    cutoff = np.datetime64(date.today(), 'D') - HOLIDAY_INFERENCE_DAYS
+    last_row = database_utils.retrieve_table(
+        DB_CONFIG, f"SELECT MAX(Date) FROM {tables[-1][0]};"
+    )[0][0]
+    if last_row is None:
+        return GapScan(exchange, np.empty(0, dtype='datetime64[D]'), empty)
+    last_day = np.datetime64(last_row, 'D')
+
+    codes: Dict[str, int] = {}
+    last_seen: List[int] = []  # Calendar position of the latest price of each ticker
+    calendars, runs = [], []
+    offset = inferred_total = 0
+
+    for table, compact in tables:
+        year = int(table.rsplit('_', 1)[-1])
+        ids, days = _read_presence(table, compact, key_ids)
+        calendar, inferred = _year_calendar(year, last_day, holidays, days, cutoff)
+        inferred_total += inferred
+        if len(calendar) == 0:
+            continue
+
+        positions = np.searchsorted(calendar, days)
+        on_calendar = positions < len(calendar)
+        on_calendar[on_calendar] = calendar[positions[on_calendar]] == days[on_calendar]
+        row_codes, uniques = pd.factorize(ids[on_calendar])
+        # Ticker_Keys without a ticker in the reference data map to NaN, which
+        # factorize codes as -1 and would mark the last ticker present
+        mapped = row_codes >= 0
+        row_codes, day_positions = row_codes[mapped], positions[on_calendar][mapped]
+        if len(uniques) == 0:
+            calendars.append(calendar)
+            offset += len(calendar)
+            continue
+
+        present = np.zeros((len(uniques), len(calendar)), dtype=bool)
+        present[row_codes, day_positions] = True
+        first = present.argmax(axis=1)
+        last = len(calendar) - 1 - present[:, ::-1].argmax(axis=1)
+
+        for ticker_id in uniques:
+            if ticker_id not in codes:
+                codes[ticker_id] = len(codes)
+                last_seen.append(-1)
+        ticker_codes = np.array([codes[ticker_id] for ticker_id in uniques])
+        previous = np.array(last_seen, dtype='int64')[ticker_codes]
+
+        # Missing days from the previous price, possibly in an earlier year,
+        # up to the first price of the year
+        bridge = (previous >= 0) & (previous + 1 <= offset + first - 1)
+        runs.append(np.column_stack([
+            ticker_codes[bridge], previous[bridge] + 1, offset + first[bridge] - 1
+        ]))
+
+        # Missing days between the first and last price of the year
+        columns = np.arange(len(calendar))
+        inside = (columns >= first[:, None]) & (columns <= last[:, None])
+        rows, starts, ends = _runs(~present & inside)
+        runs.append(np.column_stack([ticker_codes[rows], offset + starts, offset + ends]))
+
+        seen = np.array(last_seen, dtype='int64')
+        seen[ticker_codes] = offset + last
+        last_seen = seen.tolist()
+        calendars.append(calendar)
+        offset += len(calendar)
+
+    calendar = np.concatenate(calendars).astype('datetime64[D]') if calendars else \
+        np.empty(0, dtype='datetime64[D]')
+    ids = np.array(list(codes), dtype=object)
+    last_seen = np.array(last_seen, dtype='int64')
+
+    # Active tickers are expected up to the latest price of the exchange
+    stale = []
+    is_active = np.array([ticker_id in active for ticker_id in ids], dtype=bool)
+    trailing = is_active & (last_seen >= 0) & (last_seen < len(calendar) - 1)
+    if trailing.any():
+        behind = (last_day - calendar[last_seen[trailing]]).astype('int64')
+        repairable = behind <= STALE_TICKER_DAYS
+        stale = ids[trailing][~repairable].tolist()
+        codes_trailing = np.nonzero(trailing)[0][repairable]
+        runs.append(np.column_stack([
+            codes_trailing, last_seen[codes_trailing] + 1,
+            np.full(len(codes_trailing), len(calendar) - 1)
+        ]))
+
+    runs = [run for run in runs if len(run)]
+    if not runs:
+        return GapScan(exchange, calendar, empty, len(ids), stale, inferred_total)
+    runs = np.concatenate(runs).astype('int64')
+    gaps = pd.DataFrame({
+        'Ticker_ID': ids[runs[:, 0]],
+        'Gap_Start': calendar[runs[:, 1]],
+        'Gap_End': calendar[runs[:, 2]],
+        'Missing_Days': runs[:, 2] - runs[:, 1] + 1,
+        'Start_Index': runs[:, 1],
+        'End_Index': runs[:, 2],
+    }).sort_values(['Ticker_ID', 'Gap_Start'], ignore_index=True)
+    return GapScan(exchange, calendar, gaps, len(ids), stale, inferred_total)
+
+
+def store_gaps(scan: GapScan) -> None:
+    """Replace the gap report of an exchange with the result of a scan."""
+    scanned_at = datetime.now().replace(microsecond=0)
+    rows = [
+        (scan.exchange, ticker_id, pd.Timestamp(start).date(), pd.Timestamp(end).date(),
+         int(days), scanned_at, scanned_at)
+        for ticker_id, start, end, days in scan.gaps[
+            ['Ticker_ID', 'Gap_Start', 'Gap_End', 'Missing_Days']
+        ].itertuples(index=False)
+    ]
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        if rows:
+            cursor.executemany(UPSERT_GAP_QUERY, rows)
+        cursor.execute(DELETE_CLOSED_GAPS_QUERY, (scan.exchange, scanned_at))
+
+
+def _open_gaps(scan: GapScan) -> pd.DataFrame:
+    """Gaps of a scan that have not used up their repair attempts."""
+    rows = database_utils.retrieve_table(DB_CONFIG, SELECT_ATTEMPTS_QUERY, (scan.exchange,))
+    attempts = pd.DataFrame(rows, columns=['Ticker_ID', 'Gap_Start', 'Attempts'])
+    attempts['Gap_Start'] = pd.to_datetime(attempts['Gap_Start'])
+    attempts['Attempts'] = attempts['Attempts'].astype('int64')
+    gaps = scan.gaps.assign(Gap_Start=pd.to_datetime(scan.gaps['Gap_Start']))
+    gaps = gaps.merge(attempts, on=['Ticker_ID', 'Gap_Start'], how='left')
+    return gaps[gaps['Attempts'].fillna(0) < MAX_REPAIR_ATTEMPTS]
+
+
+def _missing_days(gaps: pd.DataFrame, calendar: np.ndarray) -> pd.DataFrame:
+    """Expand gap runs into one row per missing Ticker_ID and day."""
+    lengths = (gaps['End_Index'] - gaps['Start_Index'] + 1).to_numpy()
+    starts = np.repeat(gaps['Start_Index'].to_numpy(), lengths)
+    steps = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return pd.DataFrame({
+        'Ticker_ID': np.repeat(gaps['Ticker_ID'].to_numpy(), lengths),
+        'Date': pd.to_datetime(calendar[starts + steps]),
+    })
+
+
+def plan_repair(eod_exchange: str, scans: List[GapScan]) -> RepairPlan:
+    """Choose the cheapest mix of bulk days and ticker ranges for the gaps of an EODHD code.
+
+    Days are ranked by the number of tickers missing them. Requesting the top
+    k days in bulk leaves a range request for every ticker missing any other
+    day, so the cost of each k follows from the highest rank each ticker needs.
+
+    Args:
+        eod_exchange: EODHD exchange code shared by the scanned exchanges
+        scans: Gap scans of the exchanges served by eod_exchange
+
+    Returns:
+        Repair plan
+    """
+    frames = [_missing_days(_open_gaps(scan), scan.calendar).assign(Exchange=scan.exchange)
+              for scan in scans if not scan.gaps.empty]
+    missing = (pd.concat(frames, ignore_index=True) if frames
+               else pd.DataFrame(columns=['Ticker_ID', 'Date', 'Exchange']))
+    if missing.empty:
+        return RepairPlan(eod_exchange, missing, [], pd.DataFrame(
+            columns=['Exchange', 'Ticker_ID', 'Date_From', 'Date_To']), 0, 0)
+
+    day_codes, days = pd.factorize(missing['Date'])
+    tickers_per_day = np.bincount(day_codes)
+    rank_of_day = np.empty(len(days), dtype='int64')
+    rank_of_day[np.argsort(-tickers_per_day, kind='stable')] = np.arange(len(days))
+    missing['Rank'] = rank_of_day[day_codes]
+
+    highest_rank = missing.groupby('Ticker_ID', sort=False)['Rank'].max().to_numpy()
+    ticker_count = len(highest_rank)
+    # Tickers fully covered by the top k bulk days, for k = 0..len(days)
+    covered = np.concatenate([[0], np.cumsum(np.bincount(highest_rank, minlength=len(days)))])
+    bulk_days = np.arange(len(days) + 1)
+    costs = BULK_REQUEST_COST * bulk_days + TICKER_REQUEST_COST * (ticker_count - covered)
+    k = int(np.argmin(costs))
+
+    uncovered = missing[missing['Rank'] >= k]
+    ticker_ranges = uncovered.groupby(['Exchange', 'Ticker_ID'], sort=False)['Date'].agg(
+        Date_From='min', Date_To='max'
+    ).reset_index()
+    bulk_dates = sorted(pd.Timestamp(days[i]).date()
+                        for i in np.nonzero(rank_of_day < k)[0])
+    return RepairPlan(eod_exchange, missing.drop(columns='Rank'), bulk_dates, ticker_ranges,
+                      int(costs[k]), int(costs[0]))
+
+
+def refresh_holidays(exchanges: List[str], eod_exchange: str) -> int:
+    """Load the holidays EODHD publishes for an exchange code.
+
+    Returns:
+        Number of holidays stored
+    """
+    holidays = eodhd_utils.retrieve_exchange_holidays(eod_exchange, EODHD_CONFIG['api_key'])
+    if holidays is None or holidays.empty:
+        return 0
+    rows = [(exchange, day.date(), name, 'eodhd')
+            for exchange in exchanges
+            for day, name in zip(holidays['Date'], holidays['Holiday'])]
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.executemany(UPSERT_HOLIDAY_QUERY, rows)
+    return len(holidays)
+
+
+def _fetch_bulk_day(plan: RepairPlan, day: date, exchanges: List[str]) -> Optional[pd.DataFrame]:
+    """Prices of one bulk day, or None if the day turned out to be a holiday."""
+    prices = eodhd_utils.retrieve_daily_price(
+        plan.eod_exchange, plan.eod_exchange, EODHD_CONFIG['api_key'], date=day.isoformat()
+    )
+    if prices is None:
+        return None
+    prices = prices.assign(Date=pd.to_datetime(prices['Date']))
+    prices = prices[prices['Date'].dt.date == day]
+    if prices.empty:
+        logger.info(f"No prices on {day} for EoD Code {plan.eod_exchange}, recorded as a holiday")
+        with database_utils.db_connection(DB_CONFIG) as cursor:
+            cursor.executemany(UPSERT_HOLIDAY_QUERY, [
+                (exchange, day, None, 'observed') for exchange in exchanges
+            ])
+        return None
+
+    # One bulk payload serves every exchange of the code, e.g. NYSE and NASDAQ on US
+    ticker = prices['Ticker'].astype(str)
+    return pd.concat(
+        [prices.assign(Exchange=exchange, Ticker_ID=ticker + f'_{exchange}') for exchange in exchanges],
+        ignore_index=True
+    )
+
+
+def _fetch_ticker_range(plan: RepairPlan, exchange: str, ticker_id: str,
+                        date_from: pd.Timestamp, date_to: pd.Timestamp) -> Optional[pd.DataFrame]:
+    ticker = ticker_id[:-len(exchange) - 1]
+    prices = eodhd_utils.retrieve_historical_price(
+        plan.eod_exchange, ticker, date_to.strftime('%Y-%m-%d'), EODHD_CONFIG['api_key'],
+        date_from=date_from.strftime('%Y-%m-%d')
+    )
+    if prices is None:
+        return None
+    return prices.assign(Ticker=ticker, Exchange=exchange, Ticker_ID=ticker_id,
+                         Date=pd.to_datetime(prices['Date']))
+
+
+def _write_repairs(exchange: str, eod_exchange: str, prices: pd.DataFrame,
+                   writer: PriceWriter) -> int:
+    """Validate repaired prices of an exchange and buffer them in the writer.
+
+    Returns:
+        Number of rows written
+    """
+    prices = prices.assign(EoDHD_Exchange=eod_exchange)
+    prices = price_validation.validate_and_quarantine(
+        prices[price_layout.PRICE_COLUMNS], exchange, 'repair', DB_CONFIG,
+        key_columns=('Ticker_ID', 'Date')
+    )
+    if prices.empty:
+        return 0
+
+    writer.add(prices)
+    return len(prices)
+
+
+def execute_plan(plan: RepairPlan, scans: List[GapScan]) -> Dict[str, int]:
+    """Request the prices of a repair plan and write the days that were missing.
+
+    Returns:
+        Counts of requests made and rows written
+    """
+    exchanges = [scan.exchange for scan in scans]
+    stats = {'bulk_requests': 0, 'ticker_requests': 0, 'rows': 0}
+    fetched = []
+    for day in plan.bulk_dates:
+        stats['bulk_requests'] += 1
+        prices = _fetch_bulk_day(plan, day, exchanges)
+        if prices is not None:
+            fetched.append(prices)
+    for exchange, ticker_id, date_from, date_to in plan.ticker_ranges.itertuples(index=False):
+        stats['ticker_requests'] += 1
+        prices = _fetch_ticker_range(plan, exchange, ticker_id, date_from, date_to)
+        if prices is not None:
+            fetched.append(prices)
+
+    if fetched:
+        prices = pd.concat(fetched, ignore_index=True)
+        prices['Ticker_ID'] = prices['Ticker_ID'].astype(str)
+        # Only the missing days are written, days already stored are left as they are
+        repaired = prices.merge(plan.missing, on=['Exchange', 'Ticker_ID', 'Date'])
+        repaired = repaired.drop_duplicates(['Ticker_ID', 'Date'], keep='last')
+        with PriceWriter(DB_CONFIG, source='repair') as writer:
+            for exchange, rows in repaired.groupby('Exchange', sort=False):
+                stats['rows'] += _write_repairs(exchange, plan.eod_exchange, rows, writer)
+
+    attempted = [(ticker_id, pd.Timestamp(start).date())
+                 for scan in scans
+                 for ticker_id, start in _open_gaps(scan)[['Ticker_ID', 'Gap_Start']].itertuples(index=False)]
+    if attempted:
+        with database_utils.db_connection(DB_CONFIG) as cursor:
+            cursor.executemany(INCREMENT_ATTEMPTS_QUERY, attempted)
+    return stats
+
+
+def scan_gaps(exchanges: Optional[List[str]] = None, since: Optional[int] = None) -> List[GapScan]:
+    """Scan exchanges for gaps and store the gap report.
+
+    Returns:
+        One gap scan per exchange with price tables
+    """
+    _ensure_tables()
+    codes = _get_exchange_codes()
+    if exchanges:
+        codes = codes[codes['Exchange'].isin(exchanges)]
+    scans = []
+    for exchange in codes['Exchange']:
+        try:
+            with profiling.section(exchange):
+                scan = scan_exchange(exchange, since)
+                store_gaps(scan)
+        except Exception as e:
+            logger.error(f"Gap scan failed for {exchange}: {e}", exc_info=True)
+            continue
+        if scan.tickers:
+            logger.info(f"Gap scan {scan.summary()}")
+            scans.append(scan)
+    return scans
+
+
+def price_gap_repair(exchanges: Optional[List[str]] = None, since: Optional[int] = None,
+                     dry_run: bool = False) -> Dict[str, int]:
+    """Scan for gaps and fill them with the cheapest set of EODHD requests.
+
+    Args:
+        exchanges: Exchange codes to repair, defaults to all
+        since: First year to scan, defaults to the whole history
+        dry_run: Only plan and log the requests
+
+    Returns:
+        Planned API cost and counts of requests made and rows written
+    """
+    _ensure_tables()
+    codes = _get_exchange_codes()
+    if exchanges:
+        codes = codes[codes['Exchange'].isin(exchanges)]
+    totals = {'cost': 0, 'ticker_only_cost': 0, 'bulk_requests': 0, 'ticker_requests': 0, 'rows': 0}
+
+    for eod_exchange, group in codes.groupby('EoDHD_Exchange', sort=False):
+        exchange_list = group['Exchange'].tolist()
+        try:
+            with profiling.section(eod_exchange):
+                if not dry_run:
+                    refresh_holidays(exchange_list, eod_exchange)
+                scans = scan_gaps(exchange_list, since)
+                plan = plan_repair(eod_exchange, scans)
+                logger.info(
+                    f"Repair plan for {exchange_list}: {len(plan.missing)} missing prices, "
+                    f"{len(plan.bulk_dates)} bulk days and {len(plan.ticker_ranges)} ticker "
+                    f"ranges, {plan.cost} API calls instead of {plan.ticker_only_cost}"
+                )
+                totals['cost'] += plan.cost
+                totals['ticker_only_cost'] += plan.ticker_only_cost
+                if dry_run or plan.missing.empty:
+                    continue
+                for key, value in execute_plan(plan, scans).items():
+                    totals[key] += value
+        except Exception as e:
+            logger.error(f"Gap repair failed for {exchange_list} using EoD Code {eod_exchange}: {e}",
+                         exc_info=True)
+            continue
+
+    logger.info(f"Gap repair finished: {totals}")
+    return totals
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point for gap scans and repairs."""
+    parser = argparse.ArgumentParser(description="Price gap detection and repair")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('scan', "Store the gap report of each exchange"),
+                            ('repair', "Fill gaps with the cheapest EODHD requests")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--exchange', action='append', dest='exchanges',
+                             help="Exchange code, repeat for several (default: all)")
+        command.add_argument('--since', type=int, help="First year to scan")
+    commands.choices['repair'].add_argument('--dry-run', action='store_true',
+                                            help="Only plan the requests")
+
+    args = parser.parse_args(argv)
+    if args.command == 'scan':
+        report = pd.DataFrame([scan.summary() for scan in scan_gaps(args.exchanges, args.since)])
+        print(report.to_string(index=False) if not report.empty else "No price tables scanned")
+    else:
+        print(price_gap_repair(args.exchanges, args.since, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Price Matrix Update Module
+
+This module keeps the memory-mapped price matrix cache of every exchange in
+step with the price tables. It runs after daily_price_update. Rows written
+before the last cached date, by a backfill, a gap repair or a corporate
+action re-adjustment, are found in the price change log, which it tails as
+the 'price_matrix' consumer, and the columns of their tickers are refreshed.
+The new trading days are then appended; rebuild=True writes a fresh
+generation from the full history.
+"""
+
+# Standard library imports
+import argparse
+from typing import List
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import (
+    database_utils, price_matrix, profiling, reference_data, change_log
+)
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+CONSUMER_NAME = 'price_matrix'
+
+
+def _get_exchanges() -> List[str]:
+    """Retrieve list of active exchange codes from the shared reference data."""
+    return reference_data.get_reference().exchange_list()
+
+def apply_changes(changes: pd.DataFrame) -> int:
+    """Refresh the cached columns of tickers whose rows up to the last cached date changed.
+
+    Records starting after the last cached date are left to the append, and
+    records without a ticker rebuild the matrices of their exchange.
+
+    Returns:
+        Number of columns refreshed
+    """
+    refreshed = 0
+    for exchange, records in changes.groupby('Exchange', sort=True):
+        last_date = price_matrix.last_cached_date(exchange)
+        if last_date is None:
+            continue
+        date_from = pd.to_datetime(records['Date_From'])
+        records = records[date_from.isna() | (date_from <= pd.Timestamp(last_date))]
+        if records.empty:
+            continue
+        if records['Ticker_ID'].isna().any():
+            price_matrix.build_price_matrix(DB_CONFIG, exchange)
+            continue
+        refreshed += price_matrix.refresh_price_matrix_tickers(
+            DB_CONFIG, exchange, records['Ticker_ID'].unique().tolist()
+        )
+    return refreshed
+
+def price_matrix_update(rebuild: bool = False) -> None:
+    """Refresh and append new dates to, or rebuild, the price matrix cache of every exchange."""
+    consumer = change_log.ChangeConsumer(CONSUMER_NAME, DB_CONFIG)
+    refreshed = 0
+    while True:
+        changes = consumer.poll()
+        if changes.empty:
+            break
+        # A rebuild reads the full history, the logged changes are in it already
+        if not rebuild:
+            refreshed += apply_changes(changes)
+        consumer.commit(changes['Seq'].max())
+    if refreshed:
+        logger.info(f"Refreshed {refreshed} price matrix columns from the change log")
+
+    updated = 0
+    for exchange in _get_exchanges():
+        if not database_utils.price_year_tables(DB_CONFIG, exchange):
+            continue
+        try:
+            with profiling.section(exchange):
+                if rebuild:
+                    price_matrix.build_price_matrix(DB_CONFIG, exchange)
+                else:
+                    price_matrix.append_price_matrix(DB_CONFIG, exchange)
+                updated += 1
+        except Exception as e:
+            logger.error(f"Failed to update price matrix for {exchange}: {e}", exc_info=True)
+            continue
+
+    logger.info(f"{'Rebuilt' if rebuild else 'Updated'} price matrices for {updated} exchanges")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Update the price matrix cache.')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Rebuild every matrix from the full history')
+    price_matrix_update(rebuild=parser.parse_args().rebuild)
@@ -0,0 +1,173 @@
+"""Rollups Update Module
+
+This module keeps the weekly and monthly rollup tables of every exchange in
+step with the price tables (see utils/rollups.py). It tails the price change
+log as the 'rollups' consumer and re-aggregates only the periods the logged
+writes touched: one statement per changed year table and granularity, for the
+changed tickers over the union of their date ranges. Exchanges without rollup
+tables yet are built from their full history first.
+
+Usage:
+    python -m lib.data_centre.database.scripts.rollups_update update
+    python -m lib.data_centre.database.scripts.rollups_update rebuild [--exchange LSE]
+    python -m lib.data_centre.database.scripts.rollups_update check --from 2024-01-01 [--exchange LSE]
+"""
+
+# Standard library imports
+import argparse
+from datetime import date
+from typing import Dict, List, Optional
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import (
+    database_utils, rollups, change_log, profiling, reference_data
+)
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+CONSUMER_NAME = 'rollups'
+
+ROLLUP_TABLES_QUERY = """
+    SELECT TABLE_NAME
+    FROM INFORMATION_SCHEMA.TABLES
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME REGEXP '_prices_(weekly|monthly)$';
+"""
+
+
+def _get_exchanges() -> List[str]:
+    """Retrieve list of active exchange codes from the shared reference data."""
+    return reference_data.get_reference().exchange_list()
+
+
+def _missing_rollups(exchanges: List[str]) -> List[str]:
+    """Exchanges with price tables but without both rollup tables."""
+    existing = {row[0] for row in database_utils.retrieve_table(DB_CONFIG, ROLLUP_TABLES_QUERY)}
+    return [exchange for exchange in exchanges
+            if any(rollups.rollup_table(exchange, granularity) not in existing
+                   for granularity in rollups.GRANULARITIES)
+            and database_utils.price_year_tables(DB_CONFIG, exchange)]
+
+
+def apply_changes(changes: pd.DataFrame) -> int:
+    """Re-aggregate the periods touched by a batch of change records.
+
+    Records of one year table are merged: their tickers are rebuilt over the
+    union of their date ranges. Records without dates cover the whole year
+    and records without a ticker cover every ticker of the table.
+
+    Returns:
+        Number of affected rollup rows
+    """
+    changes = changes.copy()
+    years = changes['Table_Name'].str.rsplit('_', n=1).str[1].astype(int)
+    changes['Date_From'] = pd.to_datetime(changes['Date_From']).fillna(
+        pd.to_datetime(years.astype(str) + '-01-01'))
+    changes['Date_To'] = pd.to_datetime(changes['Date_To']).fillna(
+        pd.to_datetime(years.astype(str) + '-12-31'))
+
+    affected = 0
+    for (exchange, table), records in changes.groupby(['Exchange', 'Table_Name'], sort=True):
+        ticker_ids = None if records['Ticker_ID'].isna().any() else records['Ticker_ID'].unique().tolist()
+        for granularity in rollups.GRANULARITIES:
+            affected += rollups.aggregate_range(
+                DB_CONFIG, exchange, granularity,
+                records['Date_From'].min(), records['Date_To'].max(), ticker_ids
+            )
+    return affected
+
+
+def rollups_update() -> Dict[str, int]:
+    """Apply every pending price change to the rollup tables.
+
+    Returns:
+        Counts of records read, rollup rows affected and exchanges built
+    """
+    # The offset is taken before the initial builds, changes they already
+    # contain are applied again, which leaves the bars unchanged
+    consumer = change_log.ChangeConsumer(CONSUMER_NAME, DB_CONFIG)
+    built = 0
+    for exchange in _missing_rollups(_get_exchanges()):
+        with profiling.section(exchange):
+            rollups.rebuild_rollups(DB_CONFIG, exchange)
+        built += 1
+
+    records = affected = 0
+    while True:
+        changes = consumer.poll()
+        if changes.empty:
+            break
+        affected += apply_changes(changes)
+        consumer.commit(changes['Seq'].max())
+        records += len(changes)
+
+    logger.info(f"Applied {records} price changes to the rollups ({affected} rows), "
+                f"built {built} exchanges")
+    return {'records': records, 'affected': affected, 'built': built}
+
+
+def rebuild_all_rollups(exchanges: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """Rebuild the rollup tables of exchanges from their full history."""
+    counts = {}
+    for exchange in exchanges or _get_exchanges():
+        if not database_utils.price_year_tables(DB_CONFIG, exchange):
+            continue
+        try:
+            with profiling.section(exchange):
+                counts[exchange] = rollups.rebuild_rollups(DB_CONFIG, exchange)
+        except Exception as e:
+            logger.error(f"Failed to rebuild rollups for {exchange}: {e}", exc_info=True)
+    return counts
+
+
+def check_rollups(date_from: date, date_to: Optional[date] = None,
+                  exchanges: Optional[List[str]] = None) -> pd.DataFrame:
+    """Parity check of the rollups against on-the-fly aggregation.
+
+    Returns:
+        Mismatch count per exchange and granularity
+    """
+    date_to = date_to or date.today()
+    report = []
+    for exchange in exchanges or _get_exchanges():
+        if not database_utils.price_year_tables(DB_CONFIG, exchange):
+            continue
+        for granularity in rollups.GRANULARITIES:
+            mismatches = rollups.check_parity(DB_CONFIG, exchange, granularity, date_from, date_to)
+            report.append({'Exchange': exchange, 'Granularity': granularity,
+                           'Mismatches': len(mismatches)})
+    return pd.DataFrame(report)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point for rollup updates, rebuilds and checks."""
+    parser = argparse.ArgumentParser(description="Weekly and monthly price rollups")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('update', help="Apply pending price changes")
+    rebuild = commands.add_parser('rebuild', help="Rebuild from the full history")
+    check = commands.add_parser('check', help="Compare with on-the-fly aggregation")
+    for command in (rebuild, check):
+        command.add_argument('--exchange', action='append', dest='exchanges',
+                             help="Exchange code, repeat for several (default: all)")
+    check.add_argument('--from', dest='date_from', type=date.fromisoformat, required=True,
+                       help="First date to check")
+    check.add_argument('--to', dest='date_to', type=date.fromisoformat,
+                       help="Last date to check (default: today)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'update':
+        print(rollups_update())
+    elif args.command == 'rebuild':
+        print(rebuild_all_rollups(args.exchanges))
+    else:
+        report = check_rollups(args.date_from, args.date_to, args.exchanges)
+        print(report.to_string(index=False) if not report.empty else "No price tables checked")
+
+
+if __name__ == "__main__":
+    main()
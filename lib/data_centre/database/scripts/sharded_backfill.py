@@ -0,0 +1,414 @@
+"""Sharded Price History Backfill Module
+
+This module splits the historical price backfill into ticker batches that any
+number of worker processes, on one or many hosts, claim through a lease table
+in the database. Leases expire unless the owning worker keeps sending
+heartbeats, so the batch of a crashed worker is re-claimed by another one.
+
+Batches hold tickers of one tier (see utils/universe.py) and are claimed in
+tier order. Workers only claim tiers the remaining daily API budget allows
+and stop once none is left, the rest stays pending for a later run.
+
+Tickers of a batch that fail are split off into a new pending batch when the
+batch is released, so only they are fetched again. After MAX_ATTEMPTS the
+split-off batch is parked as failed. A re-claimed batch may have been
+partly written before, the PriceWriter replaces rows it writes again.
+"""
+
+# Standard library imports
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Third-party imports
+import pandas as pd
+from mysql.connector import Error
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, universe
+from lib.data_centre.database.utils.price_writer import PriceWriter
+from lib.data_centre.database.scripts.populate_price_history import (
+    _get_ticker_codes,
+    _populate_ticker,
+)
+from config.connections.database_access import DB_CONFIG
+from config.connections.eodhd_access import EODHD_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+BATCH_SIZE = 50
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+CREATE_LEASE_TABLE_QUERY = """
+    CREATE TABLE IF NOT EXISTS backfill_leases (
+        Batch_ID INT,
+        Tier TINYINT NOT NULL DEFAULT 1,
+        Exchange VARCHAR(255),
+        EoDHD_Exchange VARCHAR(255),
+        Tickers TEXT,
+        Ticker_Count INT,
+        Tickers_Done INT DEFAULT 0,
+        Status VARCHAR(16),
+        Worker_ID VARCHAR(255),
+        Attempts INT DEFAULT 0,
+        Lease_Expires DATETIME,
+        Heartbeat DATETIME,
+        Date_Updated DATETIME,
+        PRIMARY KEY (Batch_ID),
+        INDEX idx_backfill_leases_status (Status, Lease_Expires)
+    );
+"""
+
+# Lease tables planned before batches had tiers
+ALTER_LEASE_TABLE_QUERY = """
+    ALTER TABLE backfill_leases
+        ADD COLUMN IF NOT EXISTS Tier TINYINT NOT NULL DEFAULT 1 AFTER Batch_ID;
+"""
+
+INSERT_BATCH_QUERY = """
+    INSERT INTO backfill_leases (
+        Batch_ID, Tier, Exchange, EoDHD_Exchange, Tickers, Ticker_Count,
+        Status, Date_Updated
+    ) VALUES (%s, %s, %s, %s, %s, %s, 'pending', NOW());
+"""
+
+# Pending batches, and leased batches whose owner stopped heartbeating
+CLAIM_SELECT_QUERY = """
+    SELECT Batch_ID, Tier, Exchange, EoDHD_Exchange, Tickers, Attempts
+    FROM backfill_leases
+    WHERE (Status = 'pending'
+       OR (Status = 'leased' AND Lease_Expires < NOW()))
+      AND Tier <= %s
+    ORDER BY Tier, Batch_ID
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+"""
+
+CLAIM_UPDATE_QUERY = """
+    UPDATE backfill_leases
+    SET Status = 'leased', Worker_ID = %s, Attempts = Attempts + 1,
+        Tickers_Done = 0, Heartbeat = NOW(),
+        Lease_Expires = NOW() + INTERVAL %s SECOND, Date_Updated = NOW()
+    WHERE Batch_ID = %s;
+"""
+
+HEARTBEAT_QUERY = """
+    UPDATE backfill_leases
+    SET Heartbeat = NOW(), Lease_Expires = NOW() + INTERVAL %s SECOND,
+        Tickers_Done = %s
+    WHERE Batch_ID = %s AND Worker_ID = %s AND Status = 'leased';
+"""
+
+RELEASE_QUERY = """
+    UPDATE backfill_leases
+    SET Status = %s, Tickers_Done = %s, Lease_Expires = NULL,
+        Date_Updated = NOW()
+    WHERE Batch_ID = %s AND Worker_ID = %s AND Status = 'leased';
+"""
+
+# The tickers that succeeded stay in the released batch
+RELEASE_DONE_QUERY = """
+    UPDATE backfill_leases
+    SET Status = 'done', Tickers = %s, Ticker_Count = %s, Tickers_Done = %s,
+        Lease_Expires = NULL, Date_Updated = NOW()
+    WHERE Batch_ID = %s AND Worker_ID = %s AND Status = 'leased';
+"""
+
+# Failed tickers become a batch of their own, keeping the attempt count
+REQUEUE_QUERY = """
+    INSERT INTO backfill_leases (
+        Batch_ID, Tier, Exchange, EoDHD_Exchange, Tickers, Ticker_Count,
+        Status, Attempts, Date_Updated
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW());
+"""
+
+# Batches that crashed too often are parked instead of being re-claimed forever
+FAIL_EXHAUSTED_QUERY = """
+    UPDATE backfill_leases
+    SET Status = 'failed', Lease_Expires = NULL, Date_Updated = NOW()
+    WHERE Status = 'leased' AND Lease_Expires < NOW() AND Attempts >= %s;
+"""
+
+PROGRESS_QUERY = """
+    SELECT Status, COUNT(*), SUM(Ticker_Count), SUM(Tickers_Done),
+           COUNT(DISTINCT Worker_ID)
+    FROM backfill_leases
+    GROUP BY Status;
+"""
+
+
+def _worker_id() -> str:
+    """Identify this worker process uniquely across hosts."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class _Heartbeat(threading.Thread):
+    """Background thread that keeps the lease of the current batch alive."""
+
+    def __init__(self, batch_id: int, worker_id: str):
+        super().__init__(daemon=True)
+        self.batch_id = batch_id
+        self.worker_id = worker_id
+        self.tickers_done = 0
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                updated = database_utils.execute_query(
+                    DB_CONFIG, HEARTBEAT_QUERY,
+                    (LEASE_SECONDS, self.tickers_done, self.batch_id, self.worker_id)
+                )
+            except Exception as e:
+                logger.warning(f"Heartbeat failed for batch {self.batch_id}: {e}")
+                continue
+            if not updated:
+                logger.warning(f"Worker {self.worker_id} lost lease on batch {self.batch_id}")
+                self.lost.set()
+                return
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def plan_backfill(batch_size: int = BATCH_SIZE, reset: bool = False) -> int:
+    """Split the ticker universe into per-tier, per-exchange batches in the lease table.
+
+    Args:
+        batch_size: Number of tickers per batch
+        reset: Drop any existing plan before creating a new one
+
+    Returns:
+        Number of batches planned
+    """
+    if reset:
+        database_utils.execute_query(DB_CONFIG, "DROP TABLE IF EXISTS backfill_leases;")
+    database_utils.execute_query(DB_CONFIG, CREATE_LEASE_TABLE_QUERY)
+    database_utils.execute_query(DB_CONFIG, ALTER_LEASE_TABLE_QUERY)
+
+    existing = database_utils.retrieve_table(DB_CONFIG, "SELECT COUNT(*) FROM backfill_leases;")
+    if existing and existing[0][0]:
+        logger.info(f"Backfill already planned with {existing[0][0]} batches, use reset to re-plan")
+        return 0
+
+    tickers = _get_ticker_codes()
+    batches = []
+    groups = tickers.groupby(['Tier', 'Exchange', 'EoDHD_Exchange'], sort=False)
+    for (tier, exchange, eod_exchange), group in groups:
+        codes = group['Ticker'].tolist()
+        for start in range(0, len(codes), batch_size):
+            chunk = codes[start:start + batch_size]
+            batches.append((len(batches) + 1, int(tier), exchange, eod_exchange,
+                            ','.join(chunk), len(chunk)))
+
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.executemany(INSERT_BATCH_QUERY, batches)
+
+    logger.info(f"Planned {len(batches)} backfill batches for {len(tickers)} tickers")
+    return len(batches)
+
+
+def _claim_batch(worker_id: str, max_tier: int) -> Optional[Dict[str, Any]]:
+    """Lease the next free or expired batch of at most max_tier for this worker."""
+    database_utils.execute_query(DB_CONFIG, FAIL_EXHAUSTED_QUERY, (MAX_ATTEMPTS,))
+
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.execute(CLAIM_SELECT_QUERY, (max_tier,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        batch_id, tier, exchange, eod_exchange, tickers, attempts = row
+        cursor.execute(CLAIM_UPDATE_QUERY, (worker_id, LEASE_SECONDS, batch_id))
+
+    return {
+        'batch_id': batch_id,
+        'tier': tier,
+        'exchange': exchange,
+        'eod_exchange': eod_exchange,
+        'tickers': tickers.split(',') if tickers else [],
+        'attempts': (attempts or 0) + 1,
+    }
+
+
+def _release_batch(batch: Dict[str, Any], worker_id: str, failed: List[str]) -> bool:
+    """Release a processed batch, splitting its failed tickers off into a new batch.
+
+    A batch whose tickers all failed is released as a whole.
+
+    Returns:
+        False if the worker lost the lease and the batch was left to its new owner
+    """
+    retry_status = 'pending' if batch['attempts'] < MAX_ATTEMPTS else 'failed'
+    failed_set = set(failed)
+    succeeded = [ticker for ticker in batch['tickers'] if ticker not in failed_set]
+    if not failed or not succeeded:
+        status = 'done' if not failed else retry_status
+        return bool(database_utils.execute_query(
+            DB_CONFIG, RELEASE_QUERY,
+            (status, len(succeeded), batch['batch_id'], worker_id)
+        ))
+
+    with database_utils.db_connection(DB_CONFIG) as cursor:
+        cursor.execute(RELEASE_DONE_QUERY, (
+            ','.join(succeeded), len(succeeded), len(succeeded), batch['batch_id'], worker_id
+        ))
+        if not cursor.rowcount:
+            # The lease was lost, the batch is re-claimed as a whole
+            return False
+        cursor.execute("SELECT MAX(Batch_ID) FROM backfill_leases FOR UPDATE;")
+        next_id = cursor.fetchone()[0] + 1
+        cursor.execute(REQUEUE_QUERY, (
+            next_id, batch['tier'], batch['exchange'], batch['eod_exchange'],
+            ','.join(failed), len(failed), retry_status, batch['attempts']
+        ))
+    logger.warning(f"Batch {batch['batch_id']}: {len(failed)} failed tickers moved to "
+                   f"batch {next_id} ({retry_status})")
+    return True
+
+
+def backfill_worker(worker_id: Optional[str] = None) -> int:
+    """Claim and process batches until no work is left.
+
+    Args:
+        worker_id: Optional worker identifier, defaults to host:pid
+
+    Returns:
+        Number of batches completed by this worker
+    """
+    worker_id = worker_id or _worker_id()
+    today = datetime.now().strftime('%Y-%m-%d')
+    completed = 0
+    budget = universe.ApiBudget(EODHD_CONFIG['api_key'])
+
+    while True:
+        max_tier = budget.max_tier(BATCH_SIZE)
+        if not max_tier:
+            logger.warning(f"Worker {worker_id} stopped, API budget used up, completed {completed}")
+            return completed
+        batch = _claim_batch(worker_id, max_tier)
+        if batch is None:
+            logger.info(f"Worker {worker_id} found no more batches, completed {completed}")
+            return completed
+
+        batch_id = batch['batch_id']
+        logger.info(f"Worker {worker_id} claimed batch {batch_id} ({len(batch['tickers'])} tickers on {batch['exchange']})")
+
+        heartbeat = _Heartbeat(batch_id, worker_id)
+        heartbeat.start()
+        failed: List[str] = []
+        try:
+            # The batch is only released once its rows are written
+            with PriceWriter(DB_CONFIG, source='backfill') as writer:
+                for ticker in batch['tickers']:
+                    if heartbeat.lost.is_set():
+                        break
+                    try:
+                        if not _populate_ticker(ticker, batch['exchange'], batch['eod_exchange'],
+                                                today, writer):
+                            failed.append(ticker)
+                    except Error:
+                        # A failed write is not the ticker's fault, the rows stay
+                        # buffered and the batch goes back to 'pending'
+                        raise
+                    except Exception as e:
+                        logger.error(f"Backfill failed for {ticker} on {batch['exchange']}: {e}", exc_info=True)
+                        failed.append(ticker)
+                    finally:
+                        # Every attempted request counts against the budget
+                        budget.spend()
+                    heartbeat.tickers_done += 1
+        except Exception:
+            heartbeat.stop()
+            heartbeat.join()
+            if not heartbeat.lost.is_set():
+                database_utils.execute_query(
+                    DB_CONFIG, RELEASE_QUERY, ('pending', 0, batch_id, worker_id)
+                )
+            raise
+        heartbeat.stop()
+        heartbeat.join()
+        if _release_batch(batch, worker_id, failed):
+            completed += 1
+
+
+def _run_worker_process() -> None:
+    """Process entry point for locally spawned workers."""
+    try:
+        backfill_worker()
+    except Exception:
+        logger.error("Backfill worker crashed", exc_info=True)
+        raise
+
+
+def run_backfill_workers(processes: int) -> None:
+    """Start worker processes on this host and wait for them to finish."""
+    workers = [
+        multiprocessing.Process(target=_run_worker_process, name=f"backfill-{i}")
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    backfill_progress()
+
+
+def backfill_progress() -> pd.DataFrame:
+    """Report the overall backfill progress across all workers.
+
+    Returns:
+        DataFrame with batch and ticker counts per lease status
+    """
+    data = database_utils.retrieve_table(DB_CONFIG, PROGRESS_QUERY)
+    progress = pd.DataFrame(
+        data, columns=['Status', 'Batches', 'Tickers', 'Tickers_Done', 'Workers']
+    ).fillna(0)
+
+    total = int(progress['Tickers'].sum())
+    done = int(progress.loc[progress['Status'] == 'done', 'Tickers'].sum()
+               + progress.loc[progress['Status'] == 'leased', 'Tickers_Done'].sum())
+    active = int(progress.loc[progress['Status'] == 'leased', 'Workers'].sum())
+    percent = 100 * done / total if total else 0.0
+
+    logger.info(
+        f"Backfill progress: {done}/{total} tickers ({percent:.1f}%), "
+        f"{active} active workers, batches by status: "
+        f"{dict(zip(progress['Status'], progress['Batches'].astype(int)))}"
+    )
+    return progress
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point for the sharded backfill."""
+    parser = argparse.ArgumentParser(description="Sharded historical price backfill")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan = commands.add_parser('plan', help="Split tickers into leased batches")
+    plan.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    plan.add_argument('--reset', action='store_true')
+
+    work = commands.add_parser('work', help="Run worker processes on this host")
+    work.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+
+    commands.add_parser('progress', help="Report overall progress")
+
+    args = parser.parse_args(argv)
+    if args.command == 'plan':
+        plan_backfill(args.batch_size, args.reset)
+    elif args.command == 'work':
+        run_backfill_workers(args.processes)
+    else:
+        backfill_progress()
+
+
+if __name__ == "__main__":
+    main()
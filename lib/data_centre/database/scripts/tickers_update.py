@@ -2,18 +2,25 @@
 Ticker Update Module
 
 This module handles the synchronization of ticker data between EODHD API
-and the local database, adding any missing tickers.
+and the local database. The API ticker lists are loaded into a staging table
+and reconciled on the server: new tickers are added, changed tickers are
+updated and tickers that disappeared from the API are marked inactive.
+
+Exchanges are synced in the order of their best ticker tier, and the tiers
+of the ticker universe (see utils/universe.py) are recomputed afterwards.
 """
 
 # Standard library imports
-from typing import List, Dict, Any
+from typing import Any, Dict, List, Optional
 
 # Third-party imports
 import numpy as np
 import pandas as pd
 
 # Local application imports
-from lib.data_centre.database.utils import database_utils, eodhd_utils
+from lib.data_centre.database.utils import (
+    database_utils, eodhd_utils, query_cache, price_layout, profiling, universe, reference_data
+)
 from config.connections.database_access import DB_CONFIG
 from config.connections.eodhd_access import EODHD_CONFIG
 from config.settings.logging import logger_factory
@@ -26,6 +33,12 @@ TICKER_COLUMNS = [
     'Currency', 'Type', 'Isin', 'Source', 'Date_Updated'
 ]
 
+# Columns whose change counts as a change of the ticker
+HASH_COLUMNS = [
+    'Ticker', 'Name', 'Country', 'Exchange', 'EoDHD_Exchange',
+    'Currency', 'Type', 'Isin'
+]
+
 CREATE_TABLE_QUERY = """
     CREATE TABLE IF NOT EXISTS global_tickers (
         Ticker_ID VARCHAR(255),
@@ -39,105 +52,116 @@ CREATE_TABLE_QUERY = """
         Isin VARCHAR(255),
         Source VARCHAR(255),
         Date_Updated DATETIME,
+        Row_Hash CHAR(32),
+        Is_Active TINYINT(1) NOT NULL DEFAULT 1,
         PRIMARY KEY (Ticker_ID)
     );
 """
 
-def _get_exchange_list(db_config: Dict[str, Any]) -> List[str]:
-    """Retrieve list of exchange codes from database."""
-    query = 'SELECT Exchange, EoDHD_Exchange FROM global_exchanges;'
-    table = database_utils.retrieve_table(db_config, query)
-    return pd.DataFrame(table, columns=['Exchange', 'EoDHD_Exchange'])
-
-def _get_db_tickers(db_config: Dict[str, Any], exchange: str) -> pd.DataFrame:
-    """Retrieve tickers for specific exchange from database."""
-    query = f"SELECT * FROM global_tickers WHERE Exchange='{exchange}';"
-    table = database_utils.retrieve_table(db_config, query)
-    return pd.DataFrame(table, columns=TICKER_COLUMNS)
-
-def _prepare_tickers_for_upload(df: pd.DataFrame) -> tuple[str, str]:
-    """Format ticker data for SQL insert."""
-    columns = ', '.join(df.columns.values)
-    values = (df.replace({np.nan: 'None'})
-             .values.tolist()
-             .__str__()
-             .replace('[', '(')
-             .replace(']', ')')
-             [1:-1])
-    return columns, values
-
-def _find_missing_tickers(eod_data: pd.DataFrame, db_data: pd.DataFrame) -> pd.DataFrame:
-    """Identify tickers present in EODHD but missing from database."""
-    eod_codes = eod_data['Ticker_ID']
-    db_codes = db_data['Ticker_ID']
-    stacked_codes = pd.concat([eod_codes, db_codes], axis=0)
-    missing_codes = stacked_codes.drop_duplicates(keep=False)
-    return eod_data[eod_data['Ticker_ID'].isin(missing_codes)]
-
-def tickers_update() -> None:
-    """Update database with new tickers from EODHD."""
+# Tables created before change detection existed
+ALTER_TABLE_QUERY = """
+    ALTER TABLE global_tickers
+        ADD COLUMN IF NOT EXISTS Row_Hash CHAR(32),
+        ADD COLUMN IF NOT EXISTS Is_Active TINYINT(1) NOT NULL DEFAULT 1;
+"""
+
+def _get_exchange_list(db_config: Dict[str, Any]) -> pd.DataFrame:
+    """Retrieve list of active exchange codes from the shared reference data."""
+    return reference_data.get_reference(db_config).exchange_codes()
+
+def _get_eodhd_tickers(eod_exchange: str, exchanges: List[str]) -> Optional[pd.DataFrame]:
+    """Retrieve tickers for one EODHD exchange code and the local exchanges it serves.
+
+    EODHD serves all US venues under the 'US' code, so the list is requested
+    once and split by the local exchange codes.
+    """
+    eod_tickers = eodhd_utils.retrieve_tickers(EODHD_CONFIG['api_key'], eod_exchange)
+    if eod_tickers is None:
+        return None
+
+    # Filter by exchanges passed from database. Required to ensure that we
+    # only process tickers for known exchanges and not all 'US' venues
+    eod_tickers = eod_tickers[eod_tickers['Exchange'].isin(exchanges)].copy()
+    exchange_codes = eod_tickers['Exchange'].astype(object)
+    eod_tickers['Source'] = 'EoDHD.com - Exchange ' + exchange_codes
+    eod_tickers['Ticker_ID'] = eod_tickers['Ticker'].astype(object) + '_' + exchange_codes
+    return eod_tickers
+
+def tickers_update(access: Dict[str, Any] = DB_CONFIG) -> None:
+    """Synchronise the database tickers with EODHD.
+
+    Args:
+        access: Database connection configuration dictionary
+    """
     try:
         # Initialize database table
-        database_utils.execute_query(DB_CONFIG, CREATE_TABLE_QUERY)
+        database_utils.execute_query(access, CREATE_TABLE_QUERY)
+        database_utils.execute_query(access, ALTER_TABLE_QUERY)
+        price_layout.ensure_ticker_keys(access)
         logger.debug("Ensured global_tickers table exists")
 
         # Get exchange list from database containing exhchange and eod_exchange
-        exchange_list = _get_exchange_list(DB_CONFIG)
-        logger.debug(f"Retrieved {len(exchange_list)} exchanges from database")
-        total_tickers = 0
-        for exchanges in exchange_list.itertuples(): # Iterate over exchenge list from database
-            exchange=exchanges.Exchange
-            eod_exchange = exchanges.EoDHD_Exchange
+        exchange_list = _get_exchange_list(access)
+        logger.debug("Retrieved %s exchanges from database", len(exchange_list))
+        # Exchanges listing the best tiers first, exchanges without tiers last
+        tiers = universe.exchange_tiers(access)
+        exchange_list = exchange_list.sort_values(
+            'EoDHD_Exchange', key=lambda codes: codes.map(tiers).fillna(universe.DEFAULT_TIER),
+            kind='stable'
+        )
+
+        snapshots = []
+        synced_exchanges = []
+        for eod_exchange, group in exchange_list.groupby('EoDHD_Exchange', sort=False):
+            exchanges = group['Exchange'].tolist()
             try:
-                # Get current database tickers
-                db_tickers = _get_db_tickers(DB_CONFIG, exchange)
-                logger.debug(f"Retrieved tickers for exchange {exchange}")
-
-                # Get EODHD tickers
-                eod_tickers = eodhd_utils.retrieve_tickers(
-                    EODHD_CONFIG['api_key'], 
-                    eod_exchange
-                )
-                
-                # Filter by exchange passed fom database. Required to ensure
-                # that we only process tickers for the current exchange and
-                # not all tickers for 'US' stocks when passed 
-                eod_tickers = eod_tickers[eod_tickers['Exchange'] == exchange]
-
-                eod_tickers['Source'] = f'EoDHD.com - Exchange {exchange}'
-                eod_tickers['Ticker_ID'] = eod_tickers['Ticker'] + f'_{exchange}'
-                # Skip if no data retrieved
-                if eod_tickers is None:
-                    logger.warning(f"No ticker data for exchange {exchange} requested using ({eod_exchange})")
-                    continue
-
-                # Validate data structure
-                if not np.array_equal(eod_tickers.columns.values, TICKER_COLUMNS):
-                    logger.error(f"Column mismatch for exchange {exchange} requested using ({eod_exchange})")
-                    continue
-
-                # Find and add missing tickers
-                missing_tickers = _find_missing_tickers(eod_tickers, db_tickers)
-                
-                if not missing_tickers.empty:
-                    columns, values = _prepare_tickers_for_upload(missing_tickers)
-                    query = f'INSERT INTO global_tickers ({columns}) VALUES {values};'
-                    database_utils.execute_query(DB_CONFIG, query)
-                    total_tickers += len(missing_tickers)
-                    logger.debug(f"Added {len(missing_tickers)} tickers for {exchange} requested using ({eod_exchange})")
+                with profiling.section(eod_exchange):
+                    eod_tickers = _get_eodhd_tickers(eod_exchange, exchanges)
+
+                    # Skip if no data retrieved
+                    if eod_tickers is None:
+                        logger.warning(f"No ticker data for exchanges {exchanges} requested using ({eod_exchange})")
+                        continue
+
+                    # Validate data structure
+                    if not np.array_equal(eod_tickers.columns.values, TICKER_COLUMNS):
+                        logger.error(f"Column mismatch for exchanges {exchanges} requested using ({eod_exchange})")
+                        continue
+
+                    snapshots.append(eod_tickers)
+                    synced_exchanges.extend(exchanges)
+                    logger.debug("Retrieved %s tickers for %s requested using (%s)", len(eod_tickers), exchanges, eod_exchange)
 
             except Exception as e:
-                logger.error(f"Error processing exchange {exchange} requested using ({eod_exchange}): {str(e)}")
+                logger.error(f"Error processing exchanges {exchanges} requested using ({eod_exchange}): {str(e)}")
                 continue
 
-        if total_tickers > 0:
-            logger.info(f"Added {total_tickers} new tickers to database")
-        else:
-            logger.info("No new tickers found")
+        if not snapshots:
+            logger.warning("No ticker data retrieved from EODHD")
+            return
+
+        snapshot = pd.concat(snapshots, ignore_index=True)
+        stats = database_utils.reconcile_table(
+            access, 'global_tickers', 'Ticker_ID', TICKER_COLUMNS,
+            HASH_COLUMNS, snapshot,
+            scope_column='Exchange', scope_values=synced_exchanges
+        )
+
+        logger.info(
+            f"Ticker sync for {len(synced_exchanges)} exchanges: "
+            f"{stats['inserted']} added, {stats['updated']} updated, "
+            f"{stats['deactivated']} marked inactive"
+        )
+        if any(stats.values()):
+            for exchange in synced_exchanges:
+                query_cache.invalidate(query_cache.SCOPE_TICKERS, exchange)
+            reference_data.refresh(access)
+
+        universe.assign_tiers(access)
 
     except Exception as e:
         logger.error("Failed to update tickers", exc_info=True)
         raise
 
 if __name__ == "__main__":
-    tickers_update()
\ No newline at end of file
+    tickers_update()
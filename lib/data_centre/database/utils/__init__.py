@@ -1,20 +1,39 @@
 """ Database utility functions for Project Seldon.
 Provides common database operations and helper functions.
+
+Functions are imported from their modules on first access, so importing one
+utility module does not load the others (e.g. requests for eodhd_utils).
 """
 
-from .database_utils import (
-    execute_query,
-    retrieve_table,
-    add_stock_price,
-    clear_all_views
-)
+# Standard library imports
+import importlib
+
+# Function name -> module defining it
+_EXPORTS = {
+    'execute_query': 'database_utils',
+    'retrieve_table': 'database_utils',
+    'add_stock_price': 'database_utils',
+    'clear_all_views': 'database_utils',
+    'retrieve_daily_price': 'eodhd_utils',
+    'retrieve_historical_price': 'eodhd_utils',
+    'retrieve_exchanges': 'eodhd_utils',
+    'retrieve_tickers': 'eodhd_utils',
+    'validate_prices': 'price_validation',
+    'validate_and_quarantine': 'price_validation',
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
 
-from .eodhd_utils import (
-    retrieve_daily_price,
-    retrieve_historical_price,
-    retrieve_exchanges,
-    retrieve_tickers
-)
 
 # Define what should be available when using "from utils import *"
 __all__ = [
@@ -25,5 +44,7 @@ __all__ = [
     'retrieve_daily_price',
     'retrieve_historical_price',
     'retrieve_exchanges',
-    'retrieve_tickers'
-]
\ No newline at end of file
+    'retrieve_tickers',
+    'validate_prices',
+    'validate_and_quarantine'
+]
@@ -0,0 +1,269 @@
+"""Price Change Log Module
+
+Every path that writes price rows appends compact change records to the
+append-only price_changes table: one record per year table and ticker with
+the date range and number of rows written, the writing source and the run it
+belongs to. Downstream services tail the log from a durable offset and read
+only the rows that changed, instead of polling the price tables with
+`WHERE Date > ?` scans.
+
+Date_From, Date_To and Row_Count are NULL when the writer cannot tell which
+rows changed, e.g. an Adjusted_Close rewrite; the record then covers every
+row of the ticker in the table, or every row of the table when Ticker_ID is
+NULL as well.
+
+Records are appended in their own short transaction right after the price
+rows are committed. A consumer therefore never sees a record before the rows
+it describes, but a crash between the two commits loses the record. Seq is
+assigned on insert, so a record can commit after one with a higher Seq;
+consumers only read records older than SETTLE_SECONDS to not skip past it.
+
+Usage:
+    consumer = ChangeConsumer('matrix_refresh')
+    for changes in consumer.tail():
+        refresh(changes)
+        consumer.commit(changes['Seq'].max())
+"""
+
+# Standard library imports
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+SETTLE_SECONDS = 5
+POLL_INTERVAL = 5.0
+READ_BATCH = 10000
+# Records older than this are pruned even if a consumer has not read them
+RETENTION_DAYS = 14
+
+CHANGE_COLUMNS = [
+    'Seq', 'Run_ID', 'Source', 'Exchange', 'Table_Name', 'Ticker_ID',
+    'Date_From', 'Date_To', 'Row_Count', 'Created'
+]
+
+CREATE_CHANGES_QUERY = """
+    CREATE TABLE IF NOT EXISTS price_changes (
+        Seq BIGINT AUTO_INCREMENT,
+        Run_ID VARCHAR(36),
+        Source VARCHAR(32),
+        Exchange VARCHAR(255),
+        Table_Name VARCHAR(255),
+        Ticker_ID VARCHAR(255),
+        Date_From DATE,
+        Date_To DATE,
+        Row_Count INT,
+        Created DATETIME,
+        PRIMARY KEY (Seq),
+        INDEX idx_price_changes_created (Created)
+    );
+"""
+
+CREATE_CONSUMERS_QUERY = """
+    CREATE TABLE IF NOT EXISTS change_consumers (
+        Consumer VARCHAR(64),
+        Seq BIGINT NOT NULL DEFAULT 0,
+        Date_Updated DATETIME,
+        PRIMARY KEY (Consumer)
+    );
+"""
+
+INSERT_CHANGE_QUERY = """
+    INSERT INTO price_changes (
+        Run_ID, Source, Exchange, Table_Name, Ticker_ID,
+        Date_From, Date_To, Row_Count, Created
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW());
+"""
+
+SELECT_CHANGES_QUERY = f"""
+    SELECT {', '.join(CHANGE_COLUMNS)}
+    FROM price_changes
+    WHERE Seq > %s AND Created <= NOW() - INTERVAL %s SECOND
+    ORDER BY Seq
+    LIMIT %s;
+"""
+
+SELECT_OFFSET_QUERY = "SELECT Seq FROM change_consumers WHERE Consumer = %s;"
+
+# Offsets only move forward, a late commit of an older batch is ignored
+COMMIT_OFFSET_QUERY = """
+    INSERT INTO change_consumers (Consumer, Seq, Date_Updated)
+    VALUES (%s, %s, NOW())
+    ON DUPLICATE KEY UPDATE
+        Seq = GREATEST(Seq, VALUES(Seq)),
+        Date_Updated = NOW();
+"""
+
+# Records every consumer has read, and records past the retention period
+PRUNE_CHANGES_QUERY = """
+    DELETE FROM price_changes
+    WHERE Seq <= (SELECT COALESCE(MIN(Seq), 0) FROM change_consumers)
+       OR Created < NOW() - INTERVAL %s DAY;
+"""
+
+# Run of the process when no job graph run is active
+_process_run_id = str(uuid.uuid4())
+_run = threading.local()
+# Databases whose tables were already checked in this process
+_ensured = set()
+
+
+def ensure_tables(access: Dict[str, Any]) -> None:
+    """Create the change log and consumer offset tables if they don't exist."""
+    if access.get('database') in _ensured:
+        return
+    with database_utils.db_connection(access) as cursor:
+        cursor.execute(CREATE_CHANGES_QUERY)
+        cursor.execute(CREATE_CONSUMERS_QUERY)
+    _ensured.add(access.get('database'))
+
+
+def current_run_id() -> str:
+    """Run ID recorded with changes made by the calling thread."""
+    return getattr(_run, 'run_id', None) or _process_run_id
+
+
+@contextmanager
+def run_scope(run_id: str) -> Iterator[None]:
+    """Record changes made by the calling thread inside the block under run_id."""
+    previous = getattr(_run, 'run_id', None)
+    _run.run_id = run_id
+    try:
+        yield
+    finally:
+        _run.run_id = previous
+
+
+def summarise(exchange: str, table: str, prices: pd.DataFrame) -> pd.DataFrame:
+    """Change records of price rows written to one table, one per ticker.
+
+    Args:
+        exchange: Exchange code
+        table: Price table the rows were written to
+        prices: Written rows with Ticker_ID and Date
+
+    Returns:
+        Frame with Exchange, Table_Name, Ticker_ID, Date_From, Date_To and Row_Count
+    """
+    summary = prices.groupby(prices['Ticker_ID'].astype(str), sort=False)['Date'].agg(
+        Date_From='min', Date_To='max', Row_Count='size'
+    ).reset_index()
+    summary.insert(0, 'Table_Name', table)
+    summary.insert(0, 'Exchange', exchange)
+    return summary
+
+
+def record_changes(access: Dict[str, Any], source: str, changes: pd.DataFrame) -> int:
+    """Append change records to the log.
+
+    Args:
+        access: Database connection configuration dictionary
+        source: Write path that made the changes, e.g. 'daily' or 'history'
+        changes: Frame with Exchange, Table_Name, Ticker_ID, Date_From,
+            Date_To and Row_Count, see summarise()
+
+    Returns:
+        Number of records appended
+    """
+    if changes.empty:
+        return 0
+    ensure_tables(access)
+    records = changes[['Exchange', 'Table_Name', 'Ticker_ID', 'Date_From', 'Date_To', 'Row_Count']]
+    records = records.assign(Run_ID=current_run_id(), Source=source)
+    try:
+        with database_utils.db_connection(access) as cursor:
+            cursor.executemany(
+                INSERT_CHANGE_QUERY,
+                database_utils.dataframe_to_rows(records[[
+                    'Run_ID', 'Source', 'Exchange', 'Table_Name', 'Ticker_ID',
+                    'Date_From', 'Date_To', 'Row_Count'
+                ]])
+            )
+    except Exception as e:
+        # The prices are committed already, a lost record must not fail the write
+        logger.error(f"Failed to record {len(records)} price changes from {source}: {e}")
+        return 0
+    return len(records)
+
+
+def prune(access: Dict[str, Any] = DB_CONFIG) -> int:
+    """Delete records read by every consumer or older than RETENTION_DAYS."""
+    ensure_tables(access)
+    return database_utils.execute_query(access, PRUNE_CHANGES_QUERY, (RETENTION_DAYS,))
+
+
+class ChangeConsumer:
+    """Reads the change log from a durable, named offset.
+
+    Delivery is at least once: a batch is read again after a restart until
+    its last Seq is committed.
+
+    Args:
+        name: Consumer name, the offset is stored under it
+        access: Database connection configuration dictionary
+        start: Offset of a new consumer, 'latest' to skip the existing records
+            or 'earliest' to read them
+    """
+
+    def __init__(self, name: str, access: Dict[str, Any] = DB_CONFIG, start: str = 'latest'):
+        self.name = name
+        self.access = access
+        ensure_tables(access)
+        row = database_utils.retrieve_table(access, SELECT_OFFSET_QUERY, (name,))
+        if row:
+            self.offset = int(row[0][0])
+        else:
+            self.offset = 0
+            if start == 'latest':
+                latest = database_utils.retrieve_table(
+                    access, "SELECT COALESCE(MAX(Seq), 0) FROM price_changes;"
+                )
+                self.offset = int(latest[0][0])
+            self.commit(self.offset)
+
+    def poll(self, limit: int = READ_BATCH) -> pd.DataFrame:
+        """Records after the read position, oldest first.
+
+        The read position moves past the returned records, the durable offset
+        only moves on commit().
+        """
+        rows = database_utils.retrieve_table(
+            self.access, SELECT_CHANGES_QUERY, (self.offset, SETTLE_SECONDS, limit)
+        )
+        changes = pd.DataFrame(rows, columns=CHANGE_COLUMNS)
+        if not changes.empty:
+            self.offset = int(changes['Seq'].iloc[-1])
+        return changes
+
+    def commit(self, seq: int) -> None:
+        """Store seq as the offset the consumer resumes from."""
+        database_utils.execute_query(self.access, COMMIT_OFFSET_QUERY, (self.name, int(seq)))
+
+    def tail(self, poll_interval: float = POLL_INTERVAL,
+             stop: Optional[threading.Event] = None) -> Iterator[pd.DataFrame]:
+        """Yield batches of new records as they arrive, until stop is set.
+
+        Full batches are followed by the next read right away, the log is only
+        polled every poll_interval seconds once the consumer has caught up.
+        """
+        while stop is None or not stop.is_set():
+            changes = self.poll()
+            if not changes.empty:
+                yield changes
+            if len(changes) < READ_BATCH:
+                if stop is not None:
+                    stop.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
@@ -0,0 +1,184 @@
+"""Close Price Table Module
+
+This module maintains one indexed {exchange}_close_price table per exchange,
+keyed by (Ticker_ID, Date). The tables replace the UNION ALL views over every
+prices_{exchange}_{year} table: ingest paths upsert only the rows they just
+loaded, and a full rebuild reloads a table from its year tables and swaps it
+in atomically.
+"""
+
+# Standard library imports
+from typing import Any, Dict, Optional
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_layout
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+CLOSE_PRICE_COLUMNS = ['Ticker_ID', 'Date', 'Close', 'Adjusted_Close']
+
+CREATE_CLOSE_PRICE_QUERY = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        Ticker_ID VARCHAR(255),
+        Date DATE,
+        Close DECIMAL(20,6),
+        Adjusted_Close DECIMAL(20,6),
+        PRIMARY KEY (Ticker_ID, Date),
+        INDEX idx_{table}_date (Date)
+    );
+"""
+
+# Rebuilds load into a table without the Date index and add it afterwards,
+# one sorted index build is much faster than maintaining it row by row
+CREATE_CLOSE_PRICE_LOAD_QUERY = """
+    CREATE TABLE {table} (
+        Ticker_ID VARCHAR(255),
+        Date DATE,
+        Close DECIMAL(20,6),
+        Adjusted_Close DECIMAL(20,6),
+        PRIMARY KEY (Ticker_ID, Date)
+    );
+"""
+
+ADD_DATE_INDEX_QUERY = "ALTER TABLE {staging} ADD INDEX idx_{table}_date (Date);"
+
+UPSERT_SUFFIX = """
+    ON DUPLICATE KEY UPDATE
+        Close = VALUES(Close),
+        Adjusted_Close = VALUES(Adjusted_Close);
+"""
+
+LEGACY_VIEW_QUERY = """
+    SELECT COUNT(*) FROM INFORMATION_SCHEMA.VIEWS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s;
+"""
+
+# (database, table) pairs already checked in this process
+_ensured = set()
+
+
+def close_price_table(exchange: str) -> str:
+    """Name of the close price table of an exchange."""
+    return f"{exchange}_close_price"
+
+
+def ensure_close_price_table(access: Dict[str, Any], exchange: str) -> str:
+    """Create the close price table of an exchange, replacing a legacy view.
+
+    Returns:
+        Name of the close price table
+    """
+    table = close_price_table(exchange)
+    marker = (access.get('database'), table)
+    if marker in _ensured:
+        return table
+
+    if database_utils.retrieve_table(access, LEGACY_VIEW_QUERY, (table,))[0][0]:
+        database_utils.execute_query(access, f"DROP VIEW IF EXISTS {table};")
+        logger.info(f"Dropped legacy view {table}")
+    database_utils.execute_query(access, CREATE_CLOSE_PRICE_QUERY.format(table=table))
+    _ensured.add(marker)
+    return table
+
+
+def upsert_close_prices(access: Dict[str, Any], exchange: str, prices: pd.DataFrame) -> int:
+    """Upsert freshly loaded price rows into the close price table.
+
+    Args:
+        access: Database connection configuration dictionary
+        exchange: Exchange code
+        prices: Frame with at least Ticker_ID, Date, Close and Adjusted_Close
+
+    Returns:
+        Number of rows written
+    """
+    if prices.empty:
+        return 0
+    table = ensure_close_price_table(access, exchange)
+    query = (
+        f"INSERT INTO {table} ({', '.join(CLOSE_PRICE_COLUMNS)}) "
+        f"VALUES ({', '.join(['%s'] * len(CLOSE_PRICE_COLUMNS))})" + UPSERT_SUFFIX
+    )
+    with database_utils.db_connection(access) as cursor:
+        cursor.executemany(query, database_utils.dataframe_to_rows(prices[CLOSE_PRICE_COLUMNS]))
+    return len(prices)
+
+
+def upsert_close_prices_from(cursor, exchange: str, select_query: str,
+                             params: Optional[tuple] = None) -> int:
+    """Upsert rows selected on the server into the close price table.
+
+    Runs on an open cursor so it can read temporary staging tables. The
+    select must return Ticker_ID, Date, Close and Adjusted_Close.
+
+    Returns:
+        Number of affected rows
+    """
+    cursor.execute(
+        f"INSERT INTO {close_price_table(exchange)} ({', '.join(CLOSE_PRICE_COLUMNS)}) "
+        + select_query.strip().rstrip(';') + UPSERT_SUFFIX,
+        params
+    )
+    return cursor.rowcount
+
+
+def sync_close_prices(access: Dict[str, Any], exchange: str) -> int:
+    """Catch the close price table up with rows newer than its latest date.
+
+    Only the year tables at or after the latest stored date are read.
+
+    Returns:
+        Number of affected rows
+    """
+    table = ensure_close_price_table(access, exchange)
+    latest = database_utils.retrieve_table(access, f"SELECT MAX(Date) FROM {table};")[0][0]
+    affected = 0
+    for year_table, compact in price_layout.year_tables(access, exchange):
+        if latest is not None and int(year_table.rsplit('_', 1)[1]) < latest.year:
+            continue
+        with database_utils.db_connection(access) as cursor:
+            affected += upsert_close_prices_from(
+                cursor, exchange,
+                f"SELECT {', '.join(CLOSE_PRICE_COLUMNS)} "
+                f"FROM {price_layout.price_source(year_table, compact)} "
+                + ("WHERE Date > %s" if latest is not None else ""),
+                (latest,) if latest is not None else None
+            )
+    return affected
+
+
+def rebuild_close_price_table(access: Dict[str, Any], exchange: str) -> int:
+    """Rebuild the close price table of an exchange from all of its year tables.
+
+    The new table is loaded next to the live one, indexed once loaded and
+    swapped in with a single RENAME TABLE, so readers never see a partial table.
+
+    Returns:
+        Number of rows in the rebuilt table
+    """
+    table = ensure_close_price_table(access, exchange)
+    staging, old = f"{table}_rebuild", f"{table}_old"
+    year_tables = price_layout.year_tables(access, exchange)
+
+    with database_utils.db_connection(access) as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}, {old};")
+        cursor.execute(CREATE_CLOSE_PRICE_LOAD_QUERY.format(table=staging))
+        for year_table, compact in year_tables:
+            cursor.execute(
+                f"INSERT INTO {staging} ({', '.join(CLOSE_PRICE_COLUMNS)}) "
+                f"SELECT {', '.join(CLOSE_PRICE_COLUMNS)} "
+                f"FROM {price_layout.price_source(year_table, compact)}" + UPSERT_SUFFIX
+            )
+        cursor.execute(ADD_DATE_INDEX_QUERY.format(staging=staging, table=table))
+        cursor.execute(f"SELECT COUNT(*) FROM {staging};")
+        rows = cursor.fetchone()[0]
+        cursor.execute(f"RENAME TABLE {table} TO {old}, {staging} TO {table};")
+        cursor.execute(f"DROP TABLE IF EXISTS {old};")
+
+    logger.debug("Rebuilt %s from %s year tables with %s rows", table, len(year_tables), rows)
+    return rows
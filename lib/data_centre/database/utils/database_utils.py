@@ -1,4 +1,5 @@
 # Local application imports
+import hashlib
 from contextlib import contextmanager
 from mysql.connector import connect, Error
 from config.connections.database_access import TABLE_SCHEMA
@@ -10,6 +11,34 @@ logger = logger_factory.get_logger('database', module_name=__name__)
 # Third-party imports
 import pandas as pd
 
+# Longest query text written to the log, longer queries are cut and hashed
+QUERY_LOG_CHARS = 200
+
+# Tables or views dropped per DROP statement
+DROP_BATCH_SIZE = 100
+
+
+class QueryText:
+    """Query text for log messages, rendered only when a record is emitted.
+
+    Whitespace is collapsed and queries longer than QUERY_LOG_CHARS are cut,
+    with their length and an MD5 digest so repeated statements can be matched.
+    """
+
+    __slots__ = ('query',)
+
+    def __init__(self, query):
+        self.query = query
+
+    def __str__(self):
+        query = str(self.query)
+        text = ' '.join(query[:QUERY_LOG_CHARS * 2].split())
+        if len(query) <= QUERY_LOG_CHARS * 2 and len(text) <= QUERY_LOG_CHARS:
+            return text
+        digest = hashlib.md5(query.encode()).hexdigest()[:12]
+        return f"{text[:QUERY_LOG_CHARS]}... [{len(query)} chars, md5 {digest}]"
+
+
 @contextmanager
 def db_connection(access):
     """Creates and manages database connections automatically."""
@@ -27,29 +56,153 @@ def db_connection(access):
     except Error as e:
         if conn:
             conn.rollback()
-        logger.error(f"Database error: {str(e)}")
+        logger.error("Database error: %s", e)
         raise
     finally:
         if conn:
             conn.close()
 
 
-def execute_query(access, query):
-    """Executes a SQL query using the database connection."""
+def execute_query(access, query, params=None):
+    """Executes a SQL query using the database connection.
+
+    Returns the number of rows affected by the query.
+    """
     with db_connection(access) as cursor:
-        cursor.execute(query)
-        logger.debug(f"Execution complete for query: {query}")
+        cursor.execute(query, params)
+        logger.debug("Execution complete for query: %s", QueryText(query))
+        return cursor.rowcount
 
 
-def retrieve_table(access, query):
+def retrieve_table(access, query, params=None):
     """Takes access credentials and query and returns table as list of tuples."""
     with db_connection(access) as cursor:
-        cursor.execute(query)
+        cursor.execute(query, params)
         table = cursor.fetchall()
-        logger.debug(f"Execution complete for query: {query}")
+        logger.debug("Execution complete for query: %s", QueryText(query))
         return table
 
 
+def price_year_tables(access, exchange):
+    """List the prices_{exchange}_{year} tables of an exchange in year order."""
+    query = """
+        SELECT TABLE_NAME
+        FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME REGEXP %s
+        ORDER BY TABLE_NAME;
+    """
+    pattern = f'^prices_{exchange}_[0-9]{{4}}$'
+    return [row[0] for row in retrieve_table(access, query, (pattern,))]
+
+
+def dataframe_to_rows(df):
+    """Convert a DataFrame to a list of tuples of plain Python values.
+
+    Missing values become None and datetime columns become datetime objects,
+    so the rows can be passed straight to a parameterised query.
+    """
+    columns = []
+    for column in df.columns:
+        series = df[column]
+        missing = series.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # Microsecond precision converts to datetime.datetime objects
+            values = series.to_numpy(dtype='datetime64[us]').astype(object)
+        else:
+            values = series.astype(object).to_numpy()
+        if missing.any():
+            values[missing] = None
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def reconcile_table(access, table, key, columns, hash_columns, df,
+                    scope_column=None, scope_values=None):
+    """Synchronise a reference table with a full snapshot from the source.
+
+    The snapshot is bulk loaded into a temporary staging table and reconciled
+    on the server: new keys are inserted, rows whose hash over hash_columns
+    changed are updated, and active rows missing from the snapshot are marked
+    inactive. Deactivation is limited to rows whose scope_column is in
+    scope_values, so exchanges that failed to download are left alone.
+
+    Args:
+        access: Database connection configuration dictionary
+        table: Target table with Row_Hash and Is_Active columns
+        key: Primary key column
+        columns: Columns loaded from the snapshot
+        hash_columns: Columns that define a change of a row
+        df: Snapshot DataFrame containing at least columns
+        scope_column: Optional column limiting deactivation
+        scope_values: Values of scope_column covered by the snapshot
+
+    Returns:
+        Dictionary with inserted, updated and deactivated row counts
+    """
+    staging = f"{table}_staging"
+    column_list = ', '.join(columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    row_hash = "MD5(CONCAT_WS('|', {}))".format(
+        ', '.join(f"COALESCE({column}, '')" for column in hash_columns)
+    )
+    unchanged = f"{table}.Row_Hash <=> VALUES(Row_Hash) AND {table}.Is_Active = 1"
+    assignments = ', '.join(
+        f"{column} = IF({unchanged}, {table}.{column}, VALUES({column}))"
+        for column in columns if column != key
+    )
+
+    stats = {'inserted': 0, 'updated': 0, 'deactivated': 0}
+    with db_connection(access) as cursor:
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging};")
+        cursor.execute(f"CREATE TEMPORARY TABLE {staging} LIKE {table};")
+        cursor.executemany(
+            f"INSERT IGNORE INTO {staging} ({column_list}) VALUES ({placeholders});",
+            dataframe_to_rows(df[columns])
+        )
+        cursor.execute(f"UPDATE {staging} SET Row_Hash = {row_hash};")
+
+        cursor.execute(f"""
+            SELECT COALESCE(SUM(t.{key} IS NULL), 0),
+                   COALESCE(SUM(t.{key} IS NOT NULL
+                       AND NOT (t.Row_Hash <=> s.Row_Hash AND t.Is_Active = 1)), 0)
+            FROM {staging} s
+            LEFT JOIN {table} t ON t.{key} = s.{key};
+        """)
+        inserted, updated = cursor.fetchone()
+        stats['inserted'], stats['updated'] = int(inserted), int(updated)
+
+        # Inserts and hash-detected updates in a single statement
+        cursor.execute(f"""
+            INSERT INTO {table} ({column_list}, Row_Hash, Is_Active)
+            SELECT {column_list}, Row_Hash, 1 FROM {staging}
+            ON DUPLICATE KEY UPDATE
+                {assignments},
+                Is_Active = 1,
+                Row_Hash = VALUES(Row_Hash);
+        """)
+
+        scope_filter, scope_params = '', ()
+        if scope_column is not None:
+            if not scope_values:
+                scope_filter = 'AND FALSE'
+            else:
+                scope_filter = f"AND t.{scope_column} IN ({', '.join(['%s'] * len(scope_values))})"
+                scope_params = tuple(scope_values)
+        cursor.execute(f"""
+            UPDATE {table} t
+            LEFT JOIN {staging} s ON s.{key} = t.{key}
+            SET t.Is_Active = 0, t.Date_Updated = NOW()
+            WHERE t.Is_Active = 1 AND s.{key} IS NULL {scope_filter};
+        """, scope_params)
+        stats['deactivated'] = cursor.rowcount
+
+        cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging};")
+
+    logger.debug("Reconciled %s: %s", table, stats)
+    return stats
+
+
 def add_stock_price(global_price_df, exchange, year, access):
     """ Takes a dataframe of stock prices and adds them to the database
     --------------------------------------------------------------------------
@@ -58,14 +211,17 @@ def add_stock_price(global_price_df, exchange, year, access):
     # FORMAT STOCK PRICE DATA FOR UPLOAD TO SELDON_DB      
     global_prices_columns = global_price_df.columns.values # Get column names from stock price data
     columns = ', '.join(global_prices_columns) # Columns prepped
-    global_prices = str(global_price_df.values.tolist()) # Convert stock price data to list
+    upload_df = global_price_df.astype(object) # Categorical and numpy values to plain Python values
+    for column in global_price_df.select_dtypes(include='datetime').columns:
+        upload_df[column] = global_price_df[column].dt.strftime('%Y-%m-%d')
+    global_prices = str(upload_df.values.tolist()) # Convert stock price data to list
     global_prices = global_prices.replace('[', '(').replace(']', ')') # Replace brackets with parentheses
     global_prices = global_prices[1:-1] # Remove first and last characters (brackets)
     
     # ADD STOCK PRICES TO SELDON_DB
     add_record_query = f'INSERT INTO prices_{exchange}_{year} ({columns}) VALUES {global_prices};'
     execute_query(access, add_record_query)
-    logger.debug(f"Global prices added to seldon_db")
+    logger.debug("Global prices added to seldon_db")
 
 
 
@@ -93,6 +249,32 @@ def reset_price_tables(access):
         execute_query(access, create_prices_table_query) 
 
 
+def drop_objects(access, names, kind='TABLE', schema=None):
+    """Drop tables or views in batches over a single connection.
+
+    Args:
+        access: Database connection configuration dictionary
+        names: Table or view names to drop
+        kind: 'TABLE' or 'VIEW'
+        schema: Schema holding the objects, the connection's database if None
+
+    Returns:
+        Number of objects dropped
+    """
+    names = list(names)
+    if not names:
+        return 0
+    prefix = f"`{schema}`." if schema else ''
+    with db_connection(access) as cursor:
+        for start in range(0, len(names), DROP_BATCH_SIZE):
+            batch = names[start:start + DROP_BATCH_SIZE]
+            cursor.execute(
+                f"DROP {kind} IF EXISTS {', '.join(f'{prefix}`{name}`' for name in batch)};"
+            )
+            logger.debug("Dropped %s %s %s objects", len(batch), kind.lower(), schema or '')
+    return len(names)
+
+
 def clear_all_tables(access: dict) -> None:
     """Clear all tables from the database.
     
@@ -106,19 +288,17 @@ def clear_all_tables(access: dict) -> None:
         mysql.connector.Error: If database operations fail
     """
     try:
-        # Get list of all tables
-        tables = retrieve_table(access, "SHOW TABLES;")
+        # Get list of all tables, views are dropped by clear_all_views
+        tables = retrieve_table(access, "SHOW FULL TABLES WHERE Table_type = 'BASE TABLE';")
         
         if not tables:
             logger.info("No tables to drop")
             return
             
-        # Extract table names and drop each table
+        # Extract table names and drop them in batches
         table_names = [table[0] for table in tables]
-        for table in table_names:
-            execute_query(access, f"DROP TABLE IF EXISTS {table};")
-            logger.debug(f"Dropped table: {table}")
-            
+        drop_objects(access, table_names)
+
         logger.info(f"Successfully dropped {len(table_names)} tables")
         
     except Error as e:
@@ -145,10 +325,8 @@ def clear_all_views(access: dict) -> None:
             return
             
         view_names = [view[0] for view in views]
-        for view in view_names:
-            execute_query(access, f"DROP VIEW IF EXISTS {view};")
-            logger.debug(f"Dropped view: {view}")
-            
+        drop_objects(access, view_names, kind='VIEW')
+
         logger.info(f"Successfully cleared {len(view_names)} views")
             
     except Error as e:
@@ -12,6 +12,7 @@ import pandas as pd
 import requests
 
 from config.settings.logging import logger_factory
+from lib.data_centre.database.utils import schema
 
 logger = logger_factory.get_logger('database', module_name=__name__)
 
@@ -26,6 +27,9 @@ PRICE_COLUMNS = [
     'Volume', 'Ticker_ID'
 ]
 
+# API calls counted by EODHD for one bulk request of a whole exchange
+BULK_REQUEST_COST = 100
+
 REWRITE_PRICE_COLUMNS = [
     'Ticker', 'Exchange', 'Date', 'Open', 'High', 'Low',
     'Close', 'Adjusted_Close', 'Volume', 'Ticker_ID', 'Source',
@@ -92,6 +96,10 @@ class APIEndpoints:
     TICKERS = f"{BASE_URL}/exchange-symbol-list"
     HISTORICAL = f"{BASE_URL}/eod"
     DAILY = f"{BASE_URL}/eod-bulk-last-day"
+    SPLITS = f"{BASE_URL}/splits"
+    DIVIDENDS = f"{BASE_URL}/div"
+    EXCHANGE_DETAILS = f"{BASE_URL}/exchange-details"
+    USER = f"{BASE_URL}/user"
 
 
 def _make_api_request(url: str) -> Optional[Dict[str, Any]]:
@@ -126,11 +134,11 @@ def retrieve_tickers(api_key: str, eod_exchange: str) -> Optional[pd.DataFrame]:
         df['Source'] = None # f'EoDHD.com - Exchange {eod_exchange}'
         df['Date_Updated'] = datetime.datetime.now()
         df['Ticker_ID'] = None # df['Ticker'] + f'_{eod_exchange}'
-        df['EoDHD_Exchange']=df['Exchange'].apply(lambda x: 'US' if x in list(US_EXCHANGES.keys()) else x)
+        df['EoDHD_Exchange'] = schema.map_eodhd_exchange(df['Exchange'], US_EXCHANGES)
 
-        
-        return df[['Ticker_ID', 'Ticker', 'Name', 'Country', 'Exchange', 'EoDHD_Exchange',
-                  'Currency', 'Type', 'Isin', 'Source', 'Date_Updated']]
+        df = df[['Ticker_ID', 'Ticker', 'Name', 'Country', 'Exchange', 'EoDHD_Exchange',
+                 'Currency', 'Type', 'Isin', 'Source', 'Date_Updated']]
+        return schema.compact_boundary(df, schema.TICKER_DTYPES, f'tickers {eod_exchange}')
     except Exception as e:
         logger.error(f"Failed to process ticker data for {eod_exchange}: {e}")
         return None
@@ -165,43 +173,48 @@ def retrieve_exchanges(api_key: str) -> Optional[pd.DataFrame]:
             for code, exchange_data in US_EXCHANGES.items()
         ])
         
-        return pd.concat([df, us_exchanges], ignore_index=True)
+        df = pd.concat([df, us_exchanges], ignore_index=True)
+        return schema.compact_boundary(df, schema.EXCHANGE_DTYPES, 'exchanges')
     except Exception as e:
         logger.error(f"Failed to process exchange data: {e}", exc_info=True)
         return None
 
 
-def retrieve_historical_price(exchange, ticker, date_to, eodhd_api):
+def retrieve_historical_price(exchange, ticker, date_to, eodhd_api, date_from='1900-01-01'):
     """ Takes api credentials for eodhd.com, a ticker and date range and returns a pandas dataframe containing 
     all historical prices for the target ticker
     """
     eod_ticker = f'{ticker}.{exchange}' # EoDHD.com ticker format
-    url = f'https://eodhd.com/api/eod/{eod_ticker}?api_token={eodhd_api}&from={'1900-01-01'}&to={date_to}&fmt=json'
+    url = f'https://eodhd.com/api/eod/{eod_ticker}?api_token={eodhd_api}&from={date_from}&to={date_to}&fmt=json'
     try:
         price_data = requests.get(url).json()
         price_data = pd.DataFrame(price_data)
         if price_data.empty:
-            logger.debug(f"No data returned for Ticker: {ticker} on Exchange: {exchange}")
+            logger.debug("No data returned for Ticker: %s on Exchange: %s", ticker, exchange)
             return None
         price_data['Ticker_ID'] = None
         price_data.columns = PRICE_COLUMNS
                      
-        return price_data
+        return schema.compact_boundary(price_data, schema.PRICE_DTYPES, f'history {eod_ticker}')
     except Exception as e:
         logger.error(f'Updating historical price data -Ticker: {ticker} -  {e}')
 
 
-def retrieve_daily_price(eodhd_exchange: str, exchange: str, api_key: str) -> Optional[pd.DataFrame]:
+def retrieve_daily_price(eodhd_exchange: str, exchange: str, api_key: str,
+                         date: Optional[str] = None) -> Optional[pd.DataFrame]:
     """Retrieve latest daily prices for all tickers in an exchange.
     
     Args:
         exchange: Exchange code
         api_key: EODHD API key
+        date: Day (YYYY-MM-DD) to request, defaults to the last trading day
         
     Returns:
         DataFrame containing daily price data or None if request fails
     """
     url = f"{APIEndpoints.DAILY}/{eodhd_exchange}?api_token={api_key}&fmt=json"
+    if date:
+        url += f"&date={date}"
     
     # Make API request using existing helper
     data = _make_api_request(url)
@@ -218,11 +231,145 @@ def retrieve_daily_price(eodhd_exchange: str, exchange: str, api_key: str) -> Op
         df['Source'] = f'EoDHD.com - Exchange {eodhd_exchange}'
         df['Date_Updated'] = datetime.datetime.now()
         df['Ticker_ID'] = None # df['Ticker'] + f'_{eod_exchange}'
-        df['EoDHD_Exchange']=df['Exchange'].apply(lambda x: 'US' if x in list(US_EXCHANGES.keys()) else x)
+        df['EoDHD_Exchange'] = schema.map_eodhd_exchange(df['Exchange'], US_EXCHANGES)
         df.columns = REWRITE_PRICE_COLUMNS
-        return df
+        return schema.compact_boundary(df, schema.PRICE_DTYPES, f'daily {exchange}')
         
     except Exception as e:
         logger.error(f"Failed to process daily prices for {exchange} retrieved using {eodhd_exchange}: {e}", exc_info=True)
         return None
-    
+
+
+def _parse_corporate_actions(data: list, action: str) -> pd.DataFrame:
+    """Normalise split or dividend records to Ticker, Date, Action and Value columns.
+
+    Splits are reported as 'new/old' share ratios and returned as their decimal
+    value, dividends use the unadjusted cash amount when available.
+    """
+    df = pd.DataFrame(data)
+    if df.empty:
+        return pd.DataFrame(columns=['Ticker', 'Date', 'Action', 'Value'])
+    if 'code' in df.columns:
+        df = df.rename(columns={'code': 'Ticker'})
+
+    if action == 'split':
+        ratio = df['split'].astype(str).str.split('/', expand=True)
+        numerator = pd.to_numeric(ratio[0], errors='coerce')
+        denominator = pd.to_numeric(ratio[1], errors='coerce') if ratio.shape[1] > 1 else 1.0
+        df['Value'] = numerator / denominator
+    else:
+        amount_column = 'unadjustedValue' if 'unadjustedValue' in df.columns else (
+            'dividend' if 'dividend' in df.columns else 'value')
+        df['Value'] = pd.to_numeric(df[amount_column], errors='coerce')
+
+    df['Date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['Action'] = action
+    columns = ['Ticker', 'Date', 'Action', 'Value'] if 'Ticker' in df.columns else ['Date', 'Action', 'Value']
+    return df.dropna(subset=['Date', 'Value'])[columns]
+
+
+def retrieve_bulk_corporate_actions(eodhd_exchange: str, api_key: str,
+                                    date: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Retrieve the splits and dividends of a whole exchange for one day.
+
+    Args:
+        eodhd_exchange: EODHD exchange code
+        api_key: EODHD API key
+        date: Day (YYYY-MM-DD) to request, defaults to the last trading day
+
+    Returns:
+        DataFrame with Ticker, Date, Action and Value columns or None if a request fails
+    """
+    frames = []
+    for action, request_type in (('split', 'splits'), ('dividend', 'dividends')):
+        url = f"{APIEndpoints.DAILY}/{eodhd_exchange}?api_token={api_key}&type={request_type}&fmt=json"
+        if date:
+            url += f"&date={date}"
+        data = _make_api_request(url)
+        if data is None:
+            logger.warning(f"No {request_type} retrieved for EoDHD code {eodhd_exchange}")
+            return None
+        try:
+            frames.append(_parse_corporate_actions(data, action))
+        except Exception as e:
+            logger.error(f"Failed to process {request_type} for {eodhd_exchange}: {e}", exc_info=True)
+            return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def retrieve_ticker_corporate_actions(eodhd_exchange: str, ticker: str,
+                                      api_key: str) -> Optional[pd.DataFrame]:
+    """Retrieve the full split and dividend history of one ticker.
+
+    Args:
+        eodhd_exchange: EODHD exchange code
+        ticker: Ticker code
+        api_key: EODHD API key
+
+    Returns:
+        DataFrame with Date, Action and Value columns or None if a request fails
+    """
+    eod_ticker = f'{ticker}.{eodhd_exchange}' # EoDHD.com ticker format
+    frames = []
+    for action, endpoint in (('split', APIEndpoints.SPLITS), ('dividend', APIEndpoints.DIVIDENDS)):
+        data = _make_api_request(f"{endpoint}/{eod_ticker}?api_token={api_key}&from=1900-01-01&fmt=json")
+        if data is None:
+            return None
+        try:
+            frames.append(_parse_corporate_actions(data, action))
+        except Exception as e:
+            logger.error(f"Failed to process {action} history for {eod_ticker}: {e}", exc_info=True)
+            return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def retrieve_exchange_holidays(eodhd_exchange: str, api_key: str,
+                               date_from: Optional[str] = None,
+                               date_to: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Retrieve the holidays of an exchange from its trading hours details.
+
+    Args:
+        eodhd_exchange: EODHD exchange code
+        api_key: EODHD API key
+        date_from: First day (YYYY-MM-DD), the API defaults to six months back
+        date_to: Last day (YYYY-MM-DD), the API defaults to six months ahead
+
+    Returns:
+        DataFrame with Date, Holiday and Type columns or None if the request fails
+    """
+    url = f"{APIEndpoints.EXCHANGE_DETAILS}/{eodhd_exchange}?api_token={api_key}&fmt=json"
+    if date_from:
+        url += f"&from={date_from}"
+    if date_to:
+        url += f"&to={date_to}"
+    data = _make_api_request(url)
+    if data is None:
+        logger.warning(f"No exchange details retrieved for EoDHD code {eodhd_exchange}")
+        return None
+
+    holidays = data.get('ExchangeHolidays') or {}
+    # Returned as an object keyed by position rather than a list
+    records = list(holidays.values()) if isinstance(holidays, dict) else list(holidays)
+    df = pd.DataFrame(records, columns=['Holiday', 'Date', 'Type'])
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    return df.dropna(subset=['Date'])[['Date', 'Holiday', 'Type']]
+
+
+def retrieve_api_usage(api_key: str) -> Optional[Dict[str, int]]:
+    """Retrieve the API calls made today and the daily limit of the account.
+
+    Args:
+        api_key: EODHD API key
+
+    Returns:
+        Dictionary with 'requests' and 'limit' or None if the request fails
+    """
+    data = _make_api_request(f"{APIEndpoints.USER}?api_token={api_key}&fmt=json")
+    if not data or 'dailyRateLimit' not in data:
+        logger.warning("No API usage retrieved from EODHD")
+        return None
+    return {
+        'requests': int(data.get('apiRequests') or 0),
+        # Extra calls bought on top of the subscription count towards the limit
+        'limit': int(data['dailyRateLimit']) + int(data.get('extraLimit') or 0),
+    }
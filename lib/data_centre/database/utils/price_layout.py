@@ -0,0 +1,235 @@
+"""Price Table Layout Module
+
+Price tables come in two layouts. The wide layout repeats Ticker_ID, Ticker,
+Exchange and EoDHD_Exchange as VARCHAR(255) on every row. The compact layout
+stores only an integer Ticker_Key, the surrogate key of global_tickers, next
+to Date and the price columns, clustered on (Ticker_Key, Date).
+
+This module is the mapping layer between the two: writers ask it which layout
+a table has and translate Ticker_ID to Ticker_Key, readers select from
+price_source(), which exposes a compact table with the wide columns by
+joining global_tickers on its key. The layout of a table is read from its
+columns, so both layouts can coexist while an exchange is migrated. New
+tables of an exchange follow its existing tables, and the first tables of a
+new exchange follow DB_PRICE_LAYOUT.
+"""
+
+# Standard library imports
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils
+from config.connections.database_access import PRICE_LAYOUT
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+WIDE = 'wide'
+COMPACT = 'compact'
+
+PRICE_COLUMNS = [
+    'Ticker_ID', 'Ticker', 'Exchange', 'EoDHD_Exchange', 'Date',
+    'Open', 'High', 'Low', 'Close', 'Adjusted_Close', 'Volume'
+]
+COMPACT_COLUMNS = [
+    'Ticker_Key', 'Date', 'Open', 'High', 'Low', 'Close', 'Adjusted_Close', 'Volume'
+]
+
+# Keys are assigned by global_tickers on insert and never reused, tickers
+# that leave the API are only marked inactive
+TICKER_KEY_QUERY = """
+    ALTER TABLE global_tickers
+        ADD COLUMN IF NOT EXISTS Ticker_Key INT UNSIGNED NOT NULL AUTO_INCREMENT UNIQUE;
+"""
+
+WIDE_TABLE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        Ticker_ID VARCHAR(255),
+        Ticker VARCHAR(255),
+        Exchange VARCHAR(255),
+        EoDHD_Exchange VARCHAR(255),
+        Date DATE,
+        Open DECIMAL(20,6),
+        High DECIMAL(20,6),
+        Low DECIMAL(20,6),
+        Close DECIMAL(20,6),
+        Adjusted_Close DECIMAL(20,6),
+        Volume BIGINT
+    );
+"""
+
+COMPACT_TABLE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        Ticker_Key INT UNSIGNED NOT NULL,
+        Date DATE NOT NULL,
+        Open DECIMAL(20,6),
+        High DECIMAL(20,6),
+        Low DECIMAL(20,6),
+        Close DECIMAL(20,6),
+        Adjusted_Close DECIMAL(20,6),
+        Volume BIGINT,
+        PRIMARY KEY (Ticker_Key, Date)
+    );
+"""
+
+# One row per column of every year table, so the layout comes with the list
+YEAR_TABLES_QUERY = """
+    SELECT TABLE_NAME, MAX(COLUMN_NAME = 'Ticker_Key')
+    FROM INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME REGEXP %s
+    GROUP BY TABLE_NAME
+    ORDER BY TABLE_NAME;
+"""
+
+COMPACT_SOURCE = """(
+        SELECT k.Ticker_ID, k.Ticker, k.Exchange, k.EoDHD_Exchange, p.Date,
+               p.Open, p.High, p.Low, p.Close, p.Adjusted_Close, p.Volume
+        FROM {table} p
+        JOIN global_tickers k ON k.Ticker_Key = p.Ticker_Key
+    ) AS {alias}"""
+
+UPSERT_COMPACT_SUFFIX = """
+    ON DUPLICATE KEY UPDATE
+        Open = VALUES(Open),
+        High = VALUES(High),
+        Low = VALUES(Low),
+        Close = VALUES(Close),
+        Adjusted_Close = VALUES(Adjusted_Close),
+        Volume = VALUES(Volume);
+"""
+
+# Connections already checked in this process
+_keys_ensured = set()
+
+
+def ensure_ticker_keys(access: Dict[str, Any]) -> None:
+    """Add the Ticker_Key surrogate key to global_tickers if it is missing."""
+    marker = (access.get('host'), access.get('database'))
+    if marker in _keys_ensured:
+        return
+    database_utils.execute_query(access, TICKER_KEY_QUERY)
+    _keys_ensured.add(marker)
+
+
+def year_tables(access: Dict[str, Any], exchange: str) -> List[Tuple[str, bool]]:
+    """List the prices_{exchange}_{year} tables of an exchange with their layout.
+
+    Returns:
+        (table, compact) tuples in year order
+    """
+    pattern = f'^prices_{exchange}_[0-9]{{4}}$'
+    rows = database_utils.retrieve_table(access, YEAR_TABLES_QUERY, (pattern,))
+    return [(table, bool(compact)) for table, compact in rows]
+
+
+def exchange_layout(access: Dict[str, Any], exchange: str) -> str:
+    """Layout new year tables of an exchange are created with."""
+    tables = year_tables(access, exchange)
+    if not tables:
+        return COMPACT if PRICE_LAYOUT == COMPACT else WIDE
+    # The latest table decides, so a half migrated exchange keeps going forward
+    return COMPACT if tables[-1][1] else WIDE
+
+
+def ensure_price_table(access: Dict[str, Any], exchange: str, year: int) -> bool:
+    """Create the price table of an exchange and year in the exchange's layout.
+
+    Returns:
+        True if the table has the compact layout
+    """
+    table = f"prices_{exchange}_{year}"
+    existing = dict(year_tables(access, exchange))
+    if table in existing:
+        return existing[table]
+
+    compact = exchange_layout(access, exchange) == COMPACT
+    if compact:
+        ensure_ticker_keys(access)
+    schema = COMPACT_TABLE_SCHEMA if compact else WIDE_TABLE_SCHEMA
+    database_utils.execute_query(access, schema.format(table=table))
+    return compact
+
+
+def price_source(table: str, compact: bool, alias: Optional[str] = None) -> str:
+    """FROM clause exposing the wide price columns of a table of either layout.
+
+    Args:
+        table: Price table name
+        compact: Whether the table has the compact layout
+        alias: Alias of the source, defaults to the table name
+
+    Returns:
+        Table name or derived table usable after FROM
+    """
+    if compact:
+        return COMPACT_SOURCE.format(table=table, alias=alias or table)
+    return f"{table} AS {alias}" if alias else table
+
+
+def update_target(table: str, compact: bool, alias: str = 'p') -> Tuple[str, str]:
+    """Target of an UPDATE that matches price rows by Ticker_ID.
+
+    Returns:
+        (table reference, Ticker_ID expression) to place in the statement
+    """
+    if compact:
+        return (f"{table} {alias} JOIN global_tickers {alias}_k "
+                f"ON {alias}_k.Ticker_Key = {alias}.Ticker_Key"), f"{alias}_k.Ticker_ID"
+    return f"{table} {alias}", f"{alias}.Ticker_ID"
+
+
+def ticker_keys(access: Dict[str, Any], ticker_ids: Iterable[str]) -> Dict[str, int]:
+    """Map Ticker_IDs to their Ticker_Key, unknown Ticker_IDs are left out."""
+    ticker_ids = list(dict.fromkeys(ticker_ids))
+    if not ticker_ids:
+        return {}
+    ensure_ticker_keys(access)
+    keys = {}
+    # Bounded IN lists keep each statement small on full exchanges
+    for start in range(0, len(ticker_ids), 1000):
+        chunk = ticker_ids[start:start + 1000]
+        rows = database_utils.retrieve_table(
+            access,
+            f"SELECT Ticker_ID, Ticker_Key FROM global_tickers "
+            f"WHERE Ticker_ID IN ({', '.join(['%s'] * len(chunk))});",
+            tuple(chunk)
+        )
+        keys.update({ticker_id: int(key) for ticker_id, key in rows})
+    return keys
+
+
+def to_compact_frame(df: pd.DataFrame, keys: Dict[str, int]) -> pd.DataFrame:
+    """Replace the identifier columns of a wide price frame with Ticker_Key.
+
+    Rows whose Ticker_ID has no key are dropped with a warning.
+    """
+    ticker_key = df['Ticker_ID'].astype(object).map(keys)
+    missing = ticker_key.isna()
+    if missing.any():
+        logger.warning(f"Dropped {int(missing.sum())} price rows without a Ticker_Key")
+    compact = df.loc[~missing, COMPACT_COLUMNS[1:]].copy()
+    compact.insert(0, 'Ticker_Key', ticker_key[~missing].astype('int64'))
+    return compact
+
+
+def upsert_compact_prices(access: Dict[str, Any], table: str, df: pd.DataFrame) -> int:
+    """Write a frame of COMPACT_COLUMNS to a compact price table.
+
+    Returns:
+        Number of affected rows
+    """
+    if df.empty:
+        return 0
+    frame = df[COMPACT_COLUMNS].copy()
+    frame['Date'] = pd.to_datetime(frame['Date']).dt.date
+    with database_utils.db_connection(access) as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(COMPACT_COLUMNS)}) "
+            f"VALUES ({', '.join(['%s'] * len(COMPACT_COLUMNS))})" + UPSERT_COMPACT_SUFFIX,
+            database_utils.dataframe_to_rows(frame)
+        )
+        return cursor.rowcount
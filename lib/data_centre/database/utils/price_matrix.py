@@ -0,0 +1,399 @@
+"""Price Matrix Cache Module
+
+This module keeps a dense dates x tickers float64 matrix per exchange and
+price field on disk, so models can load an exchange's history without
+pivoting it out of the database.
+
+Layout of data/price_matrix/{exchange}/:
+    meta.json                   Row and column counts, capacity and generation
+    dates.{generation}.npy      datetime64[D] row index
+    tickers.{generation}.json   Ticker_ID column index
+    {field}.{generation}.f64    Raw row-major float64 matrix, one row per date
+
+Rows are dates, so appending a trading day appends one row to the end of
+each file. Every row is written with spare ticker columns (NaN) so new
+listings fit without rewriting the history. When the spare columns run out,
+or on a full rebuild, a new generation of files is written and meta.json is
+swapped in with os.replace; readers that already mapped the previous
+generation keep a consistent view until they reload. Readers only ever trust
+the counts in meta.json, so bytes appended after it was read are ignored.
+Columns of tickers whose earlier history changed are never rewritten in
+place, a refresh writes a new generation as well.
+"""
+
+# Standard library imports
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_layout
+from config.settings.paths import PATHS
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+MATRIX_DIR = PATHS['DATA_DIR'] / 'price_matrix'
+PRICE_FIELDS = ('Open', 'High', 'Low', 'Close', 'Adjusted_Close', 'Volume')
+DEFAULT_FIELDS = ('Close', 'Adjusted_Close', 'Volume')
+DTYPE = np.dtype('float64')
+
+# Spare ticker columns as a share of the current ticker count
+TICKER_HEADROOM = 0.25
+MIN_TICKER_HEADROOM = 64
+
+
+@dataclass
+class PriceMatrix:
+    """Memory-mapped dates x tickers matrix of one exchange and field."""
+    exchange: str
+    field: str
+    values: np.ndarray
+    dates: np.ndarray
+    tickers: List[str]
+
+    def ticker_index(self) -> Dict[str, int]:
+        """Mapping of Ticker_ID to column number."""
+        return {ticker: column for column, ticker in enumerate(self.tickers)}
+
+    def to_frame(self) -> pd.DataFrame:
+        """Copy the matrix into a DataFrame indexed by date."""
+        return pd.DataFrame(np.asarray(self.values), index=pd.DatetimeIndex(self.dates),
+                            columns=self.tickers)
+
+
+def _exchange_dir(exchange: str) -> Path:
+    return MATRIX_DIR / exchange
+
+
+def _field_path(exchange: str, field: str, generation: int) -> Path:
+    return _exchange_dir(exchange) / f"{field}.{generation}.f64"
+
+
+def _atomic_write(path: Path, write) -> None:
+    """Write a file through a temporary name and rename it into place."""
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as handle:
+        write(handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, path)
+
+
+def _read_meta(exchange: str) -> Optional[Dict[str, Any]]:
+    path = _exchange_dir(exchange) / 'meta.json'
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def _write_meta(exchange: str, meta: Dict[str, Any], dates: np.ndarray,
+                tickers: List[str]) -> None:
+    """Write the index sidecars of the generation, then publish meta.json."""
+    directory = _exchange_dir(exchange)
+    generation = meta['generation']
+    _atomic_write(directory / f"dates.{generation}.npy",
+                  lambda handle: np.save(handle, dates.astype('datetime64[D]')))
+    _atomic_write(directory / f"tickers.{generation}.json",
+                  lambda handle: handle.write(json.dumps(tickers).encode()))
+    _atomic_write(directory / 'meta.json',
+                  lambda handle: handle.write(json.dumps(meta).encode()))
+
+
+def _remove_generation(exchange: str, fields: Iterable[str], generation: int) -> None:
+    """Delete the files of a superseded generation."""
+    directory = _exchange_dir(exchange)
+    paths = [directory / f"dates.{generation}.npy", directory / f"tickers.{generation}.json"]
+    paths += [_field_path(exchange, field, generation) for field in fields]
+    for path in paths:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _map_field(exchange: str, field: str, meta: Dict[str, Any], mode: str = 'r') -> np.ndarray:
+    """Memory-map the matrix file of a field with the shape recorded in meta."""
+    path = _field_path(exchange, field, meta['generation'])
+    shape = (meta['n_dates'], meta['capacity'])
+    if not meta['n_dates']:
+        # Empty files cannot be mapped
+        if not path.exists():
+            raise FileNotFoundError(path)
+        return np.empty(shape, dtype=DTYPE)
+    return np.memmap(path, dtype=DTYPE, mode=mode, shape=shape)
+
+
+def _capacity(n_tickers: int) -> int:
+    return n_tickers + max(MIN_TICKER_HEADROOM, int(n_tickers * TICKER_HEADROOM))
+
+
+def _read_prices(access: Dict[str, Any], exchange: str, fields: Sequence[str],
+                 after: Optional[np.datetime64] = None,
+                 ticker_ids: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Read price rows from the year tables, optionally after a date or for some tickers."""
+    conditions, params = [], []
+    if after is not None:
+        conditions.append("Date > %s")
+        params.append(str(after))
+    if ticker_ids:
+        conditions.append(f"Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))})")
+        params.extend(ticker_ids)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    after_year = int(str(after)[:4]) if after is not None else None
+    frames = []
+    for table, compact in price_layout.year_tables(access, exchange):
+        if after_year is not None and int(table.rsplit('_', 1)[1]) < after_year:
+            continue
+        source = price_layout.price_source(table, compact)
+        rows = database_utils.retrieve_table(
+            access, f"SELECT Ticker_ID, Date, {', '.join(fields)} FROM {source}{where};",
+            tuple(params) or None
+        )
+        if rows:
+            frames.append(pd.DataFrame(rows, columns=['Ticker_ID', 'Date', *fields]))
+
+    if not frames:
+        return pd.DataFrame(columns=['Ticker_ID', 'Date', *fields])
+    prices = pd.concat(frames, ignore_index=True)
+    prices['Date'] = pd.to_datetime(prices['Date'])
+    for field in fields:
+        prices[field] = pd.to_numeric(prices[field], errors='coerce').astype(DTYPE)
+    return prices
+
+
+def _row_dates(prices: pd.DataFrame) -> np.ndarray:
+    return prices['Date'].to_numpy().astype('datetime64[D]')
+
+
+def _pivot(prices: pd.DataFrame, field: str, dates: np.ndarray,
+           columns: np.ndarray, capacity: int) -> np.ndarray:
+    """Scatter long price rows into a dates x capacity block, NaN elsewhere."""
+    block = np.full((len(dates), capacity), np.nan, dtype=DTYPE)
+    rows = np.searchsorted(dates, _row_dates(prices))
+    block[rows, columns] = prices[field].to_numpy()
+    return block
+
+
+def _assign_columns(prices: pd.DataFrame, tickers: List[str]) -> np.ndarray:
+    """Column number of every price row, appending unseen tickers to the index."""
+    index = {ticker: column for column, ticker in enumerate(tickers)}
+    for ticker in pd.unique(prices['Ticker_ID']):
+        if ticker not in index:
+            index[ticker] = len(tickers)
+            tickers.append(ticker)
+    return prices['Ticker_ID'].map(index).to_numpy(dtype=np.int64)
+
+
+def build_price_matrix(access: Dict[str, Any], exchange: str,
+                       fields: Sequence[str] = DEFAULT_FIELDS) -> int:
+    """Build a new generation of the matrices of an exchange from the year tables.
+
+    Args:
+        access: Database connection configuration dictionary
+        exchange: Exchange code
+        fields: Price columns to cache
+
+    Returns:
+        Number of date rows written
+    """
+    fields = list(fields)
+    unknown = set(fields) - set(PRICE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown price fields: {sorted(unknown)}")
+
+    previous = _read_meta(exchange)
+    generation = previous['generation'] + 1 if previous else 1
+    _exchange_dir(exchange).mkdir(parents=True, exist_ok=True)
+
+    prices = _read_prices(access, exchange, fields)
+    tickers = sorted(pd.unique(prices['Ticker_ID']).tolist())
+    capacity = _capacity(len(tickers))
+    dates = np.unique(_row_dates(prices))
+    columns = _assign_columns(prices, tickers)
+
+    for field in fields:
+        block = _pivot(prices, field, dates, columns, capacity)
+        _atomic_write(_field_path(exchange, field, generation),
+                      lambda handle: handle.write(block.tobytes()))
+
+    meta = {
+        'generation': generation,
+        'fields': fields,
+        'n_dates': int(len(dates)),
+        'n_tickers': len(tickers),
+        'capacity': capacity,
+    }
+    _write_meta(exchange, meta, dates, tickers)
+    if previous:
+        _remove_generation(exchange, previous['fields'], previous['generation'])
+
+    logger.info(f"Built price matrix for {exchange}: {len(dates)} dates x {len(tickers)} tickers")
+    return int(len(dates))
+
+
+def _regenerate(exchange: str, meta: Dict[str, Any], capacity: int) -> Dict[str, Any]:
+    """Copy the current generation into a wider one with more spare columns."""
+    generation = meta['generation'] + 1
+    for field in meta['fields']:
+        old = _map_field(exchange, field, meta)
+        block = np.full((meta['n_dates'], capacity), np.nan, dtype=DTYPE)
+        block[:, :meta['capacity']] = old
+        del old
+        _atomic_write(_field_path(exchange, field, generation),
+                      lambda handle: handle.write(block.tobytes()))
+    logger.info(f"Widened price matrix for {exchange} from {meta['capacity']} to {capacity} columns")
+    return {**meta, 'generation': generation, 'capacity': capacity}
+
+
+def append_price_matrix(access: Dict[str, Any], exchange: str) -> int:
+    """Append the dates newer than the cached ones to the matrices of an exchange.
+
+    Builds the matrices if the exchange has no cache yet.
+
+    Returns:
+        Number of date rows appended
+    """
+    meta = _read_meta(exchange)
+    if meta is None:
+        return build_price_matrix(access, exchange)
+
+    matrix = load_price_matrix(exchange, meta['fields'][0], meta=meta)
+    dates, tickers = matrix.dates, list(matrix.tickers)
+    last_date = dates[-1] if len(dates) else None
+
+    prices = _read_prices(access, exchange, meta['fields'], after=last_date)
+    if prices.empty:
+        logger.debug("Price matrix for %s already up to date", exchange)
+        return 0
+
+    new_dates = np.unique(_row_dates(prices))
+    columns = _assign_columns(prices, tickers)
+
+    previous_generation = meta['generation']
+    if len(tickers) > meta['capacity']:
+        meta = _regenerate(exchange, meta, _capacity(len(tickers)))
+
+    # Rows beyond n_dates are leftovers of an interrupted append, overwrite them
+    offset = meta['n_dates'] * meta['capacity'] * DTYPE.itemsize
+    for field in meta['fields']:
+        block = _pivot(prices, field, new_dates, columns, meta['capacity'])
+        with open(_field_path(exchange, field, meta['generation']), 'r+b') as handle:
+            handle.seek(offset)
+            handle.write(block.tobytes())
+            handle.truncate()
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    meta = {**meta, 'n_dates': meta['n_dates'] + len(new_dates), 'n_tickers': len(tickers)}
+    _write_meta(exchange, meta, np.concatenate([dates, new_dates]), tickers)
+    if meta['generation'] != previous_generation:
+        _remove_generation(exchange, meta['fields'], previous_generation)
+
+    logger.debug("Appended %s dates to price matrix for %s", len(new_dates), exchange)
+    return int(len(new_dates))
+
+
+def last_cached_date(exchange: str) -> Optional[np.datetime64]:
+    """Latest date row of the cache of an exchange, None if it has none."""
+    meta = _read_meta(exchange)
+    if meta is None or not meta['n_dates']:
+        return None
+    return load_price_matrix(exchange, meta['fields'][0], meta=meta).dates[-1]
+
+
+def refresh_price_matrix_tickers(access: Dict[str, Any], exchange: str,
+                                 ticker_ids: Sequence[str]) -> int:
+    """Rewrite the cached columns of tickers whose history changed.
+
+    Used after corporate actions re-adjust Adjusted_Close and for rows that
+    backfills and gap repairs write before the last cached date. The columns
+    are rewritten into a new generation, so readers of the current one never
+    see a half written column. A date the cache has no row for rebuilds the
+    exchange instead, dates after the cache are left to append_price_matrix.
+
+    Returns:
+        Number of columns rewritten
+    """
+    meta = _read_meta(exchange)
+    if meta is None or not meta['n_dates'] or not ticker_ids:
+        return 0
+
+    matrix = load_price_matrix(exchange, meta['fields'][0], meta=meta)
+    dates, tickers = matrix.dates, list(matrix.tickers)
+    prices = _read_prices(access, exchange, meta['fields'], ticker_ids=list(ticker_ids))
+    prices = prices[_row_dates(prices) <= dates[-1]]
+    if prices.empty:
+        return 0
+    if not np.isin(_row_dates(prices), dates).all():
+        logger.info(f"Rebuilding price matrix for {exchange}, changed rows fall between cached dates")
+        build_price_matrix(access, exchange, meta['fields'])
+        return len(ticker_ids)
+
+    # Tickers without a column yet, e.g. a first backfill, are added
+    columns = _assign_columns(prices, tickers)
+    index = {ticker: column for column, ticker in enumerate(tickers)}
+    refreshed = [index[ticker] for ticker in ticker_ids if ticker in index]
+    rows = np.searchsorted(dates, _row_dates(prices))
+    capacity = meta['capacity'] if len(tickers) <= meta['capacity'] else _capacity(len(tickers))
+
+    generation = meta['generation'] + 1
+    for field in meta['fields']:
+        old = _map_field(exchange, field, meta)
+        block = np.full((meta['n_dates'], capacity), np.nan, dtype=DTYPE)
+        block[:, :meta['capacity']] = old
+        del old
+        block[:, refreshed] = np.nan
+        block[rows, columns] = prices[field].to_numpy()
+        _atomic_write(_field_path(exchange, field, generation),
+                      lambda handle: handle.write(block.tobytes()))
+
+    _write_meta(exchange, {**meta, 'generation': generation, 'capacity': capacity,
+                           'n_tickers': len(tickers)}, dates, tickers)
+    _remove_generation(exchange, meta['fields'], meta['generation'])
+    logger.debug("Refreshed %s price matrix columns for %s", len(refreshed), exchange)
+    return len(refreshed)
+
+
+def load_price_matrix(exchange: str, field: str = 'Close',
+                      meta: Optional[Dict[str, Any]] = None) -> PriceMatrix:
+    """Map the cached matrix of an exchange and field read-only.
+
+    The values are a view on the shared page cache, nothing is copied, so
+    loading takes the same time whatever the length of the history.
+
+    Raises:
+        FileNotFoundError: If the exchange or field is not cached
+    """
+    for attempt in range(2):
+        meta = meta or _read_meta(exchange)
+        if meta is None or field not in meta['fields']:
+            raise FileNotFoundError(f"No cached {field} matrix for {exchange}")
+        directory = _exchange_dir(exchange)
+        generation = meta['generation']
+        try:
+            values = _map_field(exchange, field, meta)
+            dates = np.load(directory / f"dates.{generation}.npy", mmap_mode='r')
+            tickers = json.loads((directory / f"tickers.{generation}.json").read_text())
+            break
+        except FileNotFoundError:
+            # A writer replaced the generation between reading meta and the files
+            if attempt:
+                raise
+            meta = None
+
+    return PriceMatrix(
+        exchange=exchange,
+        field=field,
+        values=values[:, :meta['n_tickers']],
+        dates=np.asarray(dates[:meta['n_dates']]),
+        tickers=tickers[:meta['n_tickers']],
+    )
@@ -0,0 +1,242 @@
+"""Price Validation Module
+
+This module checks OHLCV price frames before they are written to the
+database. Every rule is evaluated on whole columns with NumPy and sets a bit
+in a per-row reason code, so a bulk day of tens of thousands of rows is
+validated in milliseconds. Rows failing any rule are routed to the
+prices_quarantine table together with their reason codes.
+"""
+
+# Standard library imports
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Reason codes, one bit per rule
+MISSING_VALUE = 1
+HIGH_BELOW_LOW = 2
+OHLC_OUTSIDE_RANGE = 4
+NON_POSITIVE_PRICE = 8
+NEGATIVE_VOLUME = 16
+DUPLICATE_DATE = 32
+EXTREME_MOVE = 64
+
+REASON_NAMES = {
+    MISSING_VALUE: 'missing_value',
+    HIGH_BELOW_LOW: 'high_below_low',
+    OHLC_OUTSIDE_RANGE: 'ohlc_outside_range',
+    NON_POSITIVE_PRICE: 'non_positive_price',
+    NEGATIVE_VOLUME: 'negative_volume',
+    DUPLICATE_DATE: 'duplicate_date',
+    EXTREME_MOVE: 'extreme_move',
+}
+
+# Rules are switched on and off by name, max_intraday_move is the largest
+# accepted |Close / Open - 1| (None disables the check)
+DEFAULT_RULES = {
+    'missing_value': True,
+    'high_below_low': True,
+    'ohlc_outside_range': True,
+    'non_positive_price': True,
+    'negative_volume': True,
+    'duplicate_date': True,
+    'max_intraday_move': None,
+    'tolerance': 1e-6,
+}
+
+PRICE_FIELDS = ['Open', 'High', 'Low', 'Close']
+
+QUARANTINE_COLUMNS = [
+    'Ticker_ID', 'Ticker', 'Exchange', 'Date', 'Open', 'High', 'Low',
+    'Close', 'Adjusted_Close', 'Volume'
+]
+
+CREATE_QUARANTINE_QUERY = """
+    CREATE TABLE IF NOT EXISTS prices_quarantine (
+        Ticker_ID VARCHAR(255),
+        Ticker VARCHAR(255),
+        Exchange VARCHAR(255),
+        Date DATE,
+        Open DECIMAL(20,6),
+        High DECIMAL(20,6),
+        Low DECIMAL(20,6),
+        Close DECIMAL(20,6),
+        Adjusted_Close DECIMAL(20,6),
+        Volume BIGINT,
+        Reason_Code INT,
+        Reasons VARCHAR(255),
+        Source VARCHAR(64),
+        Date_Quarantined DATETIME,
+        INDEX idx_prices_quarantine_exchange (Exchange, Date)
+    );
+"""
+
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    """Return a column as a float array, all NaN if the column is missing."""
+    if name not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype='float64')
+
+
+def reason_codes(df: pd.DataFrame, rules: Optional[Dict[str, Any]] = None,
+                 key_columns: Sequence[str] = ('Ticker', 'Date')) -> np.ndarray:
+    """Evaluate the rule set on a price frame.
+
+    Args:
+        df: Price frame with OHLCV columns
+        rules: Rule configuration, defaults to DEFAULT_RULES
+        key_columns: Columns identifying one bar, used for duplicate detection
+
+    Returns:
+        Integer array with the OR of the failed rule codes per row
+    """
+    rules = {**DEFAULT_RULES, **(rules or {})}
+    tolerance = rules['tolerance']
+    codes = np.zeros(len(df), dtype=np.int32)
+    if not len(df):
+        return codes
+
+    open_, high, low, close = (_column(df, name) for name in PRICE_FIELDS)
+    volume = _column(df, 'Volume')
+
+    # NaN compares False everywhere below, so missing rows only get this code
+    if rules['missing_value']:
+        missing = np.isnan(open_) | np.isnan(high) | np.isnan(low) | np.isnan(close)
+        if 'Date' in df.columns:
+            missing |= df['Date'].isna().to_numpy()
+        codes[missing] |= MISSING_VALUE
+
+    if rules['high_below_low']:
+        codes[high < low - tolerance] |= HIGH_BELOW_LOW
+
+    if rules['ohlc_outside_range']:
+        outside = ((open_ > high + tolerance) | (open_ < low - tolerance)
+                   | (close > high + tolerance) | (close < low - tolerance))
+        codes[outside] |= OHLC_OUTSIDE_RANGE
+
+    if rules['non_positive_price']:
+        codes[(open_ <= 0) | (high <= 0) | (low <= 0) | (close <= 0)] |= NON_POSITIVE_PRICE
+
+    if rules['negative_volume']:
+        codes[volume < 0] |= NEGATIVE_VOLUME
+
+    if rules['duplicate_date']:
+        keys = [column for column in key_columns if column in df.columns]
+        if keys:
+            codes[df.duplicated(subset=keys, keep='first').to_numpy()] |= DUPLICATE_DATE
+
+    if rules['max_intraday_move'] is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            move = np.abs(close / open_ - 1)
+        codes[move > rules['max_intraday_move']] |= EXTREME_MOVE
+
+    return codes
+
+
+def describe_reasons(codes: np.ndarray) -> np.ndarray:
+    """Translate reason codes into comma separated rule names."""
+    names = np.full(len(codes), '', dtype=object)
+    for code, name in REASON_NAMES.items():
+        flagged = (codes & code) != 0
+        names[flagged] = names[flagged] + name + ','
+    return np.array([value.rstrip(',') for value in names], dtype=object)
+
+
+def validate_prices(df: pd.DataFrame, rules: Optional[Dict[str, Any]] = None,
+                    key_columns: Sequence[str] = ('Ticker', 'Date')
+                    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Split a price frame into valid and rejected rows.
+
+    Args:
+        df: Price frame with OHLCV columns
+        rules: Rule configuration, defaults to DEFAULT_RULES
+        key_columns: Columns identifying one bar, used for duplicate detection
+
+    Returns:
+        Tuple of (valid rows, rejected rows with Reason_Code and Reasons)
+    """
+    codes = reason_codes(df, rules, key_columns)
+    rejected_mask = codes != 0
+    if not rejected_mask.any():
+        return df, df.iloc[0:0].assign(Reason_Code=pd.Series(dtype='int32'),
+                                      Reasons=pd.Series(dtype=object))
+
+    rejected = df[rejected_mask].copy()
+    rejected['Reason_Code'] = codes[rejected_mask]
+    rejected['Reasons'] = describe_reasons(codes[rejected_mask])
+    return df[~rejected_mask], rejected
+
+
+def rejection_stats(rejected: pd.DataFrame, total: int) -> Dict[str, int]:
+    """Count rejected rows per rule, a row can fail several rules."""
+    codes = rejected['Reason_Code'].to_numpy() if len(rejected) else np.zeros(0, dtype=np.int32)
+    stats = {'total': int(total), 'rejected': int(len(codes))}
+    for code, name in REASON_NAMES.items():
+        stats[name] = int(np.count_nonzero(codes & code))
+    return stats
+
+
+def quarantine_prices(rejected: pd.DataFrame, exchange: str, source: str,
+                      access: Dict[str, Any]) -> None:
+    """Write rejected rows to the prices_quarantine table.
+
+    Args:
+        rejected: Rejected rows as returned by validate_prices
+        exchange: Exchange code used when the frame has no Exchange column
+        source: Ingest path that produced the rows (e.g. 'daily', 'history')
+        access: Database connection configuration dictionary
+    """
+    if rejected.empty:
+        return
+
+    frame = pd.DataFrame(index=rejected.index)
+    for column in QUARANTINE_COLUMNS:
+        frame[column] = rejected[column] if column in rejected.columns else None
+    if 'Exchange' not in rejected.columns:
+        frame['Exchange'] = exchange
+    frame['Date'] = pd.to_datetime(frame['Date'], errors='coerce')
+    frame['Reason_Code'] = rejected['Reason_Code']
+    frame['Reasons'] = rejected['Reasons']
+    frame['Source'] = source
+
+    columns = list(frame.columns) + ['Date_Quarantined']
+    query = (
+        f"INSERT INTO prices_quarantine ({', '.join(columns)}) "
+        f"VALUES ({', '.join(['%s'] * (len(columns) - 1))}, NOW());"
+    )
+    database_utils.execute_query(access, CREATE_QUARANTINE_QUERY)
+    with database_utils.db_connection(access) as cursor:
+        cursor.executemany(query, database_utils.dataframe_to_rows(frame))
+
+
+def validate_and_quarantine(df: pd.DataFrame, exchange: str, source: str,
+                            access: Dict[str, Any],
+                            rules: Optional[Dict[str, Any]] = None,
+                            key_columns: Sequence[str] = ('Ticker', 'Date')
+                            ) -> pd.DataFrame:
+    """Validate a price frame, quarantine failing rows and return the valid ones."""
+    valid, rejected = validate_prices(df, rules, key_columns)
+    if rejected.empty:
+        return valid
+
+    stats = rejection_stats(rejected, len(df))
+    reasons = {name: count for name, count in stats.items()
+               if name not in ('total', 'rejected') and count}
+    logger.warning(
+        f"Validation rejected {stats['rejected']} of {stats['total']} {source} rows "
+        f"for {exchange}: {reasons}"
+    )
+    try:
+        quarantine_prices(rejected, exchange, source, access)
+    except Exception as e:
+        logger.error(f"Failed to quarantine {len(rejected)} rows for {exchange}: {e}")
+    return valid
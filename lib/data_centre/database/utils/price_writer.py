@@ -0,0 +1,206 @@
+"""Price Writer Module
+
+Shared writer for price rows resolved on the client, used by the history
+load, the sharded backfill and the gap repair. Frames of any mix of
+exchanges, tickers and years are added to a PriceWriter, which routes every
+row to its prices_{exchange}_{year} table with a single groupby and buffers
+the rows per table. A flush writes each table with one batched statement per
+WRITE_CHUNK_ROWS rows, in the table's layout, replacing rows already stored
+for the same Ticker_ID and Date, so writing rows again is safe. It appends
+one change record per table and ticker to the change log, then updates the
+close price tables and invalidates the query cache once per exchange.
+
+The daily update does not go through the writer. Its bulk payload is staged
+on the server, which resolves the Ticker_IDs and routes rows to their year
+tables with one INSERT ... SELECT per table.
+
+Usage:
+    with PriceWriter() as writer:
+        for frame in frames:
+            writer.add(frame)
+"""
+
+# Standard library imports
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import (
+    database_utils, price_layout, close_prices, query_cache, change_log
+)
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+FLUSH_ROWS = 200000
+WRITE_CHUNK_ROWS = 20000
+
+INSERT_WIDE_QUERY = (
+    f"INSERT INTO {{table}} ({', '.join(price_layout.PRICE_COLUMNS)}) "
+    f"VALUES ({', '.join(['%s'] * len(price_layout.PRICE_COLUMNS))});"
+)
+
+# Wide tables have no key, rows are replaced by deleting the (Ticker_ID, Date)
+# pairs being written first, in the same transaction as the insert
+WRITE_KEYS_SCHEMA = """
+    CREATE TEMPORARY TABLE price_writer_keys (
+        Ticker_ID VARCHAR(255),
+        Date DATE,
+        PRIMARY KEY (Ticker_ID, Date)
+    );
+"""
+
+DELETE_WIDE_QUERY = """
+    DELETE p FROM {table} p
+    JOIN price_writer_keys k ON k.Ticker_ID = p.Ticker_ID AND k.Date = p.Date;
+"""
+
+
+class PriceWriter:
+    """Buffers price rows and writes them to their year tables in batches.
+
+    Args:
+        access: Database connection configuration dictionary
+        flush_rows: Buffered rows that trigger a flush, 0 to flush only on demand
+        publish: Record the changes, upsert the close prices and invalidate the
+            query cache on each flush, off for loads into a shadow schema
+        source: Write path recorded in the change log
+    """
+
+    def __init__(self, access: Dict[str, Any] = DB_CONFIG, flush_rows: int = FLUSH_ROWS,
+                 publish: bool = True, source: str = 'history'):
+        self.access = access
+        self.flush_rows = flush_rows
+        self.publish = publish
+        self.source = source
+        self.rows_written = 0
+        self._buffers: Dict[Tuple[str, int], List[pd.DataFrame]] = defaultdict(list)
+        self._buffered = 0
+        # Layout of every table this writer has ensured, True for compact
+        self._layouts: Dict[Tuple[str, int], bool] = {}
+
+    def __enter__(self) -> 'PriceWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # Rows of a failed run are still written, they passed validation
+        self.flush()
+
+    @property
+    def buffered(self) -> int:
+        return self._buffered
+
+    def add(self, prices: pd.DataFrame) -> None:
+        """Buffer a frame of price_layout.PRICE_COLUMNS for its year tables.
+
+        Rows are routed by their Exchange and Date in one pass, so a frame may
+        hold any number of tickers, exchanges and years.
+        """
+        if prices.empty:
+            return
+        frame = prices[price_layout.PRICE_COLUMNS].copy()
+        frame['Date'] = pd.to_datetime(frame['Date'])
+        frame['Ticker_ID'] = frame['Ticker_ID'].astype(str)
+        frame['Exchange'] = frame['Exchange'].astype(str)
+
+        for (exchange, year), group in frame.groupby(
+                [frame['Exchange'], frame['Date'].dt.year], sort=False):
+            self._buffers[(exchange, int(year))].append(group)
+        self._buffered += len(frame)
+
+        if self.flush_rows and self._buffered >= self.flush_rows:
+            self.flush()
+
+    def _is_compact(self, exchange: str, year: int) -> bool:
+        if (exchange, year) not in self._layouts:
+            self._layouts[(exchange, year)] = price_layout.ensure_price_table(
+                self.access, exchange, year
+            )
+        return self._layouts[(exchange, year)]
+
+    def _write_table(self, exchange: str, year: int, frame: pd.DataFrame,
+                     keys: Optional[Dict[str, int]]) -> int:
+        table = f"prices_{exchange}_{year}"
+        if self._is_compact(exchange, year):
+            frame = price_layout.to_compact_frame(frame, keys or {})
+            for start in range(0, len(frame), WRITE_CHUNK_ROWS):
+                price_layout.upsert_compact_prices(
+                    self.access, table, frame.iloc[start:start + WRITE_CHUNK_ROWS]
+                )
+            return len(frame)
+
+        # Delete and insert commit together, so writing the same rows again,
+        # e.g. a re-queued backfill batch or a retried flush, replaces them
+        with database_utils.db_connection(self.access) as cursor:
+            cursor.execute(WRITE_KEYS_SCHEMA)
+            for start in range(0, len(frame), WRITE_CHUNK_ROWS):
+                cursor.executemany(
+                    "INSERT IGNORE INTO price_writer_keys (Ticker_ID, Date) VALUES (%s, %s);",
+                    database_utils.dataframe_to_rows(
+                        frame[['Ticker_ID', 'Date']].iloc[start:start + WRITE_CHUNK_ROWS]
+                    )
+                )
+            cursor.execute(DELETE_WIDE_QUERY.format(table=table))
+            for start in range(0, len(frame), WRITE_CHUNK_ROWS):
+                cursor.executemany(
+                    INSERT_WIDE_QUERY.format(table=table),
+                    database_utils.dataframe_to_rows(frame.iloc[start:start + WRITE_CHUNK_ROWS])
+                )
+            cursor.execute("DROP TEMPORARY TABLE IF EXISTS price_writer_keys;")
+        return len(frame)
+
+    def flush(self) -> int:
+        """Write every buffered row.
+
+        Rows leave the buffer once their table is written. When a write fails
+        the rows of that and every later table stay buffered for the next
+        flush, the tables written so far are published and the error is
+        re-raised.
+
+        Returns:
+            Number of rows written
+        """
+        if not self._buffers:
+            return 0
+
+        written = tables = 0
+        changes = []
+        by_exchange: Dict[str, List[pd.DataFrame]] = defaultdict(list)
+        try:
+            for exchange, year in sorted(self._buffers):
+                frames = self._buffers[(exchange, year)]
+                frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+                keys = None
+                if self._is_compact(exchange, year):
+                    keys = price_layout.ticker_keys(self.access, frame['Ticker_ID'].unique())
+                written += self._write_table(exchange, year, frame, keys)
+                del self._buffers[(exchange, year)]
+                self._buffered -= len(frame)
+                tables += 1
+                if self.publish:
+                    changes.append(change_log.summarise(exchange, f"prices_{exchange}_{year}", frame))
+                    by_exchange[exchange].append(frame)
+        finally:
+            self._publish(changes, by_exchange)
+            self.rows_written += written
+
+        logger.debug("Wrote %s price rows to %s tables", written, tables)
+        return written
+
+    def _publish(self, changes: List[pd.DataFrame],
+                 by_exchange: Dict[str, List[pd.DataFrame]]) -> None:
+        """Record the written tables in the change log, close prices and query cache."""
+        if changes:
+            change_log.record_changes(self.access, self.source, pd.concat(changes, ignore_index=True))
+
+        for exchange, frames in by_exchange.items():
+            prices = pd.concat(frames, ignore_index=True)
+            close_prices.upsert_close_prices(self.access, exchange, prices)
+            query_cache.invalidate(
+                query_cache.SCOPE_PRICES, exchange, prices['Date'].min(), prices['Date'].max()
+            )
@@ -0,0 +1,296 @@
+"""Opt-in CPU and memory profiling of single job runs.
+
+A profiled job runs under a sampling profiler and tracemalloc. The sampler
+is a daemon thread that reads the stack of the thread running the job every
+PROFILE_INTERVAL seconds with sys._current_frames(), so the job itself runs
+uninstrumented. Jobs running next to it in other threads, and threads the job
+starts itself, are not sampled. Samples are wall clock, time spent waiting on the database or
+EODHD shows up as such. When the job finishes two files are written to
+logs/profiles:
+
+    {job}_{timestamp}.collapsed   Stacks in the collapsed format read by
+                                  flamegraph.pl, speedscope and inferno
+    {job}_{timestamp}.txt         Top allocation sites, peak RSS and traced
+                                  memory per section (e.g. per exchange)
+
+Profiling is switched on per run, with `seldon.py --profile`, the profile
+field of a Job, or SELDON_PROFILE for scheduled runs ('all' or a comma
+separated list of job names). Jobs mark their sections with section(), which
+costs nothing when no profile is running.
+
+The sampler costs a few percent at the default 10ms interval. tracemalloc
+slows down code that creates many small Python objects, up to several times
+for loops like DataFrame.tolist(), but barely affects vectorised pandas or
+time spent in the database. Set SELDON_PROFILE_TRACE_FRAMES=0 to profile
+without it, which drops the allocation sites and traced peaks from the report.
+"""
+
+# Standard library imports
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+# Local application imports
+from config.settings.logging import logger_factory, LOG_DIR, PROJECT_ROOT
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+PROFILE_JOBS = {job.strip() for job in os.getenv('SELDON_PROFILE', '').split(',') if job.strip()}
+PROFILE_INTERVAL = float(os.getenv('SELDON_PROFILE_INTERVAL', '0.01'))
+# Frames kept per allocation, 1 keeps tracemalloc overhead low
+PROFILE_TRACE_FRAMES = int(os.getenv('SELDON_PROFILE_TRACE_FRAMES', '1'))
+PROFILE_DIR = LOG_DIR / 'profiles'
+TOP_ALLOCATIONS = 25
+# Allocation sites are snapshotted when traced memory grows by this factor,
+# checked at most once per SNAPSHOT_CHECK_SECONDS
+SNAPSHOT_GROWTH = 1.5
+SNAPSHOT_CHECK_SECONDS = 1.0
+SNAPSHOT_MIN_BYTES = 16 * 1024 ** 2
+JOB_SECTION = '(job)'
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _current_rss() -> int:
+    """Resident set size of the process in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # Peak rather than current RSS, reported in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class JobProfiler:
+    """Samples the stacks and memory of one job run."""
+
+    def __init__(self, job: str, interval: float = PROFILE_INTERVAL,
+                 trace_frames: int = PROFILE_TRACE_FRAMES):
+        self.job = job
+        self.interval = interval
+        self.trace_frames = trace_frames
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.section = JOB_SECTION
+        self.rss_peaks: Dict[str, int] = {}
+        self.traced_peaks: Dict[str, int] = {}
+        self.section_seconds: Dict[str, float] = {}
+        self._labels: Dict[object, str] = {}
+        self._thread_names: Dict[int, str] = {}
+        self._owner: Optional[int] = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._owns_tracemalloc = False
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_bytes = 0
+        self._snapshot_checked = 0.0
+        self._started = 0.0
+        self.elapsed = 0.0
+
+    def _frame_label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = Path(code.co_filename)
+            try:
+                filename = str(path.relative_to(PROJECT_ROOT))
+            except ValueError:
+                filename = '/'.join(path.parts[-2:])
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ':')
+            self._labels[code] = label
+        return label
+
+    def _thread_name(self, ident: int) -> str:
+        if ident not in self._thread_names:
+            self._thread_names.update((t.ident, t.name) for t in threading.enumerate())
+        return self._thread_names.get(ident, str(ident)).replace(';', ':')
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self._owner)
+        if frame is not None:
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(self._thread_name(self._owner))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+        rss = _current_rss()
+        if rss > self.rss_peaks.get(self.section, 0):
+            self.rss_peaks[self.section] = rss
+
+    def _snapshot_if_grown(self) -> None:
+        """Keep the allocation sites at the highest traced memory seen so far."""
+        now = time.monotonic()
+        if now - self._snapshot_checked < SNAPSHOT_CHECK_SECONDS or not tracemalloc.is_tracing():
+            return
+        self._snapshot_checked = now
+        current = tracemalloc.get_traced_memory()[0]
+        if current >= max(SNAPSHOT_MIN_BYTES, self.snapshot_bytes * SNAPSHOT_GROWTH):
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_bytes = current
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+            self._snapshot_if_grown()
+
+    def start(self) -> None:
+        # Only the thread running the job is sampled, the scheduler may start
+        # other jobs in new threads while it runs
+        self._owner = threading.get_ident()
+        if self.trace_frames and not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            self._owns_tracemalloc = True
+        self._started = time.perf_counter()
+        self.rss_peaks[JOB_SECTION] = _current_rss()
+        self._sampler = threading.Thread(target=self._run, name='job-profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed = time.perf_counter() - self._started
+        self._sample()
+
+        if tracemalloc.is_tracing():
+            self.traced_peaks[JOB_SECTION] = max(
+                tracemalloc.get_traced_memory()[1], self.traced_peaks.get(JOB_SECTION, 0)
+            )
+            if self.snapshot is None:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_bytes = tracemalloc.get_traced_memory()[0]
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+
+    @contextmanager
+    def enter_section(self, name: str) -> Iterator[None]:
+        previous, self.section = self.section, name
+        self.rss_peaks[name] = max(_current_rss(), self.rss_peaks.get(name, 0))
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Keep the job wide peak before resetting it for the section
+            self.traced_peaks[previous] = max(
+                tracemalloc.get_traced_memory()[1], self.traced_peaks.get(previous, 0)
+            )
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.section_seconds[name] = (self.section_seconds.get(name, 0.0)
+                                          + time.perf_counter() - started)
+            if tracing and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                self.traced_peaks[name] = max(peak, self.traced_peaks.get(name, 0))
+                self.traced_peaks[previous] = max(peak, self.traced_peaks.get(previous, 0))
+            self.section = previous
+
+    def write(self, profile_dir: Path = PROFILE_DIR) -> List[Path]:
+        """Write the collapsed stacks and the memory report of the run."""
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        stem = profile_dir / f"{self.job}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+        stacks_file = stem.with_suffix('.collapsed')
+        with open(stacks_file, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        report_file = stem.with_suffix('.txt')
+        with open(report_file, 'w') as f:
+            f.write(f"Job: {self.job}\n")
+            f.write(f"Elapsed: {self.elapsed:.1f}s, {self.samples} samples "
+                    f"every {self.interval * 1000:.0f}ms\n")
+            f.write(f"Peak RSS of the process: {_current_rss() / 1024 ** 2:.1f} MB now, "
+                    f"{max(self.rss_peaks.values()) / 1024 ** 2:.1f} MB sampled\n\n")
+
+            f.write(f"{'section':<32}{'seconds':>10}{'peak RSS MB':>14}{'peak traced MB':>16}\n")
+            for name in sorted(self.rss_peaks, key=lambda n: (n != JOB_SECTION, n)):
+                f.write(f"{name:<32}{self.section_seconds.get(name, self.elapsed):>10.1f}"
+                        f"{self.rss_peaks[name] / 1024 ** 2:>14.1f}"
+                        f"{self.traced_peaks.get(name, 0) / 1024 ** 2:>16.1f}\n")
+
+            if self.snapshot is not None:
+                f.write(f"\nTop {TOP_ALLOCATIONS} allocation sites when "
+                        f"{self.snapshot_bytes / 1024 ** 2:.1f} MB were traced\n")
+                for stat in self.snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                    frame = stat.traceback[0]
+                    f.write(f"{stat.size / 1024 ** 2:>10.2f} MB {stat.count:>10} blocks  "
+                            f"{frame.filename}:{frame.lineno}\n")
+        return [stacks_file, report_file]
+
+
+_active: Optional[JobProfiler] = None
+_active_lock = threading.Lock()
+
+
+def profiling_enabled(job: str) -> bool:
+    """Whether SELDON_PROFILE asks for the job to be profiled."""
+    return 'all' in PROFILE_JOBS or job in PROFILE_JOBS
+
+
+@contextmanager
+def profile_job(job: str, enabled: Optional[bool] = None) -> Iterator[Optional[JobProfiler]]:
+    """Profile the code run inside the block.
+
+    Only one job is profiled at a time, since tracemalloc and RSS are process
+    wide. A job that starts while another one is profiled runs unprofiled.
+
+    Args:
+        job: Job name, used for the output file names
+        enabled: Force profiling on or off, None follows SELDON_PROFILE
+
+    Yields:
+        The profiler, or None if the job is not profiled
+    """
+    global _active
+    if enabled is None:
+        enabled = profiling_enabled(job)
+    if not enabled:
+        yield None
+        return
+
+    with _active_lock:
+        if _active is not None:
+            logger.warning("Not profiling %s, %s is already being profiled", job, _active.job)
+            profiler = None
+        else:
+            profiler = _active = JobProfiler(job)
+    if profiler is None:
+        yield None
+        return
+
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        with _active_lock:
+            _active = None
+        try:
+            files = profiler.write()
+            logger.info("Profile of %s written to %s", job, ', '.join(str(f) for f in files))
+        except Exception as e:
+            logger.error(f"Failed to write profile of {job}: {e}", exc_info=True)
+
+
+@contextmanager
+def section(name: str) -> Iterator[None]:
+    """Attribute the memory used inside the block to a section of the profiled job."""
+    profiler = _active
+    # Sections of jobs running next to the profiled one are not attributed to it
+    if profiler is None or threading.get_ident() != profiler._owner:
+        yield
+        return
+    with profiler.enter_section(str(name)):
+        yield
@@ -0,0 +1,545 @@
+"""Query Cache Module
+
+This module caches the results of price and reference data reads so that
+repeated lookups are served from memory instead of opening a new database
+connection through retrieve_table each time.
+
+Entries are keyed by the read kind and its normalised parameters and carry
+the exchange and date range they cover. The in-memory store is bounded in
+bytes with least recently used eviction and can be backed by a directory of
+pickled entries that survives restarts and is shared by every process on the
+host.
+
+Writers record what they changed with invalidate(), which appends a row to
+the cache_invalidations table, bumps the ingest watermark of the scope and
+exchange and drops the overlapping entries of the local
+cache. Other processes read the new rows at most every POLL_INTERVAL seconds
+and drop their overlapping entries too, so a daily update of one exchange
+leaves cached reads of other exchanges and older date ranges untouched.
+"""
+
+# Standard library imports
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Third-party imports
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_layout
+from config.connections.database_access import DB_CONFIG
+from config.settings.paths import PATHS
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+SCOPE_PRICES = 'prices'
+SCOPE_TICKERS = 'tickers'
+SCOPE_EXCHANGES = 'exchanges'
+
+MAX_MEMORY_BYTES = 512 * 1024 ** 2
+DISK_DIR = PATHS['DATA_DIR'] / 'query_cache'
+POLL_INTERVAL = 5.0
+
+# Invalidations older than this are pruned, disk entries older than it are dropped
+RETENTION_DAYS = 7
+
+CREATE_INVALIDATIONS_QUERY = """
+    CREATE TABLE IF NOT EXISTS cache_invalidations (
+        Seq BIGINT AUTO_INCREMENT,
+        Scope VARCHAR(16),
+        Exchange VARCHAR(255),
+        Date_From DATE,
+        Date_To DATE,
+        Created DATETIME,
+        PRIMARY KEY (Seq),
+        INDEX idx_cache_invalidations_created (Created)
+    );
+"""
+
+INSERT_INVALIDATION_QUERY = """
+    INSERT INTO cache_invalidations (Scope, Exchange, Date_From, Date_To, Created)
+    VALUES (%s, %s, %s, %s, NOW());
+"""
+
+SELECT_INVALIDATIONS_QUERY = """
+    SELECT Seq, Scope, Exchange, Date_From, Date_To
+    FROM cache_invalidations
+    WHERE Seq > %s
+    ORDER BY Seq;
+"""
+
+# One counter per scope and exchange, '' for writes to every exchange. Readers
+# such as the HTTP API derive ETags from it
+CREATE_WATERMARKS_QUERY = """
+    CREATE TABLE IF NOT EXISTS ingest_watermarks (
+        Scope VARCHAR(16),
+        Exchange VARCHAR(255),
+        Watermark BIGINT NOT NULL DEFAULT 0,
+        Date_Updated DATETIME,
+        PRIMARY KEY (Scope, Exchange)
+    );
+"""
+
+BUMP_WATERMARK_QUERY = """
+    INSERT INTO ingest_watermarks (Scope, Exchange, Watermark, Date_Updated)
+    VALUES (%s, %s, 1, NOW())
+    ON DUPLICATE KEY UPDATE Watermark = Watermark + 1, Date_Updated = NOW();
+"""
+
+PRUNE_INVALIDATIONS_QUERY = """
+    DELETE FROM cache_invalidations
+    WHERE Created < NOW() - INTERVAL %s DAY;
+"""
+
+
+def _normalise(value: Any) -> Any:
+    """Canonical, hashable form of a query parameter."""
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date, pd.Timestamp)):
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (list, tuple, set, frozenset, pd.Index, pd.Series)):
+        return tuple(sorted({_normalise(item) for item in value}, key=str))
+    return value
+
+
+def _to_date(value: Any) -> Optional[date]:
+    return None if value is None else pd.Timestamp(value).date()
+
+
+def _overlaps(start_a: Optional[date], end_a: Optional[date],
+              start_b: Optional[date], end_b: Optional[date]) -> bool:
+    """True if two date ranges overlap, None bounds are open."""
+    return ((start_a is None or end_b is None or start_a <= end_b)
+            and (start_b is None or end_a is None or start_b <= end_a))
+
+
+@dataclass
+class CacheEntry:
+    """A cached result and the data it was read from."""
+    scope: str
+    exchange: Optional[str]
+    date_from: Optional[date]
+    date_to: Optional[date]
+    seq: int
+    size: int
+    created: float = field(default_factory=time.time)
+    value: Any = None
+
+    def matches(self, scope: str, exchange: Optional[str],
+                date_from: Optional[date], date_to: Optional[date]) -> bool:
+        """True if an invalidation of the given scope and range covers this entry."""
+        if scope != self.scope:
+            return False
+        if exchange is not None and self.exchange is not None and exchange != self.exchange:
+            return False
+        return _overlaps(self.date_from, self.date_to, date_from, date_to)
+
+
+class QueryCache:
+    """Bounded LRU cache of read results with range based invalidation.
+
+    Args:
+        access: Database connection configuration dictionary
+        max_bytes: Memory budget for cached values
+        disk_dir: Directory for the disk tier, None keeps the cache in memory only
+        poll_interval: Seconds between checks for invalidations by other processes
+    """
+
+    def __init__(self, access: Dict[str, Any] = DB_CONFIG, max_bytes: int = MAX_MEMORY_BYTES,
+                 disk_dir: Optional[Path] = None, poll_interval: float = POLL_INTERVAL):
+        self.access = access
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.poll_interval = poll_interval
+
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._disk_index: Dict[str, CacheEntry] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._seq = None
+        self._generation = 0
+        self._last_poll = 0.0
+        self._stats = {
+            'hits': 0, 'disk_hits': 0, 'misses': 0,
+            'evictions': 0, 'invalidations': 0, 'invalidated_entries': 0,
+        }
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    # Keys and sizes
+
+    @staticmethod
+    def make_key(kind: str, params: Dict[str, Any]) -> str:
+        """Stable key from the read kind and its normalised parameters."""
+        normalised = sorted((name, _normalise(value)) for name, value in params.items())
+        return hashlib.sha1(repr((kind, normalised)).encode()).hexdigest()
+
+    @staticmethod
+    def _size_of(value: Any) -> int:
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(deep=True).sum())
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    # Reads
+
+    def get(self, kind: str, params: Dict[str, Any], loader: Callable[[], Any],
+            scope: str, exchange: Optional[str] = None,
+            date_from: Any = None, date_to: Any = None) -> Any:
+        """Return the cached result of a read, loading and caching it on a miss.
+
+        Args:
+            kind: Name of the read, part of the key
+            params: Parameters of the read, part of the key
+            loader: Callable performing the read on a miss
+            scope: Data the read depends on (prices, tickers or exchanges)
+            exchange: Exchange the read is limited to, None for all
+            date_from: First date the read covers, None for unbounded
+            date_to: Last date the read covers, None for unbounded
+
+        Returns:
+            The read result, DataFrames are returned as copies
+        """
+        self.poll()
+        key = self.make_key(kind, params)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._copy(entry.value)
+
+            entry = self._read_disk(key)
+            if entry is not None:
+                self._stats['disk_hits'] += 1
+                self._store(key, entry)
+                return self._copy(entry.value)
+
+            self._stats['misses'] += 1
+            seq, generation = self._seq or 0, self._generation
+
+        value = loader()
+        entry = CacheEntry(scope, exchange, _to_date(date_from), _to_date(date_to),
+                           seq, self._size_of(value), value=value)
+        with self._lock:
+            # An invalidation applied while loading may already cover this result
+            if generation == self._generation:
+                self._store(key, entry)
+                self._write_disk(key, entry)
+        return self._copy(value)
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return value.copy() if isinstance(value, pd.DataFrame) else value
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._stats['evictions'] += 1
+
+    # Disk tier
+
+    def _disk_paths(self, key: str) -> Tuple[Path, Path]:
+        return self.disk_dir / f"{key}.pkl", self.disk_dir / f"{key}.json"
+
+    def _load_disk_index(self) -> None:
+        cutoff = time.time() - RETENTION_DAYS * 86400
+        for meta_path in self.disk_dir.glob('*.json'):
+            key = meta_path.stem
+            try:
+                meta = json.loads(meta_path.read_text())
+            except (OSError, ValueError):
+                self._remove_disk(key)
+                continue
+            if meta['created'] < cutoff:
+                self._remove_disk(key)
+                continue
+            self._disk_index[key] = CacheEntry(
+                meta['scope'], meta['exchange'], _to_date(meta['date_from']),
+                _to_date(meta['date_to']), meta['seq'], meta['size'], meta['created']
+            )
+
+    def _read_disk(self, key: str) -> Optional[CacheEntry]:
+        entry = self._disk_index.get(key) if self.disk_dir else None
+        if entry is None:
+            return None
+        try:
+            with open(self._disk_paths(key)[0], 'rb') as handle:
+                value = pickle.load(handle)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self._remove_disk(key)
+            return None
+        return CacheEntry(entry.scope, entry.exchange, entry.date_from, entry.date_to,
+                          entry.seq, entry.size, entry.created, value)
+
+    def _write_disk(self, key: str, entry: CacheEntry) -> None:
+        if not self.disk_dir:
+            return
+        value_path, meta_path = self._disk_paths(key)
+        meta = {
+            'scope': entry.scope,
+            'exchange': entry.exchange,
+            'date_from': entry.date_from.isoformat() if entry.date_from else None,
+            'date_to': entry.date_to.isoformat() if entry.date_to else None,
+            'seq': entry.seq,
+            'size': entry.size,
+            'created': entry.created,
+        }
+        try:
+            tmp = value_path.with_name(f"{value_path.name}.{os.getpid()}.tmp")
+            with open(tmp, 'wb') as handle:
+                pickle.dump(entry.value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, value_path)
+            # The metadata is written last, an entry without it is never read
+            tmp = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(meta))
+            os.replace(tmp, meta_path)
+            self._disk_index[key] = CacheEntry(**{**entry.__dict__, 'value': None})
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key} to disk: {e}")
+
+    def _remove_disk(self, key: str) -> None:
+        self._disk_index.pop(key, None)
+        for path in self._disk_paths(key)[::-1]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    # Invalidation
+
+    def _drop_matching(self, scope: str, exchange: Optional[str],
+                       date_from: Optional[date], date_to: Optional[date]) -> int:
+        with self._lock:
+            memory = [key for key, entry in self._entries.items()
+                      if entry.matches(scope, exchange, date_from, date_to)]
+            disk = [key for key, entry in self._disk_index.items()
+                    if entry.matches(scope, exchange, date_from, date_to)]
+            for key in memory:
+                self._bytes -= self._entries.pop(key).size
+            for key in disk:
+                self._remove_disk(key)
+            dropped = len(set(memory) | set(disk))
+            self._generation += 1
+            self._stats['invalidations'] += 1
+            self._stats['invalidated_entries'] += dropped
+        return dropped
+
+    def invalidate(self, scope: str, exchange: Optional[str] = None,
+                   date_from: Any = None, date_to: Any = None) -> int:
+        """Record a write and drop every cached entry it overlaps.
+
+        Args:
+            scope: Data that was written (prices, tickers or exchanges)
+            exchange: Exchange written to, None for all exchanges
+            date_from: First date written, None for unbounded
+            date_to: Last date written, None for unbounded
+
+        Returns:
+            Number of local entries dropped
+        """
+        date_from, date_to = _to_date(date_from), _to_date(date_to)
+        try:
+            with database_utils.db_connection(self.access) as cursor:
+                cursor.execute(CREATE_INVALIDATIONS_QUERY)
+                cursor.execute(CREATE_WATERMARKS_QUERY)
+                cursor.execute(INSERT_INVALIDATION_QUERY, (scope, exchange, date_from, date_to))
+                cursor.execute(BUMP_WATERMARK_QUERY, (scope, exchange or ''))
+        except Exception as e:
+            logger.error(f"Failed to record cache invalidation for {scope} {exchange}: {e}")
+        return self._drop_matching(scope, exchange, date_from, date_to)
+
+    def poll(self, force: bool = False) -> None:
+        """Apply invalidations recorded by other processes since the last poll."""
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+
+        try:
+            if self._seq is None:
+                database_utils.execute_query(self.access, CREATE_INVALIDATIONS_QUERY)
+                # Disk entries are checked against everything recorded after them
+                oldest = min((entry.seq for entry in self._disk_index.values()), default=None)
+                if oldest is None:
+                    row = database_utils.retrieve_table(
+                        self.access, "SELECT COALESCE(MAX(Seq), 0) FROM cache_invalidations;"
+                    )
+                    self._seq = int(row[0][0])
+                    return
+                self._seq = oldest
+            rows = database_utils.retrieve_table(self.access, SELECT_INVALIDATIONS_QUERY, (self._seq,))
+        except Exception as e:
+            logger.warning(f"Failed to poll cache invalidations: {e}")
+            return
+
+        for seq, scope, exchange, date_from, date_to in rows:
+            self._drop_matching(scope, exchange, _to_date(date_from), _to_date(date_to))
+            self._seq = int(seq)
+
+    def prune(self) -> int:
+        """Delete invalidation records older than RETENTION_DAYS."""
+        return database_utils.execute_query(self.access, PRUNE_INVALIDATIONS_QUERY, (RETENTION_DAYS,))
+
+    def clear(self) -> None:
+        """Drop every entry of this cache, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for key in list(self._disk_index):
+                self._remove_disk(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters, entry counts and memory use."""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['disk_hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': (self._stats['hits'] + self._stats['disk_hits']) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'disk_entries': len(self._disk_index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# Shared cache of this process
+_cache: Optional[QueryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> QueryCache:
+    """Return the process wide cache, created on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+        return _cache
+
+
+def configure_cache(max_bytes: int = MAX_MEMORY_BYTES, disk: bool = False,
+                    disk_dir: Path = DISK_DIR, poll_interval: float = POLL_INTERVAL) -> QueryCache:
+    """Replace the process wide cache, optionally with a disk tier."""
+    global _cache
+    with _cache_lock:
+        _cache = QueryCache(DB_CONFIG, max_bytes, disk_dir if disk else None, poll_interval)
+        return _cache
+
+
+def invalidate(scope: str, exchange: Optional[str] = None,
+               date_from: Any = None, date_to: Any = None) -> int:
+    """Record a write through the process wide cache, used by the ingest paths."""
+    return get_cache().invalidate(scope, exchange, date_from, date_to)
+
+
+# Cached reads
+
+EXCHANGE_COLUMNS = [
+    'Name', 'Exchange', 'EoDHD_Exchange', 'OperatingMIC', 'Country',
+    'Currency', 'CountryISO2', 'CountryISO3'
+]
+
+
+def get_exchanges() -> pd.DataFrame:
+    """Active exchanges from global_exchanges."""
+    query = f"SELECT {', '.join(EXCHANGE_COLUMNS)} FROM global_exchanges WHERE Is_Active = 1;"
+    return get_cache().get(
+        'exchanges', {}, lambda: pd.DataFrame(
+            database_utils.retrieve_table(DB_CONFIG, query), columns=EXCHANGE_COLUMNS
+        ),
+        scope=SCOPE_EXCHANGES
+    )
+
+
+def get_tickers(exchange: Optional[str] = None, ticker_type: Optional[str] = None) -> pd.DataFrame:
+    """Active tickers from global_tickers, optionally of one exchange and Type."""
+    def load() -> pd.DataFrame:
+        conditions, params = ["Is_Active = 1"], []
+        if exchange is not None:
+            conditions.append("Exchange = %s")
+            params.append(exchange)
+        if ticker_type is not None:
+            conditions.append("Type = %s")
+            params.append(ticker_type)
+        query = (
+            "SELECT Ticker_ID, Ticker, Name, Country, Exchange, EoDHD_Exchange, "
+            "Currency, Type, Isin FROM global_tickers "
+            f"WHERE {' AND '.join(conditions)};"
+        )
+        return pd.DataFrame(
+            database_utils.retrieve_table(DB_CONFIG, query, tuple(params) or None),
+            columns=['Ticker_ID', 'Ticker', 'Name', 'Country', 'Exchange',
+                     'EoDHD_Exchange', 'Currency', 'Type', 'Isin']
+        )
+
+    return get_cache().get(
+        'tickers', {'exchange': exchange, 'type': ticker_type}, load,
+        scope=SCOPE_TICKERS, exchange=exchange
+    )
+
+
+PRICE_COLUMNS = ['Ticker_ID', 'Date', 'Open', 'High', 'Low', 'Close', 'Adjusted_Close', 'Volume']
+
+
+def get_prices(exchange: str, date_from: Any, date_to: Any,
+               ticker_ids: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Prices of an exchange between two dates, optionally for some tickers.
+
+    Only the year tables covering the range are read.
+    """
+    start, end = _to_date(date_from), _to_date(date_to)
+    ticker_ids = _normalise(ticker_ids) if ticker_ids else None
+
+    def load() -> pd.DataFrame:
+        frames = []
+        for table, compact in price_layout.year_tables(DB_CONFIG, exchange):
+            year = int(table.rsplit('_', 1)[1])
+            if not start.year <= year <= end.year:
+                continue
+            source = price_layout.price_source(table, compact)
+            query = f"SELECT {', '.join(PRICE_COLUMNS)} FROM {source} WHERE Date BETWEEN %s AND %s"
+            params: List[Any] = [start, end]
+            if ticker_ids:
+                query += f" AND Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))})"
+                params.extend(ticker_ids)
+            rows = database_utils.retrieve_table(DB_CONFIG, query + ";", tuple(params))
+            frames.append(pd.DataFrame(rows, columns=PRICE_COLUMNS))
+        if not frames:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+        prices = pd.concat(frames, ignore_index=True)
+        prices['Date'] = pd.to_datetime(prices['Date'])
+        return prices.sort_values(['Ticker_ID', 'Date'], ignore_index=True)
+
+    return get_cache().get(
+        'prices', {'exchange': exchange, 'from': start, 'to': end, 'tickers': ticker_ids}, load,
+        scope=SCOPE_PRICES, exchange=exchange, date_from=start, date_to=end
+    )
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit and miss statistics of the process wide cache."""
+    return get_cache().stats()
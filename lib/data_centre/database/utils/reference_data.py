@@ -0,0 +1,215 @@
+"""Reference Data Module
+
+This module holds global_exchanges and global_tickers in memory, so jobs
+look up exchanges and tickers without a query per exchange against the
+unindexed Exchange column. Both tables are loaded with one query each into
+an immutable ReferenceData snapshot with hash maps by Ticker_ID,
+(Ticker, Exchange) and ISIN and an array of row positions per exchange.
+
+Every snapshot carries a version stamp, the ingest watermarks of the tickers
+and exchanges scopes that query_cache.invalidate() bumps when a sync commits.
+get_reference() compares the stamp with the database at most every
+POLL_INTERVAL seconds and reloads when it moved, so a sync in another process
+is picked up too. tickers_update and exchanges_update call refresh() right
+after they commit, so the syncing process reloads on its next lookup.
+Readers keep the snapshot they were handed, a reload never changes it under
+them.
+
+Usage:
+    reference = reference_data.get_reference()
+    ticker = reference.ticker('AAPL', 'US')
+    codes = reference.exchange_codes()
+"""
+
+# Standard library imports
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_layout, query_cache
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+POLL_INTERVAL = query_cache.POLL_INTERVAL
+
+EXCHANGE_COLUMNS = query_cache.EXCHANGE_COLUMNS + ['Is_Active']
+TICKER_COLUMNS = [
+    'Ticker_ID', 'Ticker_Key', 'Ticker', 'Name', 'Country', 'Exchange',
+    'EoDHD_Exchange', 'Currency', 'Type', 'Isin', 'Is_Active'
+]
+
+VERSION_QUERY = """
+    SELECT Scope, COALESCE(SUM(Watermark), 0)
+    FROM ingest_watermarks
+    WHERE Scope IN (%s, %s)
+    GROUP BY Scope;
+"""
+
+EXCHANGES_QUERY = f"SELECT {', '.join(EXCHANGE_COLUMNS)} FROM global_exchanges ORDER BY Exchange;"
+TICKERS_QUERY = f"SELECT {', '.join(TICKER_COLUMNS)} FROM global_tickers ORDER BY Exchange, Ticker;"
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """Immutable snapshot of global_exchanges and global_tickers.
+
+    Attributes:
+        version: (exchanges, tickers) ingest watermarks the snapshot was loaded at
+        exchanges: Every row of global_exchanges, active or not
+        tickers: Every row of global_tickers, ordered by Exchange and Ticker
+        by_ticker_id: Row position in tickers by Ticker_ID
+        by_ticker_exchange: Row position in tickers by (Ticker, Exchange)
+        by_isin: Row positions in tickers by ISIN, listings on several exchanges share one
+        exchange_rows: Row positions in tickers of each exchange
+    """
+    version: Tuple[int, int]
+    exchanges: pd.DataFrame
+    tickers: pd.DataFrame
+    by_ticker_id: Dict[str, int]
+    by_ticker_exchange: Dict[Tuple[str, str], int]
+    by_isin: Dict[str, np.ndarray]
+    exchange_rows: Dict[str, np.ndarray]
+
+    @classmethod
+    def build(cls, version: Tuple[int, int], exchanges: pd.DataFrame,
+              tickers: pd.DataFrame) -> 'ReferenceData':
+        """Index the two tables, positions refer to the rows of tickers."""
+        tickers = tickers.reset_index(drop=True)
+        tickers['Is_Active'] = tickers['Is_Active'].fillna(0).astype(bool)
+        exchanges = exchanges.reset_index(drop=True)
+        exchanges['Is_Active'] = exchanges['Is_Active'].fillna(0).astype(bool)
+
+        positions = np.arange(len(tickers))
+        isin = tickers['Isin'].where(tickers['Isin'].astype(str).str.len() > 0)
+        return cls(
+            version=version,
+            exchanges=exchanges,
+            tickers=tickers,
+            by_ticker_id=dict(zip(tickers['Ticker_ID'], positions.tolist())),
+            by_ticker_exchange=dict(zip(zip(tickers['Ticker'], tickers['Exchange']),
+                                        positions.tolist())),
+            by_isin={code: rows for code, rows in tickers.groupby(isin).indices.items()},
+            exchange_rows=tickers.groupby('Exchange', sort=False).indices,
+        )
+
+    def _row(self, position: Optional[int]) -> Optional[Dict[str, Any]]:
+        return None if position is None else self.tickers.iloc[position].to_dict()
+
+    def ticker(self, ticker: str, exchange: str) -> Optional[Dict[str, Any]]:
+        """Ticker row of a ticker code on a local exchange, None if unknown."""
+        return self._row(self.by_ticker_exchange.get((ticker, exchange)))
+
+    def ticker_by_id(self, ticker_id: str) -> Optional[Dict[str, Any]]:
+        """Ticker row of a Ticker_ID, None if unknown."""
+        return self._row(self.by_ticker_id.get(ticker_id))
+
+    def tickers_by_isin(self, isin: str) -> pd.DataFrame:
+        """Every listing of an ISIN."""
+        return self.tickers.iloc[self.by_isin.get(isin, np.empty(0, dtype=int))]
+
+    def exchange_tickers(self, exchange: str, active_only: bool = True) -> pd.DataFrame:
+        """Tickers listed on a local exchange."""
+        tickers = self.tickers.iloc[self.exchange_rows.get(exchange, np.empty(0, dtype=int))]
+        return tickers[tickers['Is_Active']] if active_only else tickers
+
+    def exchange_codes(self, active_only: bool = True) -> pd.DataFrame:
+        """Exchange and EoDHD_Exchange of every exchange."""
+        exchanges = self.exchanges[self.exchanges['Is_Active']] if active_only else self.exchanges
+        return exchanges[['Exchange', 'EoDHD_Exchange']].reset_index(drop=True)
+
+    def exchange_list(self, active_only: bool = True) -> List[str]:
+        """Local exchange codes."""
+        return self.exchange_codes(active_only)['Exchange'].tolist()
+
+
+class ReferenceCache:
+    """Loads and refreshes the ReferenceData snapshot of one database.
+
+    Args:
+        access: Database connection configuration dictionary
+        poll_interval: Seconds between checks of the version stamp
+    """
+
+    def __init__(self, access: Dict[str, Any] = DB_CONFIG, poll_interval: float = POLL_INTERVAL):
+        self.access = access
+        self.poll_interval = poll_interval
+        self._snapshot: Optional[ReferenceData] = None
+        self._lock = threading.Lock()
+        self._last_poll = 0.0
+
+    def _version(self) -> Tuple[int, int]:
+        try:
+            rows = dict(database_utils.retrieve_table(
+                self.access, VERSION_QUERY,
+                (query_cache.SCOPE_EXCHANGES, query_cache.SCOPE_TICKERS)
+            ))
+        except Exception as e:
+            # Databases without watermarks yet, e.g. a shadow schema being loaded
+            logger.debug("No ingest watermarks for reference data: %s", e)
+            rows = {}
+        return (int(rows.get(query_cache.SCOPE_EXCHANGES, 0)),
+                int(rows.get(query_cache.SCOPE_TICKERS, 0)))
+
+    def _load(self, version: Tuple[int, int]) -> ReferenceData:
+        price_layout.ensure_ticker_keys(self.access)
+        exchanges = pd.DataFrame(database_utils.retrieve_table(self.access, EXCHANGES_QUERY),
+                                 columns=EXCHANGE_COLUMNS)
+        tickers = pd.DataFrame(database_utils.retrieve_table(self.access, TICKERS_QUERY),
+                               columns=TICKER_COLUMNS)
+        snapshot = ReferenceData.build(version, exchanges, tickers)
+        logger.debug("Loaded reference data version %s: %s exchanges, %s tickers",
+                     version, len(exchanges), len(tickers))
+        return snapshot
+
+    def get(self) -> ReferenceData:
+        """Current snapshot, reloaded first if the version stamp moved."""
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._last_poll < self.poll_interval:
+                return self._snapshot
+            version = self._version()
+            self._last_poll = now
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+            return self._snapshot
+
+    def refresh(self) -> None:
+        """Drop the snapshot after a write to either table, the next get() reloads it.
+
+        The reload is lazy because global_tickers may not exist yet when the
+        exchanges of a new database are synced.
+        """
+        with self._lock:
+            self._snapshot = None
+
+
+# Caches of this process by (host, database)
+_caches: Dict[Tuple[Any, Any], ReferenceCache] = {}
+_caches_lock = threading.Lock()
+
+
+def _cache_for(access: Dict[str, Any]) -> ReferenceCache:
+    key = (access.get('host'), access.get('database'))
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ReferenceCache(access)
+        return _caches[key]
+
+
+def get_reference(access: Dict[str, Any] = DB_CONFIG) -> ReferenceData:
+    """Shared reference data snapshot of a database."""
+    return _cache_for(access).get()
+
+
+def refresh(access: Dict[str, Any] = DB_CONFIG) -> None:
+    """Drop the shared snapshot of a database, called once a sync commits."""
+    _cache_for(access).refresh()
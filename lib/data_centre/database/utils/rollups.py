@@ -0,0 +1,333 @@
+"""Price Rollup Module
+
+This module maintains weekly and monthly OHLCV bars per exchange in
+{exchange}_prices_weekly and {exchange}_prices_monthly, keyed by
+(Ticker_ID, Period_Start), so long-horizon queries read one row per ticker
+and period instead of every daily row of every year table.
+
+A bar holds the first Open, highest High, lowest Low, last Close and
+Adjusted_Close and the summed Volume of its trading days, with the last
+trading day as Period_End and the number of days. Weeks start on Monday and
+months on their first day. Bars are computed on the server with one
+INSERT ... SELECT over the year tables a date range touches, first and last
+values through window functions, and upserted. Ranges are always widened to
+whole periods, so a bar is rebuilt from all of its days and a week that
+spans two year tables is read from both.
+
+rollups_update.py keeps the bars current by re-aggregating only the periods
+the change log reports as written (see change_log.py). check_parity()
+compares stored bars against an independent pandas aggregation of the daily
+rows.
+"""
+
+# Standard library imports
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, price_layout
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+WEEKLY = 'weekly'
+MONTHLY = 'monthly'
+GRANULARITIES = (WEEKLY, MONTHLY)
+
+# First day of the period of a date
+PERIOD_START_SQL = {
+    WEEKLY: "DATE_SUB(d.Date, INTERVAL WEEKDAY(d.Date) DAY)",
+    MONTHLY: "DATE_SUB(d.Date, INTERVAL DAYOFMONTH(d.Date) - 1 DAY)",
+}
+
+ROLLUP_COLUMNS = [
+    'Ticker_ID', 'Period_Start', 'Period_End', 'Open', 'High', 'Low',
+    'Close', 'Adjusted_Close', 'Volume', 'Days'
+]
+VALUE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adjusted_Close']
+
+# Relative tolerance of the parity check, the stored bars are DECIMAL(20,6)
+PARITY_TOLERANCE = 1e-9
+# Bounded IN lists keep each statement small on full exchanges
+TICKER_CHUNK = 1000
+
+CREATE_ROLLUP_QUERY = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        Ticker_ID VARCHAR(255),
+        Period_Start DATE,
+        Period_End DATE,
+        Open DECIMAL(20,6),
+        High DECIMAL(20,6),
+        Low DECIMAL(20,6),
+        Close DECIMAL(20,6),
+        Adjusted_Close DECIMAL(20,6),
+        Volume BIGINT,
+        Days SMALLINT,
+        PRIMARY KEY (Ticker_ID, Period_Start),
+        INDEX idx_{table}_period (Period_Start)
+    );
+"""
+
+DAILY_ROWS_QUERY = """
+    SELECT Ticker_ID, Date, Open, High, Low, Close, Adjusted_Close, Volume
+    FROM {source}
+    WHERE Date BETWEEN %s AND %s{ticker_filter}
+"""
+
+# Every row of a period carries the period's first Open and last closes, so
+# the outer GROUP BY can take them with MAX
+AGGREGATE_QUERY = """
+    INSERT INTO {table} ({columns})
+    SELECT Ticker_ID, Period_Start, MAX(Date), MAX(First_Open), MAX(High), MIN(Low),
+           MAX(Last_Close), MAX(Last_Adjusted_Close), SUM(Volume), COUNT(*)
+    FROM (
+        SELECT d.Ticker_ID, d.Date, d.High, d.Low, d.Volume,
+               {period} AS Period_Start,
+               FIRST_VALUE(d.Open) OVER (
+                   PARTITION BY d.Ticker_ID, {period} ORDER BY d.Date
+               ) AS First_Open,
+               LAST_VALUE(d.Close) OVER (
+                   PARTITION BY d.Ticker_ID, {period} ORDER BY d.Date
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+               ) AS Last_Close,
+               LAST_VALUE(d.Adjusted_Close) OVER (
+                   PARTITION BY d.Ticker_ID, {period} ORDER BY d.Date
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+               ) AS Last_Adjusted_Close
+        FROM ({daily}) d
+    ) w
+    GROUP BY Ticker_ID, Period_Start
+    ON DUPLICATE KEY UPDATE
+        Period_End = VALUES(Period_End),
+        Open = VALUES(Open),
+        High = VALUES(High),
+        Low = VALUES(Low),
+        Close = VALUES(Close),
+        Adjusted_Close = VALUES(Adjusted_Close),
+        Volume = VALUES(Volume),
+        Days = VALUES(Days);
+"""
+
+# (database, table) pairs already checked in this process
+_ensured = set()
+
+
+def rollup_table(exchange: str, granularity: str) -> str:
+    """Name of the rollup table of an exchange and granularity."""
+    return f"{exchange}_prices_{granularity}"
+
+
+def ensure_rollup_table(access: Dict[str, Any], exchange: str, granularity: str) -> str:
+    """Create the rollup table of an exchange and granularity if it doesn't exist.
+
+    Returns:
+        Name of the rollup table
+    """
+    table = rollup_table(exchange, granularity)
+    marker = (access.get('database'), table)
+    if marker not in _ensured:
+        database_utils.execute_query(access, CREATE_ROLLUP_QUERY.format(table=table))
+        _ensured.add(marker)
+    return table
+
+
+def period_bounds(granularity: str, date_from: date, date_to: date) -> tuple:
+    """Widen a date range to the first and last day of the periods it touches."""
+    date_from, date_to = pd.Timestamp(date_from).date(), pd.Timestamp(date_to).date()
+    if granularity == WEEKLY:
+        return (date_from - timedelta(days=date_from.weekday()),
+                date_to + timedelta(days=6 - date_to.weekday()))
+    return date_from.replace(day=1), (pd.Timestamp(date_to) + pd.offsets.MonthEnd(0)).date()
+
+
+def _daily_source(access: Dict[str, Any], exchange: str, date_from: date, date_to: date,
+                  ticker_ids: Optional[List[str]]) -> tuple:
+    """UNION ALL of the daily rows in a range over the year tables it touches.
+
+    Returns:
+        (SELECT statement, parameters), or (None, None) if no year table overlaps
+    """
+    ticker_filter = ""
+    if ticker_ids is not None:
+        ticker_filter = f" AND Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))})"
+    selects, params = [], []
+    for table, compact in price_layout.year_tables(access, exchange):
+        if not date_from.year <= int(table.rsplit('_', 1)[1]) <= date_to.year:
+            continue
+        selects.append(DAILY_ROWS_QUERY.format(
+            source=price_layout.price_source(table, compact), ticker_filter=ticker_filter
+        ))
+        params += [date_from, date_to, *(ticker_ids or [])]
+    if not selects:
+        return None, None
+    return " UNION ALL ".join(selects), tuple(params)
+
+
+def aggregate_range(access: Dict[str, Any], exchange: str, granularity: str,
+                    date_from: date, date_to: date,
+                    ticker_ids: Optional[Iterable[str]] = None,
+                    table: Optional[str] = None) -> int:
+    """Rebuild the bars of every period a date range touches.
+
+    Args:
+        access: Database connection configuration dictionary
+        exchange: Exchange code
+        granularity: WEEKLY or MONTHLY
+        date_from: First changed date
+        date_to: Last changed date
+        ticker_ids: Tickers to rebuild, None for every ticker
+        table: Table to write to, defaults to the rollup table of the exchange
+
+    Returns:
+        Number of affected rows
+    """
+    table = table or ensure_rollup_table(access, exchange, granularity)
+    start, end = period_bounds(granularity, date_from, date_to)
+    ticker_ids = list(dict.fromkeys(ticker_ids)) if ticker_ids is not None else None
+    chunks = ([ticker_ids[i:i + TICKER_CHUNK] for i in range(0, len(ticker_ids), TICKER_CHUNK)]
+              if ticker_ids is not None else [None])
+
+    affected = 0
+    for chunk in chunks:
+        daily, params = _daily_source(access, exchange, start, end, chunk)
+        if daily is None:
+            break
+        query = AGGREGATE_QUERY.format(
+            table=table, columns=', '.join(ROLLUP_COLUMNS),
+            period=PERIOD_START_SQL[granularity], daily=daily
+        )
+        affected += database_utils.execute_query(access, query, params)
+    return affected
+
+
+def rebuild_rollups(access: Dict[str, Any], exchange: str) -> Dict[str, int]:
+    """Rebuild both rollup tables of an exchange from all of its year tables.
+
+    Each table is loaded next to the live one, one year at a time, and
+    swapped in with a single RENAME TABLE.
+
+    Returns:
+        Number of bars per granularity
+    """
+    years = [int(table.rsplit('_', 1)[1]) for table, _ in price_layout.year_tables(access, exchange)]
+    counts = {}
+    for granularity in GRANULARITIES:
+        table = ensure_rollup_table(access, exchange, granularity)
+        staging, old = f"{table}_rebuild", f"{table}_old"
+        database_utils.execute_query(access, f"DROP TABLE IF EXISTS {staging}, {old};")
+        database_utils.execute_query(access, CREATE_ROLLUP_QUERY.format(table=staging))
+        for year in years:
+            aggregate_range(access, exchange, granularity,
+                            date(year, 1, 1), date(year, 12, 31), table=staging)
+        counts[granularity] = database_utils.retrieve_table(access, f"SELECT COUNT(*) FROM {staging};")[0][0]
+        with database_utils.db_connection(access) as cursor:
+            cursor.execute(f"RENAME TABLE {table} TO {old}, {staging} TO {table};")
+            cursor.execute(f"DROP TABLE IF EXISTS {old};")
+    logger.info(f"Rebuilt rollups of {exchange}: {counts}")
+    return counts
+
+
+def aggregate_frame(prices: pd.DataFrame, granularity: str) -> pd.DataFrame:
+    """Aggregate daily price rows into bars with pandas.
+
+    Args:
+        prices: Frame with Ticker_ID, Date and the OHLCV columns
+        granularity: WEEKLY or MONTHLY
+
+    Returns:
+        Frame of ROLLUP_COLUMNS, one row per ticker and period
+    """
+    frame = prices.copy()
+    frame['Date'] = pd.to_datetime(frame['Date'])
+    for column in VALUE_COLUMNS + ['Volume']:
+        frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float64')
+    if granularity == WEEKLY:
+        frame['Period_Start'] = frame['Date'] - pd.to_timedelta(frame['Date'].dt.weekday, unit='D')
+    else:
+        frame['Period_Start'] = frame['Date'].dt.to_period('M').dt.start_time
+    frame = frame.sort_values(['Ticker_ID', 'Date'], kind='stable')
+
+    keys = ['Ticker_ID', 'Period_Start']
+    grouped = frame.groupby(keys, sort=True)
+    bars = grouped.agg(
+        Period_End=('Date', 'max'), High=('High', 'max'), Low=('Low', 'min'), Days=('Date', 'size')
+    )
+    bars['Volume'] = grouped['Volume'].sum(min_count=1)
+    # First and last rows keep NULLs the way FIRST_VALUE and LAST_VALUE do
+    first = frame.drop_duplicates(keys, keep='first').set_index(keys)
+    last = frame.drop_duplicates(keys, keep='last').set_index(keys)
+    bars['Open'] = first['Open']
+    bars['Close'] = last['Close']
+    bars['Adjusted_Close'] = last['Adjusted_Close']
+    return bars.reset_index()[ROLLUP_COLUMNS]
+
+
+def read_rollups(access: Dict[str, Any], exchange: str, granularity: str,
+                 date_from: date, date_to: date,
+                 ticker_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    """Stored bars of the periods starting in a date range."""
+    table = ensure_rollup_table(access, exchange, granularity)
+    query = (f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM {table} "
+             f"WHERE Period_Start BETWEEN %s AND %s")
+    params = [date_from, date_to]
+    if ticker_ids is not None:
+        query += f" AND Ticker_ID IN ({', '.join(['%s'] * len(ticker_ids))})"
+        params += list(ticker_ids)
+    return pd.DataFrame(database_utils.retrieve_table(access, query, tuple(params)),
+                        columns=ROLLUP_COLUMNS)
+
+
+def check_parity(access: Dict[str, Any], exchange: str, granularity: str,
+                 date_from: date, date_to: date,
+                 ticker_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    """Compare stored bars with an on-the-fly aggregation of the daily rows.
+
+    Args:
+        access: Database connection configuration dictionary
+        exchange: Exchange code
+        granularity: WEEKLY or MONTHLY
+        date_from: First date to check, widened to its period
+        date_to: Last date to check, widened to its period
+        ticker_ids: Tickers to check, None for every ticker
+
+    Returns:
+        One row per mismatching bar with the stored and expected values side
+        by side, empty when the rollup matches the daily rows
+    """
+    start, end = period_bounds(granularity, date_from, date_to)
+    daily, params = _daily_source(access, exchange, start, end, ticker_ids)
+    if daily is None:
+        return pd.DataFrame()
+    prices = pd.DataFrame(database_utils.retrieve_table(access, daily, params),
+                          columns=['Ticker_ID', 'Date'] + VALUE_COLUMNS + ['Volume'])
+    expected = aggregate_frame(prices, granularity) if not prices.empty \
+        else pd.DataFrame(columns=ROLLUP_COLUMNS)
+    stored = read_rollups(access, exchange, granularity, start, end, ticker_ids)
+
+    for frame in (expected, stored):
+        frame['Period_Start'] = pd.to_datetime(frame['Period_Start'])
+        frame['Period_End'] = pd.to_datetime(frame['Period_End'])
+        for column in VALUE_COLUMNS + ['Volume', 'Days']:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float64')
+
+    merged = stored.merge(expected, on=['Ticker_ID', 'Period_Start'], how='outer',
+                          suffixes=('_Stored', '_Expected'), indicator=True)
+    mismatch = (merged['_merge'] != 'both').to_numpy()
+    for column in ['Period_End', 'Days', 'Volume'] + VALUE_COLUMNS:
+        stored_values, expected_values = merged[f"{column}_Stored"], merged[f"{column}_Expected"]
+        if column == 'Period_End':
+            equal = stored_values == expected_values
+        else:
+            a, b = stored_values.to_numpy(), expected_values.to_numpy()
+            equal = np.isclose(a, b, rtol=PARITY_TOLERANCE, atol=1e-6) | (np.isnan(a) & np.isnan(b))
+        mismatch |= ~np.asarray(equal)
+
+    mismatches = merged.loc[mismatch].drop(columns='_merge')
+    if not mismatches.empty:
+        logger.warning(f"{len(mismatches)} {granularity} bars of {exchange} differ from the daily rows")
+    return mismatches.reset_index(drop=True)
@@ -0,0 +1,184 @@
+"""DataFrame Schema Module
+
+This module defines the compact dtypes used for every price and ticker
+DataFrame in the pipeline. Identifier columns such as Ticker, Exchange and
+Source repeat the same few strings on every row, so they are stored as
+categoricals, and numeric columns use fixed-width dtypes. It also provides
+vectorised helpers for the mappings that were previously done row by row.
+"""
+
+# Standard library imports
+import logging
+import sys
+from typing import Any, Dict, Iterable, Optional
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+CATEGORY = 'category'
+
+PRICE_DTYPES = {
+    'Ticker_ID': CATEGORY,
+    'Ticker': CATEGORY,
+    'Exchange': CATEGORY,
+    'EoDHD_Exchange': CATEGORY,
+    'Source': CATEGORY,
+    'Open': 'float64',
+    'High': 'float64',
+    'Low': 'float64',
+    'Close': 'float64',
+    'Adjusted_Close': 'float64',
+    'Volume': 'int64',
+}
+
+TICKER_DTYPES = {
+    'Ticker_ID': CATEGORY,
+    'Ticker': CATEGORY,
+    'Country': CATEGORY,
+    'Exchange': CATEGORY,
+    'EoDHD_Exchange': CATEGORY,
+    'Currency': CATEGORY,
+    'Type': CATEGORY,
+    'Source': CATEGORY,
+}
+
+EXCHANGE_DTYPES = {
+    'Country': CATEGORY,
+    'Currency': CATEGORY,
+    'CountryISO2': CATEGORY,
+    'CountryISO3': CATEGORY,
+    'Source': CATEGORY,
+}
+
+
+def to_compact(df: pd.DataFrame, dtypes: Dict[str, str]) -> pd.DataFrame:
+    """Convert the columns of a DataFrame to their compact dtypes.
+
+    Columns missing from the frame are ignored. Integer columns that contain
+    missing values are kept as float64 rather than failing the conversion.
+
+    Args:
+        df: DataFrame to convert
+        dtypes: Mapping of column name to target dtype
+
+    Returns:
+        DataFrame with converted columns
+    """
+    conversions = {}
+    for column, dtype in dtypes.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype.startswith('int') or dtype.startswith('float'):
+            values = pd.to_numeric(df[column], errors='coerce')
+            if dtype.startswith('int') and values.isna().any():
+                dtype = 'float64'
+            conversions[column] = values.astype(dtype)
+        else:
+            conversions[column] = df[column].astype(dtype)
+
+    if not conversions:
+        return df
+    return df.assign(**conversions)
+
+
+def map_eodhd_exchange(exchanges: pd.Series, us_exchanges: Iterable[str]) -> pd.Series:
+    """Map exchange codes to the code EODHD uses for them.
+
+    All US venues are served by EODHD under the single 'US' code, every other
+    exchange keeps its own code.
+
+    Args:
+        exchanges: Series of exchange codes
+        us_exchanges: Exchange codes that EODHD groups under 'US'
+
+    Returns:
+        Categorical series of EODHD exchange codes
+    """
+    is_us = exchanges.isin(list(us_exchanges)).to_numpy()
+    mapped = np.where(is_us, 'US', exchanges.astype(object).to_numpy())
+    return pd.Series(mapped, index=exchanges.index, dtype=CATEGORY)
+
+
+def make_ticker_id(tickers: pd.Series, exchange: str) -> pd.Series:
+    """Build Ticker_ID values ('{ticker}_{exchange}') for a series of tickers.
+
+    For categorical input only the categories are renamed, so the cost does
+    not depend on the number of rows.
+
+    Args:
+        tickers: Series of ticker codes
+        exchange: Exchange code appended to each ticker
+
+    Returns:
+        Series of Ticker_ID values
+    """
+    if isinstance(tickers.dtype, pd.CategoricalDtype):
+        return tickers.cat.rename_categories(lambda ticker: f'{ticker}_{exchange}')
+    return tickers.astype(str) + f'_{exchange}'
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame,
+                  label: Optional[str] = None) -> Dict[str, Any]:
+    """Compare the memory footprint of a frame before and after conversion.
+
+    Args:
+        before: Frame with the original dtypes
+        after: Frame with compact dtypes
+        label: Optional name used in the log message
+
+    Returns:
+        Dictionary with per-column and total byte counts
+    """
+    before_usage = before.memory_usage(deep=True)
+    after_usage = after.memory_usage(deep=True)
+    report = {
+        'rows': len(after),
+        'before_bytes': int(before_usage.sum()),
+        'after_bytes': int(after_usage.sum()),
+        'columns': {
+            column: (int(before_usage.get(column, 0)), int(after_usage.get(column, 0)))
+            for column in after.columns
+        },
+    }
+    ratio = report['before_bytes'] / report['after_bytes'] if report['after_bytes'] else 0.0
+    report['ratio'] = ratio
+
+    logger.debug(
+        f"Memory footprint{f' for {label}' if label else ''}: "
+        f"{report['before_bytes'] / 1e6:.2f} MB -> {report['after_bytes'] / 1e6:.2f} MB "
+        f"({ratio:.1f}x) over {report['rows']} rows"
+    )
+    return report
+
+
+def compact_boundary(df: pd.DataFrame, dtypes: Dict[str, str], label: str) -> pd.DataFrame:
+    """Convert a frame at the API boundary, reporting memory when debugging."""
+    compact = to_compact(df, dtypes)
+    if logger.isEnabledFor(logging.DEBUG):
+        memory_report(df, compact, label)
+    return compact
+
+
+if __name__ == "__main__":
+    # Report the footprint of one bulk day, e.g. `python -m ...schema US`
+    from config.connections.eodhd_access import EODHD_CONFIG
+    from lib.data_centre.database.utils.eodhd_utils import retrieve_daily_price
+
+    eod_exchange = sys.argv[1] if len(sys.argv) > 1 else 'US'
+    compact = retrieve_daily_price(eod_exchange, eod_exchange, EODHD_CONFIG['api_key'])
+    if compact is not None:
+        original = compact.astype({column: object for column in compact.columns
+                                   if isinstance(compact[column].dtype, pd.CategoricalDtype)})
+        report = memory_report(original, compact, eod_exchange)
+        print(f"{eod_exchange}: {report['rows']} rows, "
+              f"{report['before_bytes'] / 1e6:.2f} MB -> {report['after_bytes'] / 1e6:.2f} MB "
+              f"({report['ratio']:.1f}x)")
+        for column, (before_bytes, after_bytes) in report['columns'].items():
+            print(f"  {column:<16}{before_bytes:>14,}{after_bytes:>14,}")
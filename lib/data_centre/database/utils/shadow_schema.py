@@ -0,0 +1,186 @@
+"""Shadow Schema Module
+
+A full rebuild loads into a shadow schema, {database}_shadow, on the same
+server while readers keep using the live tables. Once the shadow is loaded
+and checked, its tables are moved into the live schema with one RENAME
+TABLE. MariaDB applies a multi-table RENAME atomically, so readers see either
+the old or the new generation and never an empty or partial database. The
+live tables that are replaced move to {database}_retired in the same
+statement and are dropped afterwards in batches.
+
+Only the rebuilt tables are swapped in: REBUILT_TABLES and the price and
+close price tables. Side tables the load creates in the shadow along the
+way, e.g. prices_quarantine through validation, are dropped with it, so
+their live history, like job_runs, cache_invalidations or the analytics
+tables, stays where it is. Price and close price tables of an exchange the
+shadow holds are retired even without a shadow counterpart so years that are
+no longer loaded do not linger. Legacy close price views are renamed aside in
+the same RENAME and dropped afterwards.
+
+The database user needs CREATE and DROP on the shadow and retired schemas,
+and the server needs room for a second copy of the rebuilt tables.
+"""
+
+# Standard library imports
+import re
+from typing import Any, Dict, List, Optional
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+SHADOW_SUFFIX = '_shadow'
+RETIRED_SUFFIX = '_retired'
+
+# Tables that must hold rows before a shadow is swapped in
+REQUIRED_TABLES = ['global_exchanges', 'global_tickers']
+# Tables swapped in besides the price and close price tables
+REBUILT_TABLES = REQUIRED_TABLES
+
+PRICE_TABLE_PATTERN = re.compile(r'^prices_(.+)_[0-9]{4}$')
+CLOSE_PRICE_TABLE_PATTERN = re.compile(r'^(.+)_close_price$')
+
+SCHEMA_CHARSET_QUERY = """
+    SELECT DEFAULT_CHARACTER_SET_NAME, DEFAULT_COLLATION_NAME
+    FROM INFORMATION_SCHEMA.SCHEMATA
+    WHERE SCHEMA_NAME = %s;
+"""
+
+SCHEMA_OBJECTS_QUERY = """
+    SELECT TABLE_NAME
+    FROM INFORMATION_SCHEMA.TABLES
+    WHERE TABLE_SCHEMA = %s AND TABLE_TYPE = %s
+    ORDER BY TABLE_NAME;
+"""
+
+
+def shadow_access(access: Dict[str, Any]) -> Dict[str, Any]:
+    """Connection configuration of the shadow schema of a database."""
+    return {**access, 'database': access['database'] + SHADOW_SUFFIX}
+
+
+def _objects(access: Dict[str, Any], schema: str, table_type: str = 'BASE TABLE') -> List[str]:
+    rows = database_utils.retrieve_table(access, SCHEMA_OBJECTS_QUERY, (schema, table_type))
+    return [row[0] for row in rows]
+
+
+def _rebuilt_exchange(table: str) -> Optional[str]:
+    """Exchange of a price or close price table, None for any other table."""
+    match = PRICE_TABLE_PATTERN.match(table) or CLOSE_PRICE_TABLE_PATTERN.match(table)
+    return match.group(1) if match else None
+
+
+def _is_rebuilt(table: str) -> bool:
+    return table in REBUILT_TABLES or _rebuilt_exchange(table) is not None
+
+
+def drop_schema(access: Dict[str, Any], schema: str) -> int:
+    """Drop a schema, its tables and views in batches first.
+
+    Returns:
+        Number of tables dropped
+    """
+    tables = _objects(access, schema)
+    database_utils.drop_objects(access, _objects(access, schema, 'VIEW'), kind='VIEW', schema=schema)
+    database_utils.drop_objects(access, tables, schema=schema)
+    database_utils.execute_query(access, f"DROP DATABASE IF EXISTS `{schema}`;")
+    logger.info(f"Dropped schema {schema} with {len(tables)} tables")
+    return len(tables)
+
+
+def _create_schema(access: Dict[str, Any], schema: str) -> None:
+    """Create an empty schema with the character set of the live one."""
+    drop_schema(access, schema)
+    charset, collation = database_utils.retrieve_table(
+        access, SCHEMA_CHARSET_QUERY, (access['database'],)
+    )[0]
+    database_utils.execute_query(
+        access, f"CREATE DATABASE `{schema}` CHARACTER SET {charset} COLLATE {collation};"
+    )
+
+
+def create_shadow(access: Dict[str, Any]) -> Dict[str, Any]:
+    """Create an empty shadow schema, replacing one left by an earlier run.
+
+    Returns:
+        Connection configuration of the shadow schema
+    """
+    shadow = shadow_access(access)
+    _create_schema(access, shadow['database'])
+    logger.info(f"Created shadow schema {shadow['database']}")
+    return shadow
+
+
+def verify_shadow(shadow: Dict[str, Any]) -> Dict[str, int]:
+    """Check that the shadow holds the reference tables and at least one price table.
+
+    Returns:
+        Row counts of the required tables
+
+    Raises:
+        RuntimeError: If the shadow is not complete enough to replace the live data
+    """
+    tables = set(_objects(shadow, shadow['database']))
+    counts = {}
+    for table in REQUIRED_TABLES:
+        if table not in tables:
+            raise RuntimeError(f"Shadow schema {shadow['database']} has no {table} table")
+        counts[table] = database_utils.retrieve_table(shadow, f"SELECT COUNT(*) FROM {table};")[0][0]
+        if not counts[table]:
+            raise RuntimeError(f"Shadow table {table} is empty")
+    if not any(PRICE_TABLE_PATTERN.match(table) for table in tables):
+        raise RuntimeError(f"Shadow schema {shadow['database']} has no price tables")
+    return counts
+
+
+def swap_in(access: Dict[str, Any], shadow: Dict[str, Any]) -> Dict[str, int]:
+    """Move the shadow tables into the live schema with one atomic RENAME TABLE.
+
+    Only rebuilt tables are moved, the rest stay in the shadow schema. The
+    live tables they replace, and price and close price tables of the
+    rebuilt exchanges that the shadow has no counterpart for, move to the
+    retired schema in the same statement.
+
+    Returns:
+        Counts of tables swapped in and retired
+    """
+    live, shadow_schema = access['database'], shadow['database']
+    retired = live + RETIRED_SUFFIX
+    new_tables = [table for table in _objects(access, shadow_schema) if _is_rebuilt(table)]
+    if not new_tables:
+        raise RuntimeError(f"Shadow schema {shadow_schema} has no rebuilt tables")
+
+    live_tables = set(_objects(access, live))
+    new_set = set(new_tables)
+    exchanges = {_rebuilt_exchange(table) for table in new_tables} - {None}
+    stale = sorted(table for table in live_tables - new_set if _rebuilt_exchange(table) in exchanges)
+    replaced = sorted(live_tables & new_set) + stale
+
+    # Views cannot move between schemas, legacy close price views are renamed
+    # aside within the live schema in the same statement
+    legacy_views = sorted(set(_objects(access, live, 'VIEW')) & new_set)
+    aside = [f"{view}{RETIRED_SUFFIX}" for view in legacy_views]
+
+    _create_schema(access, retired)
+    renames = [f"`{live}`.`{view}` TO `{live}`.`{name}`" for view, name in zip(legacy_views, aside)]
+    renames += [f"`{live}`.`{table}` TO `{retired}`.`{table}`" for table in replaced]
+    renames += [f"`{shadow_schema}`.`{table}` TO `{live}`.`{table}`" for table in new_tables]
+    database_utils.execute_query(access, f"RENAME TABLE {', '.join(renames)};")
+    if aside:
+        database_utils.drop_objects(access, aside, kind='VIEW')
+        logger.info(f"Dropped {len(aside)} legacy views replaced by shadow tables")
+
+    logger.info(f"Swapped {len(new_tables)} tables into {live}, retired {len(replaced)}")
+    return {'swapped': len(new_tables), 'retired': len(replaced)}
+
+
+def drop_retired(access: Dict[str, Any]) -> int:
+    """Drop the generation retired by the last swap.
+
+    Returns:
+        Number of tables dropped
+    """
+    return drop_schema(access, access['database'] + RETIRED_SUFFIX)
@@ -0,0 +1,242 @@
+"""Ticker Universe Module
+
+This module assigns every active ticker a tier from the rules in
+config/settings/universe.py and stores it in ticker_tiers. Liquidity is the
+average daily volume of the stored prices over LIQUIDITY_WINDOW_DAYS, read
+with one grouped query per recent year table. Tiers are recomputed at the end
+of every ticker sync.
+
+Fetch paths read the universe in tier order and ask an ApiBudget whether a
+tier may still be fetched, so the names that matter get their data first and
+the long tail is deferred when the daily EODHD call limit runs low.
+"""
+
+# Standard library imports
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+# Third-party imports
+import numpy as np
+import pandas as pd
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils, eodhd_utils, price_layout
+from config.settings.universe import (
+    TIER_RULES, DEFAULT_TIER, MAX_TIER, LIQUIDITY_WINDOW_DAYS, BUDGET_RESERVE
+)
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('database', module_name=__name__)
+
+# Constants
+# Locally counted calls after which the usage is read again from EODHD,
+# so calls made by other processes are taken into account
+BUDGET_REFRESH_CALLS = 500
+
+CREATE_TIERS_QUERY = """
+    CREATE TABLE IF NOT EXISTS ticker_tiers (
+        Ticker_ID VARCHAR(255),
+        Exchange VARCHAR(255),
+        Tier TINYINT NOT NULL,
+        Avg_Volume BIGINT,
+        Date_Updated DATETIME,
+        PRIMARY KEY (Ticker_ID),
+        INDEX idx_ticker_tiers_tier (Tier, Exchange)
+    );
+"""
+
+ACTIVE_TICKERS_QUERY = """
+    SELECT Ticker_ID, Exchange, Type
+    FROM global_tickers
+    WHERE Is_Active = 1;
+"""
+
+AVERAGE_VOLUME_QUERY = """
+    SELECT Ticker_ID, SUM(Volume), COUNT(*)
+    FROM {source}
+    WHERE Date >= %s AND Volume IS NOT NULL
+    GROUP BY Ticker_ID;
+"""
+
+INSERT_TIER_QUERY = """
+    INSERT INTO ticker_tiers (Ticker_ID, Exchange, Tier, Avg_Volume, Date_Updated)
+    VALUES (%s, %s, %s, %s, NOW());
+"""
+
+# Tickers added since the tiers were last assigned have no row and go last
+UNIVERSE_QUERY = """
+    SELECT t.Ticker, t.Exchange, t.EoDHD_Exchange, COALESCE(u.Tier, %s) AS Tier
+    FROM global_tickers t
+    LEFT JOIN ticker_tiers u ON u.Ticker_ID = t.Ticker_ID
+    WHERE t.Is_Active = 1 AND COALESCE(u.Tier, %s) <= %s
+    ORDER BY Tier, t.Exchange, t.Ticker;
+"""
+
+EXCHANGE_TIERS_QUERY = """
+    SELECT t.EoDHD_Exchange, MIN(u.Tier)
+    FROM global_tickers t
+    JOIN ticker_tiers u ON u.Ticker_ID = t.Ticker_ID
+    WHERE t.Is_Active = 1
+    GROUP BY t.EoDHD_Exchange;
+"""
+
+
+def ensure_tier_table(access: Dict[str, Any]) -> None:
+    """Create the ticker_tiers table if it does not exist."""
+    database_utils.execute_query(access, CREATE_TIERS_QUERY)
+
+
+def _average_volumes(access: Dict[str, Any], exchanges, since: datetime) -> pd.Series:
+    """Average daily volume per Ticker_ID since a date, from the recent year tables."""
+    frames = []
+    for exchange in exchanges:
+        for table, compact in price_layout.year_tables(access, exchange):
+            if int(table.rsplit('_', 1)[1]) < since.year:
+                continue
+            rows = database_utils.retrieve_table(
+                access,
+                AVERAGE_VOLUME_QUERY.format(source=price_layout.price_source(table, compact)),
+                (since.date(),)
+            )
+            if rows:
+                frames.append(pd.DataFrame(rows, columns=['Ticker_ID', 'Volume', 'Days']))
+    if not frames:
+        return pd.Series(dtype='float64')
+    # The window can span two year tables, so days and volume are summed first
+    totals = pd.concat(frames).astype({'Volume': 'float64', 'Days': 'int64'}).groupby('Ticker_ID').sum()
+    return totals['Volume'] / totals['Days']
+
+
+def compute_tiers(tickers: pd.DataFrame, volumes: pd.Series) -> pd.Series:
+    """Tier of each ticker under TIER_RULES.
+
+    Args:
+        tickers: Frame with Ticker_ID, Exchange and Type
+        volumes: Average daily volume by Ticker_ID, tickers missing from it
+            are matched on type and exchange alone
+
+    Returns:
+        Tier per row of tickers
+    """
+    volume = tickers['Ticker_ID'].map(volumes).to_numpy(dtype='float64')
+    types = tickers['Type'].astype(object).fillna('')
+    exchanges = tickers['Exchange'].astype(object)
+
+    conditions = []
+    for rule in TIER_RULES:
+        match = np.ones(len(tickers), dtype=bool)
+        if 'types' in rule:
+            match &= types.isin(rule['types']).to_numpy()
+        if 'exclude_types' in rule:
+            match &= ~types.isin(rule['exclude_types']).to_numpy()
+        if 'exchanges' in rule:
+            match &= exchanges.isin(rule['exchanges']).to_numpy()
+        if 'exclude_exchanges' in rule:
+            match &= ~exchanges.isin(rule['exclude_exchanges']).to_numpy()
+        if 'min_volume' in rule:
+            match &= np.isnan(volume) | (volume >= rule['min_volume'])
+        conditions.append(match)
+
+    # np.select takes the first matching rule
+    tiers = np.select(conditions, [rule['tier'] for rule in TIER_RULES], default=DEFAULT_TIER)
+    return pd.Series(tiers, index=tickers.index, name='Tier')
+
+
+def assign_tiers(access: Dict[str, Any]) -> Dict[int, int]:
+    """Recompute the tier of every active ticker and replace ticker_tiers.
+
+    Returns:
+        Number of tickers per tier
+    """
+    ensure_tier_table(access)
+    tickers = pd.DataFrame(
+        database_utils.retrieve_table(access, ACTIVE_TICKERS_QUERY),
+        columns=['Ticker_ID', 'Exchange', 'Type']
+    )
+    if tickers.empty:
+        return {}
+
+    since = datetime.now() - timedelta(days=LIQUIDITY_WINDOW_DAYS)
+    volumes = _average_volumes(access, tickers['Exchange'].unique(), since)
+    tickers['Tier'] = compute_tiers(tickers, volumes)
+    tickers['Avg_Volume'] = tickers['Ticker_ID'].map(volumes).round()
+
+    # Replaced in one transaction, readers see the old or the new tiers
+    with database_utils.db_connection(access) as cursor:
+        cursor.execute("DELETE FROM ticker_tiers;")
+        cursor.executemany(
+            INSERT_TIER_QUERY,
+            database_utils.dataframe_to_rows(tickers[['Ticker_ID', 'Exchange', 'Tier', 'Avg_Volume']])
+        )
+
+    counts = tickers['Tier'].value_counts().sort_index()
+    logger.info(f"Assigned tiers to {len(tickers)} tickers: {counts.to_dict()}")
+    return {int(tier): int(count) for tier, count in counts.items()}
+
+
+def ticker_universe(access: Dict[str, Any], max_tier: int = MAX_TIER) -> pd.DataFrame:
+    """Active tickers up to a tier, in fetch order.
+
+    Returns:
+        Frame with Ticker, Exchange, EoDHD_Exchange and Tier, tier 1 first
+    """
+    ensure_tier_table(access)
+    rows = database_utils.retrieve_table(access, UNIVERSE_QUERY, (MAX_TIER, MAX_TIER, max_tier))
+    return pd.DataFrame(rows, columns=['Ticker', 'Exchange', 'EoDHD_Exchange', 'Tier'])
+
+
+def exchange_tiers(access: Dict[str, Any]) -> Dict[str, int]:
+    """Best tier listed by each EODHD exchange code."""
+    ensure_tier_table(access)
+    return {eod_exchange: int(tier)
+            for eod_exchange, tier in database_utils.retrieve_table(access, EXCHANGE_TIERS_QUERY)}
+
+
+class ApiBudget:
+    """EODHD API calls left today, counted down locally between reads.
+
+    If the usage cannot be read every tier is allowed, so a failing usage
+    endpoint never stops the fetches.
+
+    Args:
+        api_key: EODHD API key
+        reserves: Keep the tier reserves of BUDGET_RESERVE, off for runs that
+            must load every tier, which may then use up the whole budget
+    """
+
+    def __init__(self, api_key: str, reserves: bool = True):
+        self.api_key = api_key
+        self.reserves = reserves
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self._since_refresh = 0
+        self.refresh()
+
+    def refresh(self) -> None:
+        usage = eodhd_utils.retrieve_api_usage(self.api_key)
+        if usage is not None:
+            self.limit = usage['limit']
+            self.remaining = usage['limit'] - usage['requests']
+        self._since_refresh = 0
+
+    def spend(self, calls: int = 1) -> None:
+        """Count calls made by this process."""
+        if self.remaining is not None:
+            self.remaining -= calls
+        self._since_refresh += calls
+        if self._since_refresh >= BUDGET_REFRESH_CALLS:
+            self.refresh()
+
+    def allows(self, tier: int, calls: int = 1) -> bool:
+        """Whether calls for a ticker of a tier leave the tier's reserve intact."""
+        if self.limit is None:
+            return True
+        reserve = 0
+        if self.reserves:
+            reserve = BUDGET_RESERVE.get(tier, max(BUDGET_RESERVE.values())) * self.limit
+        return self.remaining - calls >= reserve
+
+    def max_tier(self, calls: int = 1) -> int:
+        """Highest tier that may still be fetched, 0 if none."""
+        allowed = [tier for tier in range(1, MAX_TIER + 1) if self.allows(tier, calls)]
+        return max(allowed, default=0)
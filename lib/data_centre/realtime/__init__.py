@@ -0,0 +1,27 @@
+"""
+Real-time ingestion package for Project Seldon's data center.
+
+This package streams intraday market data into the database:
+- Pluggable tick sources (file replay, TCP socket)
+- In-memory 1-minute bar aggregation
+- Micro-batched writes to the intraday tables
+"""
+
+from .sources import (
+    Tick,
+    TickSource,
+    SOURCES,
+    make_source,
+)
+
+from .ingestor import (
+    IntradayIngestor,
+)
+
+__all__ = [
+    'Tick',
+    'TickSource',
+    'SOURCES',
+    'make_source',
+    'IntradayIngestor',
+]
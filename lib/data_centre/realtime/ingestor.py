@@ -0,0 +1,263 @@
+"""Intraday Ingestion Module
+
+Consumes a tick source, aggregates it into 1-minute bars and writes the bars
+to intraday_{exchange}_{year} tables in micro-batches. A reader thread pulls
+ticks from the source into a bounded queue; the main loop folds them into
+the BarAggregator and flushes every changed bar with one executemany upsert
+per table whenever MAX_BATCH_BARS bars are pending or MAX_LATENCY seconds
+have passed since the last flush, whichever comes first. No tick ever causes
+a database write of its own.
+
+Usage:
+    python -m lib.data_centre.realtime.ingestor replay --path ticks.ndjson
+    python -m lib.data_centre.realtime.ingestor socket --host localhost --port 9000
+"""
+
+# Standard library imports
+import argparse
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Local application imports
+from lib.data_centre.database.utils import database_utils
+from lib.data_centre.realtime.bars import Bar, BarAggregator
+from lib.data_centre.realtime.sources import TickSource, make_source
+from config.connections.database_access import DB_CONFIG
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('realtime', module_name=__name__)
+
+# Constants
+MAX_BATCH_BARS = 5000
+MAX_LATENCY = 1.0
+QUEUE_SIZE = 200000
+LATENESS = 5.0
+STATS_INTERVAL = 60.0
+
+CREATE_INTRADAY_QUERY = """
+    CREATE TABLE IF NOT EXISTS intraday_{exchange}_{year} (
+        Ticker_ID VARCHAR(255),
+        Bar_Time DATETIME,
+        Open DECIMAL(20,6),
+        High DECIMAL(20,6),
+        Low DECIMAL(20,6),
+        Close DECIMAL(20,6),
+        Volume BIGINT,
+        Ticks INT,
+        PRIMARY KEY (Ticker_ID, Bar_Time),
+        INDEX idx_intraday_{exchange}_{year}_time (Bar_Time)
+    );
+"""
+
+# Bars are written with their full state so far, a rewrite replaces it
+UPSERT_BARS_QUERY = """
+    INSERT INTO intraday_{exchange}_{year} (
+        Ticker_ID, Bar_Time, Open, High, Low, Close, Volume, Ticks
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        Open = VALUES(Open),
+        High = VALUES(High),
+        Low = VALUES(Low),
+        Close = VALUES(Close),
+        Volume = VALUES(Volume),
+        Ticks = VALUES(Ticks);
+"""
+
+_END = object()
+
+
+class IntradayIngestor:
+    """Micro-batched minute bar ingestion from a tick source.
+
+    Args:
+        source: Tick source to consume
+        access: Database connection configuration dictionary
+        max_batch: Pending bar count that triggers a flush
+        max_latency: Seconds after which pending bars are flushed regardless
+        lateness: Seconds a tick may arrive after its minute ended
+    """
+
+    def __init__(self, source: TickSource, access: Dict[str, Any] = DB_CONFIG,
+                 max_batch: int = MAX_BATCH_BARS, max_latency: float = MAX_LATENCY,
+                 lateness: float = LATENESS):
+        self.source = source
+        self.access = access
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.aggregator = BarAggregator(lateness)
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stopping = threading.Event()
+        self._tables: Set[Tuple[str, int]] = set()
+        self.stats = {'flushes': 0, 'bars_written': 0, 'max_flush_seconds': 0.0,
+                      'max_bar_delay_seconds': 0.0}
+
+    def _read(self) -> None:
+        """Reader thread, blocks on the queue when the writer falls behind."""
+        try:
+            for tick in self.source:
+                if self._stopping.is_set():
+                    break
+                self._queue.put(tick)
+        except Exception as e:
+            logger.error(f"Tick source failed: {e}", exc_info=True)
+        finally:
+            self._queue.put(_END)
+
+    def _ensure_table(self, exchange: str, year: int) -> None:
+        if (exchange, year) not in self._tables:
+            database_utils.execute_query(
+                self.access, CREATE_INTRADAY_QUERY.format(exchange=exchange, year=year)
+            )
+            self._tables.add((exchange, year))
+
+    def flush(self) -> int:
+        """Write every changed bar, one executemany per intraday table.
+
+        When a write fails the bars of that and every later table are handed
+        back to the aggregator, so the next flush retries them, and the error
+        is re-raised.
+        """
+        bars = self.aggregator.drain()
+        if not bars:
+            return 0
+        started = time.monotonic()
+
+        batches: Dict[Tuple[str, int], List[Bar]] = defaultdict(list)
+        for bar in bars:
+            year = datetime.fromtimestamp(bar.minute, tz=timezone.utc).year
+            batches[(bar.exchange, year)].append(bar)
+
+        written: Set[Tuple[str, int]] = set()
+        try:
+            for (exchange, year), batch in batches.items():
+                rows = [(
+                    bar.ticker_id,
+                    datetime.fromtimestamp(bar.minute, tz=timezone.utc).replace(tzinfo=None),
+                    bar.open, bar.high, bar.low, bar.close, int(bar.volume), bar.ticks
+                ) for bar in batch]
+                self._ensure_table(exchange, year)
+                with database_utils.db_connection(self.access) as cursor:
+                    cursor.executemany(UPSERT_BARS_QUERY.format(exchange=exchange, year=year), rows)
+                written.add((exchange, year))
+        except Exception:
+            self.aggregator.restore([bar for key, batch in batches.items() if key not in written
+                                     for bar in batch])
+            raise
+
+        elapsed = time.monotonic() - started
+        self.stats['flushes'] += 1
+        self.stats['bars_written'] += len(bars)
+        self.stats['max_flush_seconds'] = max(self.stats['max_flush_seconds'], elapsed)
+        return len(bars)
+
+    def run(self, duration: Optional[float] = None) -> Dict[str, Any]:
+        """Consume the source until it ends, stop() is called or duration elapses.
+
+        Returns:
+            Ingestion statistics
+        """
+        reader = threading.Thread(target=self._read, name='tick-reader', daemon=True)
+        reader.start()
+        started = last_flush = last_tick = last_stats = time.monotonic()
+        oldest_pending: Optional[float] = None
+
+        while True:
+            now = time.monotonic()
+            if duration is not None and now - started >= duration:
+                self.stop()
+            timeout = max(0.0, self.max_latency - (now - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _END:
+                break
+            now = time.monotonic()
+            if item is not None:
+                self.aggregator.add(item)
+                last_tick = now
+                if oldest_pending is None:
+                    oldest_pending = now
+                # Drain what is already queued before checking the thresholds
+                drained = 0
+                while self.aggregator.pending < self.max_batch:
+                    drained += 1
+                    if not drained % 1024 and time.monotonic() - last_flush >= self.max_latency:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        self._queue.put(_END)
+                        break
+                    self.aggregator.add(item)
+            elif now - last_tick > self.max_latency:
+                self.aggregator.advance(now - last_tick)
+
+            if self.aggregator.pending >= self.max_batch or now - last_flush >= self.max_latency:
+                if oldest_pending is not None:
+                    self.stats['max_bar_delay_seconds'] = max(
+                        self.stats['max_bar_delay_seconds'], time.monotonic() - oldest_pending
+                    )
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Failed to flush intraday bars: {e}", exc_info=True)
+                last_flush, oldest_pending = time.monotonic(), None
+
+            if now - last_stats >= STATS_INTERVAL:
+                logger.info(f"Intraday ingestion: {self.summary()}")
+                last_stats = now
+
+        self.flush()
+        summary = self.summary()
+        logger.info(f"Intraday ingestion finished: {summary}")
+        return summary
+
+    def stop(self) -> None:
+        """Stop reading, the bars in memory are flushed before run() returns."""
+        self._stopping.set()
+        self.source.close()
+
+    def summary(self) -> Dict[str, Any]:
+        return {**self.aggregator.stats, **self.stats, 'open_bars': len(self.aggregator),
+                'queued_ticks': self._queue.qsize(), 'malformed': self.source.malformed}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Ingest intraday ticks into minute bars.')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH_BARS)
+    parser.add_argument('--max-latency', type=float, default=MAX_LATENCY)
+    parser.add_argument('--lateness', type=float, default=LATENESS)
+    parser.add_argument('--duration', type=float, default=None)
+    subparsers = parser.add_subparsers(dest='source', required=True)
+
+    replay = subparsers.add_parser('replay', help='Replay ticks from a file')
+    replay.add_argument('--path', required=True)
+    replay.add_argument('--speed', type=float, default=0.0)
+
+    sock = subparsers.add_parser('socket', help='Read ticks from a TCP feed')
+    sock.add_argument('--host', default='localhost')
+    sock.add_argument('--port', type=int, required=True)
+
+    args = parser.parse_args(argv)
+    if args.source == 'replay':
+        source = make_source('replay', path=args.path, speed=args.speed)
+    else:
+        source = make_source('socket', host=args.host, port=args.port)
+
+    ingestor = IntradayIngestor(source, DB_CONFIG, args.max_batch, args.max_latency, args.lateness)
+    try:
+        ingestor.run(args.duration)
+    except KeyboardInterrupt:
+        ingestor.stop()
+        ingestor.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Tick Sources Module
+
+A tick source yields Tick objects from some feed. Sources are looked up by
+name in SOURCES so the ingestor can be pointed at a different feed without
+code changes. Two sources ship with the project, both reading one tick per
+line as JSON ({"ticker", "exchange", "timestamp", "price", "size"}) or CSV
+in that column order:
+
+    replay  A local file, played back as fast as possible or at a multiple
+            of the recorded speed
+    socket  A TCP connection, e.g. `nc -l 9000 < ticks.ndjson` for testing
+"""
+
+# Standard library imports
+import json
+import socket
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+# Local application imports
+from config.settings.logging import logger_factory
+
+logger = logger_factory.get_logger('realtime', module_name=__name__)
+
+
+@dataclass(frozen=True)
+class Tick:
+    """One trade or quote update. Timestamp is in epoch seconds (UTC)."""
+    ticker: str
+    exchange: str
+    timestamp: float
+    price: float
+    size: float = 0.0
+
+    @property
+    def ticker_id(self) -> str:
+        return f"{self.ticker}_{self.exchange}"
+
+
+def _parse_timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        # Millisecond epochs are common in vendor feeds
+        return value / 1000.0 if value > 1e11 else float(value)
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+def parse_tick(line: str) -> Optional[Tick]:
+    """Parse one JSON or CSV line into a Tick, None for blank or malformed lines."""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    try:
+        if line.startswith('{'):
+            data = json.loads(line)
+            return Tick(str(data['ticker']), str(data['exchange']),
+                        _parse_timestamp(data['timestamp']), float(data['price']),
+                        float(data.get('size') or 0))
+        ticker, exchange, timestamp, price, *size = line.split(',')
+        try:
+            timestamp = float(timestamp)
+        except ValueError:
+            pass
+        return Tick(ticker, exchange, _parse_timestamp(timestamp), float(price),
+                    float(size[0]) if size and size[0] else 0.0)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class TickSource:
+    """Base class of tick sources, iterate to receive ticks."""
+
+    malformed = 0
+
+    def __iter__(self) -> Iterator[Tick]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release the underlying feed, the iterator stops afterwards."""
+
+    def _parse(self, line: str) -> Optional[Tick]:
+        tick = parse_tick(line)
+        if tick is None and line.strip() and not line.startswith('#'):
+            self.malformed += 1
+        return tick
+
+
+class ReplayFileSource(TickSource):
+    """Replays ticks recorded in a file.
+
+    Args:
+        path: File with one tick per line
+        speed: 0 replays as fast as possible, otherwise the playback speed
+            relative to the recorded timestamps (1 is real time)
+    """
+
+    def __init__(self, path: str, speed: float = 0.0):
+        self.path = Path(path)
+        self.speed = speed
+        self._closed = False
+
+    def __iter__(self) -> Iterator[Tick]:
+        started = first = None
+        with open(self.path) as handle:
+            for line in handle:
+                if self._closed:
+                    return
+                tick = self._parse(line)
+                if tick is None:
+                    continue
+                if self.speed:
+                    if first is None:
+                        started, first = time.monotonic(), tick.timestamp
+                    delay = (tick.timestamp - first) / self.speed - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                yield tick
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class SocketSource(TickSource):
+    """Reads newline separated ticks from a TCP server.
+
+    Args:
+        host: Server host
+        port: Server port
+        reconnect_delay: Seconds to wait before reconnecting, None stops at disconnect
+    """
+
+    def __init__(self, host: str, port: int, reconnect_delay: Optional[float] = 5.0):
+        self.host = host
+        self.port = int(port)
+        self.reconnect_delay = reconnect_delay
+        self._closed = False
+        self._socket: Optional[socket.socket] = None
+
+    def __iter__(self) -> Iterator[Tick]:
+        while not self._closed:
+            try:
+                self._socket = socket.create_connection((self.host, self.port))
+                logger.info(f"Connected to tick feed {self.host}:{self.port}")
+                with self._socket.makefile('r', encoding='utf-8', newline='\n') as stream:
+                    for line in stream:
+                        tick = self._parse(line)
+                        if tick is not None:
+                            yield tick
+                logger.warning(f"Tick feed {self.host}:{self.port} closed the connection")
+            except OSError as e:
+                if self._closed:
+                    return
+                logger.error(f"Tick feed {self.host}:{self.port} failed: {e}")
+            finally:
+                # Every connection is closed before the next one is opened
+                if self._socket is not None:
+                    self._socket.close()
+                    self._socket = None
+            if self._closed or self.reconnect_delay is None:
+                return
+            time.sleep(self.reconnect_delay)
+
+    def close(self) -> None:
+        self._closed = True
+        connection = self._socket
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+# Registered sources, extend to plug in a vendor feed
+SOURCES: Dict[str, Callable[..., TickSource]] = {
+    'replay': ReplayFileSource,
+    'socket': SocketSource,
+}
+
+
+def make_source(name: str, **options) -> TickSource:
+    """Create a registered tick source by name."""
+    if name not in SOURCES:
+        raise ValueError(f"Unknown tick source {name}, available: {sorted(SOURCES)}")
+    return SOURCES[name](**options)
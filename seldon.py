@@ -0,0 +1,147 @@
+"""
+Project Seldon command line
+
+Runs a single job without starting the scheduler, e.g. from cron or as a
+one-shot container command. Job modules are imported inside their
+subcommand, so each run only loads what that job needs and `--help` loads
+none of them.
+
+Pass --profile before the subcommand to write a CPU and memory profile of
+the run to logs/profiles (see lib/data_centre/database/utils/profiling.py).
+
+Usage:
+    python seldon.py [--profile] daily [--graph]
+    python seldon.py tickers
+    python seldon.py exchanges
+    python seldon.py backfill {plan,work,progress} [...]
+    python seldon.py gaps {scan,repair} [...]
+    python seldon.py rollups {update,rebuild,check} [...]
+    python seldon.py views [--rebuild]
+    python seldon.py rebuild --yes [--in-place]
+"""
+# Standard library imports
+import argparse
+import sys
+from typing import List, Optional
+
+
+def _daily(args: argparse.Namespace) -> int:
+    if args.graph:
+        from lib.data_centre.database.database_manager import build_daily_graph
+        from lib.data_centre.database.job_graph import STATUS_SUCCESS
+        results = build_daily_graph().run()
+        return 0 if all(result.status == STATUS_SUCCESS for result in results.values()) else 1
+    from lib.data_centre.database.scripts import daily_price_update
+    daily_price_update()
+    return 0
+
+
+def _tickers(args: argparse.Namespace) -> int:
+    from lib.data_centre.database.scripts import tickers_update
+    tickers_update()
+    return 0
+
+
+def _exchanges(args: argparse.Namespace) -> int:
+    from lib.data_centre.database.scripts import exchanges_update
+    from config.connections.database_access import DB_CONFIG
+    exchanges_update(DB_CONFIG)
+    return 0
+
+
+def _backfill(args: argparse.Namespace) -> int:
+    from lib.data_centre.database.scripts.sharded_backfill import main as backfill
+    backfill(args.passthrough_args)
+    return 0
+
+
+def _gaps(args: argparse.Namespace) -> int:
+    from lib.data_centre.database.scripts.price_gaps import main as gaps
+    gaps(args.passthrough_args)
+    return 0
+
+
+def _rollups(args: argparse.Namespace) -> int:
+    from lib.data_centre.database.scripts.rollups_update import main as rollups
+    rollups(args.passthrough_args)
+    return 0
+
+
+def _views(args: argparse.Namespace) -> int:
+    from config.connections.database_access import DB_CONFIG
+    if args.rebuild:
+        from lib.data_centre.database.scripts import rebuild_close_price_tables
+        rebuild_close_price_tables(DB_CONFIG)
+    else:
+        from lib.data_centre.database.scripts import update_all_views
+        update_all_views(DB_CONFIG)
+    return 0
+
+
+def _rebuild(args: argparse.Namespace) -> int:
+    if not args.yes:
+        print("rebuild replaces every rebuilt table and reloads the database, pass --yes to run it",
+              file=sys.stderr)
+        return 2
+    from lib.data_centre.database.initialise_database import main as initialise_database
+    return initialise_database(in_place=args.in_place)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='seldon', description='Run Project Seldon jobs.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write a CPU and memory profile of the run to logs/profiles')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    daily = commands.add_parser('daily', help='Daily price update')
+    daily.add_argument('--graph', action='store_true',
+                       help='Run the whole daily job graph, not only the price update')
+    daily.set_defaults(handler=_daily)
+
+    commands.add_parser('tickers', help='Synchronise tickers with EODHD').set_defaults(handler=_tickers)
+    commands.add_parser('exchanges', help='Synchronise exchanges with EODHD').set_defaults(handler=_exchanges)
+
+    # Everything after these commands is handed to the module's command line as is
+    commands.add_parser('backfill', help='Sharded price history backfill',
+                        add_help=False).set_defaults(handler=_backfill, passthrough=True)
+    commands.add_parser('gaps', help='Scan for and repair missing price days',
+                        add_help=False).set_defaults(handler=_gaps, passthrough=True)
+    commands.add_parser('rollups', help='Update, rebuild or check the weekly and monthly rollups',
+                        add_help=False).set_defaults(handler=_rollups, passthrough=True)
+
+    views = commands.add_parser('views', help='Update the close price tables')
+    views.add_argument('--rebuild', action='store_true',
+                       help='Rebuild them from the year tables instead')
+    views.set_defaults(handler=_views)
+
+    rebuild = commands.add_parser('rebuild', help='Reload the whole database in a shadow schema and swap it in')
+    rebuild.add_argument('--yes', action='store_true', help='Confirm replacing the rebuilt tables')
+    rebuild.add_argument('--in-place', action='store_true',
+                         help='Clear and reload the live tables instead, they are empty until it finishes')
+    rebuild.set_defaults(handler=_rebuild)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if getattr(args, 'passthrough', False):
+        args.passthrough_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    try:
+        if not args.profile:
+            return args.handler(args)
+        from lib.data_centre.database.utils import profiling
+        with profiling.profile_job(args.command, enabled=True):
+            return args.handler(args)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        from config.settings.logging import logger_factory
+        logger = logger_factory.get_logger('global', module_name=__name__)
+        logger.error("seldon %s failed: %s", args.command, e, exc_info=True)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())